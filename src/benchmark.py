@@ -0,0 +1,359 @@
+"""Замеры производительности сканирования, сравнения и копирования
+
+Запуск из папки src:
+
+    python -m benchmark [--files 5000] [--depth 3] [--fanout 6] [--sizes 512:65536]
+                        [--overlap 0.5] [--seed 1] [--steps scan,match,content,analyze,copy]
+                        [--output baseline.json] [--compare baseline.json]
+
+Во временной папке создаётся синтетическое дерево (source и sorted), затем каждый
+шаг выполняется в отдельном процессе: «холодный» прогон (пустые индекс и кэш
+хешей, файлы вытеснены из страничного кэша через posix_fadvise) и «тёплый»
+(повторный прогон с заполненными индексом и кэшем). Для каждого прогона
+записываются время, файлов/с и байт/с, для шага — пиковый RSS процесса
+(где есть модуль resource, то есть не в Windows).
+Кэш каталогов и inode ядра без прав root не сбрасывается, поэтому холодный
+прогон сканирования всё же быстрее настоящего первого запуска.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+STEPS = ("scan", "match", "content", "analyze", "copy")
+DEFAULT_TOLERANCE = 0.15  # допустимое замедление относительно базового замера
+_BLOCK_SIZE = 1024 * 1024
+
+
+# Генерация дерева
+
+
+def _tree_dirs(root, depth, fanout):
+    """Все папки дерева глубины depth с fanout подпапками на уровень"""
+
+    dirs = [root]
+    level = [root]
+    for d in range(depth):
+        level = [os.path.join(parent, f"d{d}_{i}") for parent in level for i in range(fanout)]
+        dirs.extend(level)
+    return dirs
+
+
+def _write_file(path, size, block, rng):
+    # Уникальный префикс, чтобы сравнение по содержимому не видело лишних совпадений
+    data = rng.getrandbits(64).to_bytes(8, "little")
+    with open(path, "wb") as f:
+        f.write(data[:size])
+        written = len(data[:size])
+        while written < size:
+            start = rng.randrange(len(block))
+            chunk = block[start : start + size - written]
+            f.write(chunk)
+            written += len(chunk)
+
+
+def generate_tree(root, files=5000, depth=3, fanout=6, sizes=(512, 65536), overlap=0.5, seed=1):
+    """Создать root/source и root/sorted; результат воспроизводим при том же seed
+
+    Размеры файлов распределены лог-равномерно в диапазоне sizes. Доля overlap
+    исходных файлов копируется в sorted под тем же именем (в случайную папку),
+    а ещё 10% файлов sorted не имеют пары в source.
+    """
+
+    rng = random.Random(seed)
+    block = random.Random(seed).randbytes(_BLOCK_SIZE)
+    source_dirs = _tree_dirs(os.path.join(root, "source"), depth, fanout)
+    sorted_dirs = _tree_dirs(os.path.join(root, "sorted"), max(1, depth - 1), fanout)
+    for path in source_dirs + sorted_dirs:
+        os.makedirs(path, exist_ok=True)
+
+    low, high = (max(1, s) for s in sizes)
+    total_bytes = 0
+    matched = 0
+    for i in range(files):
+        size = int(round(low * (high / low) ** rng.random())) if high > low else low
+        name = f"file_{i:07d}.bin"
+        path = os.path.join(rng.choice(source_dirs), name)
+        _write_file(path, size, block, rng)
+        total_bytes += size
+        if rng.random() < overlap:
+            shutil.copy2(path, os.path.join(rng.choice(sorted_dirs), name))
+            matched += 1
+    for i in range(files // 10):
+        size = int(round(low * (high / low) ** rng.random())) if high > low else low
+        _write_file(os.path.join(rng.choice(sorted_dirs), f"extra_{i:07d}.bin"), size, block, rng)
+
+    return {"files": files, "bytes": total_bytes, "matched": matched, "dirs": len(source_dirs)}
+
+
+def evict_page_cache(folder):
+    """Вытеснить содержимое файлов из страничного кэша (без прав root)"""
+
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            try:
+                fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+
+# Шаги
+
+
+def _timed(func, files, size):
+    started = time.perf_counter()
+    result = func()
+    seconds = max(time.perf_counter() - started, 1e-9)
+    return result, {
+        "seconds": round(seconds, 4),
+        "files_per_sec": round(files / seconds, 1),
+        "bytes_per_sec": round(size / seconds, 1),
+    }
+
+
+def _peak_rss_kb():
+    """Пиковый RSS процесса в КБ или None, если модуля resource нет (Windows)"""
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux — в килобайтах
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_step(step, root, info, workers=None):
+    """Выполнить шаг в текущем процессе: {"cold": ..., "warm": ..., "peak_rss_kb": ...}"""
+
+    from utils.file_analyzer import get_all_files, find_unsorted_files, analyze_files
+    from utils.scan_index import ScanIndex
+    from utils.content_match import HashCache
+
+    source = os.path.join(root, "source")
+    sorted_folder = os.path.join(root, "sorted")
+    state = tempfile.mkdtemp(prefix="state_", dir=root)
+    files, size = info["files"], info["bytes"]
+    results = {}
+
+    if step == "scan":
+        index = ScanIndex(os.path.join(state, "scan_index.sqlite"))
+        for run in ("cold", "warm"):
+            if run == "cold":
+                evict_page_cache(source)
+            _, results[run] = _timed(
+                lambda: get_all_files(source, workers=workers, index=index), files, size
+            )
+        index.close()
+    elif step == "match":
+        source_files = get_all_files(source, workers=workers)
+        sorted_files = get_all_files(sorted_folder, workers=workers)
+        # Сравнение по имени не читает диск, поэтому оба прогона «тёплые»
+        for run in ("cold", "warm"):
+            _, results[run] = _timed(
+                lambda: find_unsorted_files(source_files, sorted_files, []), files, size
+            )
+    elif step == "content":
+        source_files = get_all_files(source, workers=workers)
+        sorted_files = get_all_files(sorted_folder, workers=workers)
+        cache = HashCache(os.path.join(state, "hash_cache.sqlite"))
+        for run in ("cold", "warm"):
+            if run == "cold":
+                evict_page_cache(root)
+            _, results[run] = _timed(
+                lambda: find_unsorted_files(
+                    source_files, sorted_files, [], match_mode="content", hash_cache=cache
+                ),
+                files,
+                size,
+            )
+        cache.close()
+    elif step == "analyze":
+        for run in ("cold", "warm"):
+            if run == "cold":
+                evict_page_cache(source)
+            _, results[run] = _timed(
+                lambda: analyze_files(source, sorted_folder, []), files, size
+            )
+    elif step == "copy":
+        from utils.file_operations import copy_unsorted_files
+
+        source_files = get_all_files(source, workers=workers)
+        for run in ("cold", "warm"):
+            dest = os.path.join(state, run)
+            if run == "cold":
+                evict_page_cache(source)
+            _, results[run] = _timed(
+                lambda: copy_unsorted_files(source_files, source, dest), files, size
+            )
+            shutil.rmtree(dest, ignore_errors=True)
+    else:
+        raise ValueError(f"Неизвестный шаг: {step}")
+
+    shutil.rmtree(state, ignore_errors=True)
+    results["peak_rss_kb"] = _peak_rss_kb()
+    return results
+
+
+def run_benchmark(params, steps=STEPS, keep=None):
+    """Сгенерировать дерево и выполнить шаги, каждый в новом процессе"""
+
+    root = keep or tempfile.mkdtemp(prefix="zhao_bench_")
+    try:
+        if not os.path.isdir(os.path.join(root, "source")):
+            sys.stderr.write(f"Генерация дерева в {root}...\n")
+            info = generate_tree(root, **params)
+        else:
+            info = _existing_tree_info(root)
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": params,
+            "tree": info,
+            "results": {},
+        }
+        context = multiprocessing.get_context("spawn")
+        for step in steps:
+            sys.stderr.write(f"Шаг {step}...\n")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                report["results"][step] = pool.submit(run_step, step, root, info).result()
+        return report
+    finally:
+        if keep is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _existing_tree_info(root):
+    files = size = dirs = 0
+    for dirpath, _, filenames in os.walk(os.path.join(root, "source")):
+        dirs += 1
+        files += len(filenames)
+        size += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+    return {"files": files, "bytes": size, "matched": None, "dirs": dirs}
+
+
+# Сравнение с базовым замером
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Строки сравнения и список замедлившихся прогонов (по files_per_sec)"""
+
+    lines = []
+    regressions = []
+    for step, runs in report["results"].items():
+        base_runs = baseline.get("results", {}).get(step)
+        if not base_runs:
+            continue
+        for run in ("cold", "warm"):
+            new, old = runs.get(run), base_runs.get(run)
+            if not new or not old or not old["files_per_sec"]:
+                continue
+            ratio = new["files_per_sec"] / old["files_per_sec"]
+            mark = ""
+            if ratio < 1 - tolerance:
+                mark = "  ЗАМЕДЛЕНИЕ"
+                regressions.append(f"{step}/{run}")
+            lines.append(
+                f"{step:8} {run:5} {old['files_per_sec']:>12.1f} -> {new['files_per_sec']:>12.1f} файлов/с"
+                f"  x{ratio:.2f}{mark}"
+            )
+        if base_runs.get("peak_rss_kb") and runs.get("peak_rss_kb"):
+            lines.append(
+                f"{step:8} RSS   {base_runs['peak_rss_kb']:>12} -> {runs['peak_rss_kb']:>12} КБ"
+            )
+    return lines, regressions
+
+
+def summary(report):
+    lines = []
+    for step, runs in report["results"].items():
+        for run in ("cold", "warm"):
+            r = runs[run]
+            lines.append(
+                f"{step:8} {run:5} {r['seconds']:>9.3f} с {r['files_per_sec']:>12.1f} файлов/с"
+                f" {r['bytes_per_sec'] / (1024 * 1024):>9.1f} МБ/с"
+            )
+        if runs.get("peak_rss_kb") is not None:
+            lines.append(f"{step:8} RSS   {runs['peak_rss_kb']:>12} КБ")
+    return lines
+
+
+def _size_range(text):
+    low, _, high = text.partition(":")
+    return int(low), int(high or low)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark", description="Замеры производительности на синтетическом дереве"
+    )
+    parser.add_argument("--files", type=int, default=5000, help="файлов в исходной папке")
+    parser.add_argument("--depth", type=int, default=3, help="глубина дерева папок")
+    parser.add_argument("--fanout", type=int, default=6, help="подпапок на уровень")
+    parser.add_argument("--sizes", type=_size_range, default=(512, 65536), help="МИН:МАКС размер файла в байтах")
+    parser.add_argument("--overlap", type=float, default=0.5, help="доля исходных файлов, уже лежащих в sorted")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--steps", default=",".join(STEPS), help="шаги через запятую")
+    parser.add_argument("--keep", help="папка для дерева; существующее дерево используется повторно")
+    parser.add_argument("--output", help="записать результаты в JSON")
+    parser.add_argument("--compare", help="сравнить с базовым JSON")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="допустимое замедление")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    steps = [s for s in args.steps.split(",") if s]
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        sys.stderr.write(f"Неизвестные шаги: {', '.join(sorted(unknown))}\n")
+        return 2
+    params = {
+        "files": args.files,
+        "depth": args.depth,
+        "fanout": args.fanout,
+        "sizes": list(args.sizes),
+        "overlap": args.overlap,
+        "seed": args.seed,
+    }
+    report = run_benchmark(params, steps, keep=args.keep)
+    print("\n".join(summary(report)))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            sys.stderr.write("Внимание: параметры дерева отличаются от базового замера\n")
+        lines, regressions = compare(report, baseline, args.tolerance)
+        print("\n".join(lines))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
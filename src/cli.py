@@ -0,0 +1,324 @@
+"""Консольный запуск анализатора без графического интерфейса
+
+Запуск из папки src:
+
+    python -m cli [ИСХОДНАЯ] [ОТСОРТИРОВАННАЯ] [--format jsonl|csv] [--match name|content]
+                  [--sources ПАПКА ...] [--from-history] [--sorted-folder ПАПКА] [--parallel N]
+                  [--key name|path|name_size|normalized_name|name_mtime]
+                  [--copy] [--dest ПАПКА] [--mode copy|hardlink|reflink|move|tar|tar.gz|zip]
+                  [--verify hash|fresh] [--rollup СВОДКА.json]
+                  [--metrics ОТЧЁТ.json] [--profile cprofile|tracemalloc]
+
+Папки по умолчанию берутся из ~/.zhao_config.json. Неотсортированные файлы
+выводятся в stdout по мере нахождения, журнал — в stderr. tkinter не импортируется.
+При сравнении по имени с --copy сканирование, сравнение и копирование идут
+конвейером: файл копируется, как только найден, не дожидаясь конца обхода.
+Режимы tar, tar.gz и zip вместо папки пишут один архив (--dest — путь архива).
+--rollup сохраняет число и объём найденных файлов по папкам (с подпапками)
+и по расширениям; сводка копится по ходу сравнения, без второго прохода.
+
+Пакетный режим (--sources и/или --from-history): исходные папки проверяются
+параллельно против одной отсортированной, которая обходится один раз. У каждой
+папки свой игнор-лист, в выводе — поле source, при --copy — своя папка
+результата (--dest в пакете не используется), --rollup пишет сводку по каждой.
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+
+from utils.file_analyzer import get_all_files, find_unsorted_files, stream_unsorted_files
+from utils.ignore_patterns import compile_ignore_list
+from utils.rollups import SizeRollup, write_report
+from utils.match_index import MATCH_KEYS
+from utils import metrics
+from utils.metrics import PROFILE_MODES
+
+
+OUTPUT_FIELDS = ("path", "name", "relative_path", "size", "modified", "extension")
+
+
+def output_record(file_info, source=None):
+    """Запись для вывода; source — исходная папка в пакетном режиме"""
+
+    record = {"source": source} if source is not None else {}
+    record.update((field, file_info[field]) for field in OUTPUT_FIELDS if field != "modified")
+    record["modified"] = file_info["modified"].isoformat(timespec="seconds")
+    return record
+
+
+class JsonlWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, files, source=None):
+        for file_info in files:
+            self.stream.write(json.dumps(output_record(file_info, source), ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+class CsvWriter:
+    def __init__(self, stream, batch=False):
+        import csv
+
+        self.stream = stream
+        fields = ("source",) + OUTPUT_FIELDS if batch else OUTPUT_FIELDS
+        self.writer = csv.DictWriter(stream, fieldnames=fields)
+        self.writer.writeheader()
+
+    def write(self, files, source=None):
+        self.writer.writerows(output_record(file_info, source) for file_info in files)
+        self.stream.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m cli", description="Поиск неотсортированных файлов без GUI"
+    )
+    parser.add_argument("source", nargs="?", help="исходная папка (по умолчанию из конфигурации)")
+    parser.add_argument("sorted", nargs="?", help="папка отсортированных (по умолчанию из конфигурации)")
+    parser.add_argument(
+        "--sources", nargs="+", metavar="ПАПКА", help="пакетный режим: ещё исходные папки"
+    )
+    parser.add_argument(
+        "--from-history", action="store_true", help="пакетный режим: добавить папки из истории"
+    )
+    parser.add_argument("--sorted-folder", metavar="ПАПКА", help="папка отсортированных (вместо второго аргумента)")
+    parser.add_argument("--parallel", type=int, help="исходных папок одновременно в пакетном режиме")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("--match", choices=("name", "content"), help="способ сравнения")
+    parser.add_argument(
+        "--key",
+        choices=MATCH_KEYS,
+        help="ключ сравнения по имени",
+    )
+    parser.add_argument("--workers", type=int, help="потоков сканирования")
+    parser.add_argument("--no-index", action="store_true", help="не использовать индекс сканирования")
+    parser.add_argument("--copy", action="store_true", help="скопировать найденные файлы")
+    parser.add_argument("--dest", help="папка для копирования (по умолчанию новая папка с датой)")
+    parser.add_argument(
+        "--mode",
+        choices=("copy", "hardlink", "reflink", "move", "tar", "tar.gz", "zip"),
+        help="режим переноса или формат архива",
+    )
+    parser.add_argument(
+        "--verify", choices=("hash", "fresh"), help="проверять копии по хэшу, считанному при копировании"
+    )
+    parser.add_argument(
+        "--rollup", metavar="ФАЙЛ", help="записать JSON-сводку по папкам и расширениям найденных файлов"
+    )
+    parser.add_argument("--metrics", metavar="ФАЙЛ", help="записать JSON-отчёт о фазах, счётчиках и скорости")
+    parser.add_argument(
+        "--profile", choices=PROFILE_MODES, help="профилировать запуск (файл рядом с отчётом --metrics)"
+    )
+    parser.add_argument("--log-files", action="store_true", help="писать журнал в файлы в текущей папке")
+    parser.add_argument("-v", "--verbose", action="store_true", help="подробный журнал в stderr")
+    return parser.parse_args(argv)
+
+
+def run(args, config, out):
+    if args.sources or args.from_history:
+        return run_batch(args, config, out)
+
+    source_folder = args.source or config.get("source_folder")
+    sorted_folder = args.sorted_folder or args.sorted or config.get("sorted_folder")
+    for folder in (source_folder, sorted_folder):
+        if not folder or not os.path.isdir(folder):
+            logging.getLogger(__name__).error("Папка не существует：%s", folder)
+            return 2
+
+    from config import load_ignore_list
+
+    workers = args.workers or config.get("scan_workers")
+    match_mode = args.match or config.get("match_mode", "name")
+    index = _open_index(args, config)
+
+    ignore = compile_ignore_list(load_ignore_list(source_folder))
+    writer = CsvWriter(out) if args.format == "csv" else JsonlWriter(out)
+    rollup = SizeRollup() if args.rollup else None
+
+    hash_cache = _open_hash_cache(args, match_mode, (source_folder, sorted_folder))
+
+    if match_mode == "content":
+        sorted_files = get_all_files(sorted_folder, workers=workers, index=index)
+        source_files = get_all_files(source_folder, workers=workers, index=index, ignore=ignore)
+        unsorted = find_unsorted_files(
+            source_files,
+            sorted_files,
+            ignore,
+            match_mode="content",
+            hash_cache=hash_cache,
+            rollup=rollup,
+        )
+        writer.write(unsorted)
+    else:
+        batches = stream_unsorted_files(
+            source_folder,
+            sorted_folder,
+            ignore,
+            workers=workers,
+            index=index,
+            match_key=args.key or config.get("match_key", "name"),
+            rollup=rollup,
+        )
+        unsorted = _written(batches, writer)
+
+    if not args.copy:
+        for _ in unsorted:
+            pass
+        if rollup is not None:
+            rollup.write_json(args.rollup)
+        return 0
+
+    errors = _copy(unsorted, source_folder, args.dest, args, config, hash_cache)
+    if rollup is not None:
+        rollup.write_json(args.rollup)
+    return 1 if errors else 0
+
+
+def run_batch(args, config, out):
+    """Пакетный режим: исходные папки из аргументов и истории против одной отсортированной"""
+
+    from config import load_ignore_list
+    from utils.batch_analysis import analyze_batch, batch_sources
+
+    log = logging.getLogger(__name__)
+    sorted_folder = args.sorted_folder or args.sorted or config.get("sorted_folder")
+    if not sorted_folder or not os.path.isdir(sorted_folder):
+        log.error("Папка не существует：%s", sorted_folder)
+        return 2
+    folders = ([args.source] if args.source else []) + (args.sources or [])
+    history = config.get("history", []) if args.from_history else ()
+    sorted_key = os.path.normcase(os.path.abspath(sorted_folder))
+    sources = [
+        folder for folder in batch_sources(folders, history)
+        if os.path.normcase(os.path.abspath(folder)) != sorted_key
+    ]
+    if not sources:
+        log.error("Нет исходных папок для пакетного анализа")
+        return 2
+    if args.copy and args.dest:
+        log.error("--dest нельзя использовать в пакетном режиме: у каждой папки своя папка результата")
+        return 2
+
+    match_mode = args.match or config.get("match_mode", "name")
+    hash_cache = _open_hash_cache(args, match_mode, [sorted_folder] + sources)
+    writer = CsvWriter(out, batch=True) if args.format == "csv" else JsonlWriter(out)
+    reports = {}
+    status = 0
+    for result in analyze_batch(
+        sources,
+        sorted_folder,
+        {source: load_ignore_list(source) for source in sources},
+        match_mode=match_mode,
+        match_key=args.key or config.get("match_key", "name"),
+        workers=args.workers or config.get("scan_workers"),
+        index=_open_index(args, config),
+        hash_cache=hash_cache,
+        source_workers=args.parallel or config.get("batch_parallel"),
+    ):
+        source = result["source"]
+        if result["error"] is not None:
+            sys.stderr.write(f"{source}: ошибка: {result['error']}\n")
+            status = 1
+            continue
+        writer.write(result["files"], source=source)
+        reports[source] = result["rollup"].report()
+        if args.copy and result["files"] and _copy(result["files"], source, None, args, config, hash_cache):
+            status = 1
+    if args.rollup:
+        write_report(args.rollup, reports)
+    return status
+
+
+def _open_index(args, config):
+    if args.no_index or not config.get("use_scan_index", True):
+        return None
+    from config import SCAN_INDEX_FILE
+    from utils.scan_index import open_scan_index
+
+    return open_scan_index(SCAN_INDEX_FILE)
+
+
+def _open_hash_cache(args, match_mode, folders):
+    """Кэш хэшей для сравнения по содержимому или проверки копий; манифесты папок переносятся в него"""
+
+    if match_mode != "content" and not args.verify:
+        return None
+    from config import HASH_CACHE_FILE
+    from utils.content_match import open_hash_cache
+
+    hash_cache = open_hash_cache(HASH_CACHE_FILE)
+    if match_mode == "content":
+        from utils.copy_verify import import_manifest
+
+        # Хэши проверенных копий из манифестов не нужно считать заново
+        for folder in folders:
+            import_manifest(folder, hash_cache)
+    return hash_cache
+
+
+def _copy(files, source_folder, dest, args, config, hash_cache):
+    """Скопировать файлы в dest или в новую папку результата рядом с source_folder; число ошибок"""
+
+    from utils.file_operations import ARCHIVE_FORMATS, create_result_folder, copy_file_stream
+    from utils.archive_output import result_archive_path
+
+    mode = args.mode or config.get("transfer_mode", "copy")
+    if mode in ARCHIVE_FORMATS:
+        dest_folder = dest or result_archive_path(source_folder, mode)
+    else:
+        dest_folder = dest or create_result_folder(source_folder)
+    copied, errors = copy_file_stream(
+        files,
+        source_folder,
+        dest_folder,
+        workers=config.get("copy_workers"),
+        mode=mode,
+        verify=args.verify,
+        hash_cache=hash_cache,
+    )
+    sys.stderr.write(f"Скопировано {copied} файлов в {dest_folder}, ошибок: {len(errors)}\n")
+    return len(errors)
+
+
+def _written(batches, writer):
+    """Вывести каждую пачку и отдать её файлы дальше по конвейеру"""
+
+    for batch in batches:
+        writer.write(batch)
+        yield from batch
+
+
+def main(argv=None):
+    # Настройки и обработчики журнала нужны только при запуске, не при импорте модуля
+    from config import load_config
+    from utils.logging_setup import setup_logging
+
+    args = parse_args(argv)
+    setup_logging(
+        level=logging.DEBUG if args.verbose else logging.WARNING, log_files=args.log_files
+    )
+    config = load_config()
+    run_metrics = metrics.start_run("cli")
+    profile_dir = os.path.dirname(os.path.abspath(args.metrics)) if args.metrics else metrics.METRICS_DIR
+    try:
+        with metrics.profile_run(run_metrics, args.profile or config.get("profile_mode"), profile_dir):
+            return run(args, config, sys.stdout)
+    except BrokenPipeError:
+        # Вывод обрезан (например, через head) — это не ошибка
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 0
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        metrics.finish_run(run_metrics)
+        if args.metrics:
+            run_metrics.write_json(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,49 @@
+import os
 import json
+import atexit
+import tempfile
+import threading
 import logging
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 CONFIG_FILE = Path.home() / ".zhao_config.json"
+SCAN_INDEX_FILE = Path.home() / ".zhao_scan_index.sqlite"
+HASH_CACHE_FILE = Path.home() / ".zhao_hash_cache.sqlite"
+IGNORE_LIST_NAME = "ignore_list.txt"
+IGNORE_REMOVED_NAME = "ignore_list.removed.txt"  # удалённые шаблоны, дописываются до уплотнения
+HISTORY_LIMIT = 50  # сколько созданных папок помнить в истории
+CONFIG_SAVE_DELAY = 1.0  # секунды: частые сохранения настроек объединяются в одну запись
+IGNORE_COMPACT_MIN = 1000  # уплотнять игнор-лист, когда удалённых записей больше этого
+IGNORE_COMPACT_RATIO = 0.25  # ... и больше этой доли от живых записей
 
+# Обработчики настраивает точка входа (utils.logging_setup.setup_logging)
 logger = logging.getLogger("config_store")
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+
+_save_lock = threading.Lock()
+_pending_config = None  # (путь, текст) ожидающей записи настроек
+_save_timer = None
+
+def atomic_write_text(path, text: str) -> None:
+    """Записать файл целиком атомарно: временный файл рядом, fsync и os.replace
+
+    При сбое на диске остаётся либо старое, либо новое содержимое, но не обрывок.
+    """
+
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
 
 def load_config() -> Dict[str, Any]:
     if CONFIG_FILE.exists():
@@ -22,44 +54,204 @@ def load_config() -> Dict[str, Any]:
                 return data
         except Exception:
             logger.exception("Не удалось загрузить конфигурацию: %s", str(CONFIG_FILE))
-    return {"source_folder": "", "sorted_folder": "", "history": [], "ignore_list": []}
+    return {
+        "source_folder": "",
+        "sorted_folder": "",
+        "history": [],
+        "ignore_list": [],
+        "scan_workers": None,  # None -> utils.scanner.DEFAULT_SCAN_WORKERS
+        "copy_workers": None,  # None -> utils.file_operations.DEFAULT_COPY_WORKERS
+        "transfer_mode": "copy",  # TRANSFER_MODES или ARCHIVE_FORMATS из utils.file_operations
+        "use_scan_index": True,
+        "match_mode": "name",  # "name" или "content"
+        "match_key": "name",  # при сравнении по имени: один из utils.match_index.MATCH_KEYS
+        "batch_folders": [],  # исходные папки последнего пакетного анализа
+        "batch_parallel": None,  # None -> utils.batch_analysis.DEFAULT_BATCH_SOURCES (папок одновременно)
+        "watch_changes": False,  # следить за папками после анализа (только по имени)
+        "verify_copy": None,  # "hash" или "fresh": проверять копии (utils.copy_verify.VERIFY_MODES)
+        "metrics_report": False,  # писать JSON-отчёт utils.metrics в ~/.zhao_metrics после каждого запуска
+        "profile_mode": None,  # "cprofile" или "tracemalloc": профилировать каждый запуск
+    }
+
+def save_config(config: Dict[str, Any], immediate: bool = False) -> None:
+    """Сохранить настройки; запись на диск откладывается на CONFIG_SAVE_DELAY
 
-def save_config(config: Dict[str, Any]) -> None:
+    Снимок настроек берётся сразу, а несколько сохранений подряд (выбор папок,
+    переключатели) дают одну атомарную запись. immediate=True пишет сразу;
+    отложенная запись в любом случае выполняется при выходе (flush_config).
+    """
+
+    global _pending_config, _save_timer
+    history = config.get("history")
+    if history and len(history) > HISTORY_LIMIT:
+        del history[:-HISTORY_LIMIT]
     try:
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        logger.info("Конфигурация успешно сохранена: %s", str(CONFIG_FILE))
+        text = json.dumps(config, indent=2, ensure_ascii=False)
     except Exception:
         logger.exception("Не удалось сохранить настройки: %s", str(CONFIG_FILE))
+        return
+    with _save_lock:
+        _pending_config = (CONFIG_FILE, text)
+        if _save_timer is not None:
+            _save_timer.cancel()
+            _save_timer = None
+        if not immediate:
+            _save_timer = threading.Timer(CONFIG_SAVE_DELAY, flush_config)
+            _save_timer.daemon = True
+            _save_timer.start()
+    if immediate:
+        flush_config()
+
+def flush_config() -> None:
+    """Записать отложенные настройки, если они есть"""
+
+    global _pending_config
+    with _save_lock:
+        pending, _pending_config = _pending_config, None
+        if pending is None:
+            return
+        path, text = pending
+        try:
+            atomic_write_text(path, text)
+            logger.info("Конфигурация успешно сохранена: %s", str(path))
+        except Exception:
+            logger.exception("Не удалось сохранить настройки: %s", str(path))
+
+atexit.register(flush_config)
+
+def add_history(config: Dict[str, Any], folder: str) -> None:
+    """Добавить папку в историю; хранятся только последние HISTORY_LIMIT записей"""
+
+    history = config.setdefault("history", [])
+    if folder in history:
+        history.remove(folder)
+    history.append(folder)
+    del history[:-HISTORY_LIMIT]
 
 def get_ignore_list_path(source_folder: str) -> Optional[Path]:
+    """Путь к игнор-листу; папка «Игнор-лист» создаётся только при записи"""
+
     if not source_folder:
         return None
-    parent = Path(source_folder).parent
-    ignore_folder = parent / "Игнор-лист"
-    ignore_folder.mkdir(exist_ok=True)
-    path = ignore_folder / "ignore_list.txt"
-    logger.info("Путь к списку исключений: %s", str(path))
-    return path
+    return Path(source_folder).parent / "Игнор-лист" / IGNORE_LIST_NAME
+
+def _removed_path(path: Path) -> Path:
+    return path.with_name(IGNORE_REMOVED_NAME)
+
+def _read_lines(path: Path) -> List[str]:
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def _read_ignore_state(path: Path):
+    """(живые шаблоны без повторов в порядке добавления, множество удалённых)"""
+
+    removed = set(_read_lines(_removed_path(path)))
+    seen = set()
+    items = []
+    for line in _read_lines(path):
+        if line not in seen and line not in removed:
+            seen.add(line)
+            items.append(line)
+    return items, removed
 
 def load_ignore_list(source_folder: str) -> List[str]:
     p = get_ignore_list_path(source_folder)
-    if p and p.exists():
+    if p:
         try:
-            with open(p, "r", encoding="utf-8") as f:
-                items = [line.strip() for line in f if line.strip()]
-                logger.info("Загрузка списка игнорирования: %d запись", len(items))
-                return items
+            items, _ = _read_ignore_state(p)
+            logger.debug("Загрузка списка игнорирования: %d запись", len(items))
+            return items
         except Exception:
             logger.exception("Не удалось загрузить список исключений: %s", str(p))
     return []
 
+def _append_lines(path: Path, lines: List[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        prefix = b""
+        if f.tell():
+            # Старые файлы записаны без завершающего перевода строки
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                prefix = b"\n"
+        f.write(prefix + "".join(line + "\n" for line in lines).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
 def save_ignore_list(source_folder: str, ignore_list: List[str]) -> None:
+    """Переписать игнор-лист целиком (атомарно) и сбросить список удалённых"""
+
     p = get_ignore_list_path(source_folder)
     if p:
         try:
-            with open(p, "w", encoding="utf-8") as f:
-                f.write("\n".join(ignore_list))
+            p.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(p, "".join(item + "\n" for item in ignore_list))
+            removed = _removed_path(p)
+            if removed.exists():
+                removed.unlink()
             logger.info("Сохранение списка игнорирования: %d запись -> %s", len(ignore_list), str(p))
         except Exception:
-            logger.exception("Не удалось сохранить список исключений: %s", str(p))
\ No newline at end of file
+            logger.exception("Не удалось сохранить список исключений: %s", str(p))
+
+def add_to_ignore_list(source_folder: str, patterns: Iterable[str]) -> List[str]:
+    """Дописать шаблоны в конец игнор-листа без перезаписи файла
+
+    Возвращает действительно добавленные шаблоны (без уже имеющихся).
+    """
+
+    p = get_ignore_list_path(source_folder)
+    if not p:
+        return []
+    try:
+        items, removed = _read_ignore_state(p)
+        present = set(items)
+        added = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if pattern and pattern not in present:
+                present.add(pattern)
+                added.append(pattern)
+        if not added:
+            return []
+        if removed & set(added):
+            # Шаблон был удалён раньше: список удалённых его бы скрыл — уплотняем
+            save_ignore_list(source_folder, items + added)
+        else:
+            _append_lines(p, added)
+            logger.info("Добавлено в список игнорирования: %d запись -> %s", len(added), str(p))
+        return added
+    except Exception:
+        logger.exception("Не удалось сохранить список исключений: %s", str(p))
+        return []
+
+def remove_from_ignore_list(source_folder: str, patterns: Iterable[str]) -> List[str]:
+    """Удалить шаблоны: они дописываются в список удалённых рядом с игнор-листом
+
+    Когда удалённых записей становится много (IGNORE_COMPACT_MIN и
+    IGNORE_COMPACT_RATIO), игнор-лист переписывается атомарно без них.
+    Возвращает действительно удалённые шаблоны.
+    """
+
+    p = get_ignore_list_path(source_folder)
+    if not p:
+        return []
+    try:
+        items, removed = _read_ignore_state(p)
+        present = set(items)
+        dropped = [pattern for pattern in dict.fromkeys(patterns) if pattern in present]
+        if not dropped:
+            return []
+        removed_count = len(removed) + len(dropped)
+        live = len(items) - len(dropped)
+        if removed_count > IGNORE_COMPACT_MIN and removed_count > live * IGNORE_COMPACT_RATIO:
+            gone = set(dropped)
+            save_ignore_list(source_folder, [item for item in items if item not in gone])
+        else:
+            _append_lines(_removed_path(p), dropped)
+            logger.info("Удалено из списка игнорирования: %d запись -> %s", len(dropped), str(p))
+        return dropped
+    except Exception:
+        logger.exception("Не удалось сохранить список исключений: %s", str(p))
+        return []
@@ -1,8 +1,10 @@
 import tkinter as tk
+from utils.logging_setup import setup_logging
 from ui.main_window import MainWindow
 
 
 def main():
+    setup_logging()
     root = tk.Tk()
     MainWindow(root)
     root.mainloop()
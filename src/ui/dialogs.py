@@ -1,7 +1,8 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
-from config import load_ignore_list, save_ignore_list
+from config import load_ignore_list, add_to_ignore_list, remove_from_ignore_list
+from utils.ignore_patterns import validate_pattern
 
 
 def show_info_dialog(message):
@@ -38,6 +39,7 @@ class IgnoreListDialog:
     def __init__(self, parent, source_folder):
         self.source_folder = source_folder
         self.ignore_list = load_ignore_list(source_folder)
+        self.editing_index = None  # индекс редактируемой записи или None для новой
 
         self.dialog = tk.Toplevel(parent)
         self.dialog.title("Игнор-лист")
@@ -55,7 +57,7 @@ class IgnoreListDialog:
         screen_height = self.dialog.winfo_screenheight()
 
         window_width = 500
-        window_height = 400
+        window_height = 450
 
         x = (screen_width - window_width) // 2
         y = (screen_height - window_height) // 2
@@ -66,15 +68,32 @@ class IgnoreListDialog:
         frame = ttk.Frame(self.dialog, padding=10)
         frame.pack(fill=tk.BOTH, expand=True)
 
-        ttk.Label(frame, text="Файлы в игнор-листе:").pack(anchor=tk.W, pady=5)
+        ttk.Label(frame, text="Файлы и шаблоны в игнор-листе:").pack(anchor=tk.W, pady=5)
 
         self.listbox = tk.Listbox(frame, selectmode=tk.EXTENDED)
         scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.listbox.yview)
         self.listbox.configure(yscrollcommand=scrollbar.set)
+        self.listbox.bind("<Double-Button-1>", self.edit_selected)
 
         self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+        # Строка редактирования шаблона
+        pattern_frame = ttk.Frame(self.dialog, padding=(10, 0))
+        pattern_frame.pack(fill=tk.X)
+
+        self.pattern_entry = ttk.Entry(pattern_frame)
+        self.pattern_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.pattern_entry.bind("<Return>", lambda e: self.save_pattern())
+        ttk.Button(pattern_frame, text="Сохранить", command=self.save_pattern).pack(
+            side=tk.LEFT, padx=5
+        )
+        ttk.Label(
+            self.dialog,
+            text="Имя файла, *.tmp, папка/, docs/*.bak или re:регулярное выражение",
+            padding=(10, 2),
+        ).pack(anchor=tk.W)
+
         button_frame = ttk.Frame(self.dialog, padding=10)
         button_frame.pack(fill=tk.X)
 
@@ -90,14 +109,139 @@ class IgnoreListDialog:
         for item in self.ignore_list:
             self.listbox.insert(tk.END, item)
 
+    def edit_selected(self, event=None):
+        """Двойной щелчок переносит запись в строку редактирования"""
+
+        selected = self.listbox.curselection()
+        if not selected:
+            return
+        self.editing_index = selected[0]
+        self.pattern_entry.delete(0, tk.END)
+        self.pattern_entry.insert(0, self.ignore_list[self.editing_index])
+
+    def save_pattern(self):
+        pattern = self.pattern_entry.get().strip()
+        if not pattern:
+            return
+        error = validate_pattern(pattern)
+        if error:
+            messagebox.showerror("Ошибка", f"Некорректный шаблон:\n{error}", parent=self.dialog)
+            return
+
+        # Изменения дописываются в файл, а не переписывают его целиком
+        if self.editing_index is not None:
+            old = self.ignore_list[self.editing_index]
+            self.editing_index = None
+            if old == pattern:
+                return
+            removed = set(remove_from_ignore_list(self.source_folder, [old]))
+            self.ignore_list = [item for item in self.ignore_list if item not in removed]
+        self.ignore_list.extend(add_to_ignore_list(self.source_folder, [pattern]))
+        self.pattern_entry.delete(0, tk.END)
+        self.load_items()
+
     def remove_selected(self):
         selected = self.listbox.curselection()
         if not selected:
             return
 
-        for index in reversed(selected):
-            del self.ignore_list[index]
+        removed = set(
+            remove_from_ignore_list(self.source_folder, [self.ignore_list[i] for i in selected])
+        )
+        self.ignore_list = [item for item in self.ignore_list if item not in removed]
+        self.editing_index = None
 
-        save_ignore_list(self.source_folder, self.ignore_list)
         self.load_items()
         messagebox.showinfo("Успех", "Файлы удалены из игнор-листа")
+
+
+class BatchDialog:
+    """Выбор исходных папок для пакетного анализа против одной отсортированной"""
+
+    def __init__(self, parent, sources, history=()):
+        self.sources = list(sources)
+        self.history = list(history)
+        self.result = None  # список папок после «Запустить», иначе None
+
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Пакетный анализ")
+        self.dialog.transient(parent)
+        self.center_window()
+
+        self.create_widgets()
+        self.load_items()
+
+    def center_window(self):
+        """Центрировать окно на экране"""
+
+        self.dialog.update_idletasks()
+
+        screen_width = self.dialog.winfo_screenwidth()
+        screen_height = self.dialog.winfo_screenheight()
+
+        window_width = 600
+        window_height = 400
+
+        x = (screen_width - window_width) // 2
+        y = (screen_height - window_height) // 2
+
+        self.dialog.geometry(f"{window_width}x{window_height}+{x}+{y}")
+
+    def create_widgets(self):
+        frame = ttk.Frame(self.dialog, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(
+            frame, text="Исходные папки (у каждой свой игнор-лист и своя папка результата):"
+        ).pack(anchor=tk.W, pady=5)
+
+        self.listbox = tk.Listbox(frame, selectmode=tk.EXTENDED)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.listbox.yview)
+        self.listbox.configure(yscrollcommand=scrollbar.set)
+
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        button_frame = ttk.Frame(self.dialog, padding=10)
+        button_frame.pack(fill=tk.X)
+
+        ttk.Button(button_frame, text="Добавить папку", command=self.add_folder).pack(
+            side=tk.LEFT, padx=5
+        )
+        ttk.Button(button_frame, text="Из истории", command=self.add_history).pack(
+            side=tk.LEFT, padx=5
+        )
+        ttk.Button(
+            button_frame, text="Удалить выбранные", command=self.remove_selected
+        ).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Отмена", command=self.dialog.destroy).pack(
+            side=tk.RIGHT, padx=5
+        )
+        ttk.Button(button_frame, text="Запустить", command=self.run).pack(side=tk.RIGHT, padx=5)
+
+    def load_items(self):
+        self.listbox.delete(0, tk.END)
+        for item in self.sources:
+            self.listbox.insert(tk.END, item)
+
+    def add_folder(self):
+        folder = filedialog.askdirectory(title="Выберите исходную папку", parent=self.dialog)
+        if folder and folder not in self.sources:
+            self.sources.append(folder)
+            self.load_items()
+
+    def add_history(self):
+        self.sources.extend(folder for folder in self.history if folder not in self.sources)
+        self.load_items()
+
+    def remove_selected(self):
+        selected = set(self.listbox.curselection())
+        self.sources = [item for i, item in enumerate(self.sources) if i not in selected]
+        self.load_items()
+
+    def run(self):
+        if not self.sources:
+            messagebox.showwarning("Предупреждение", "Добавьте исходные папки", parent=self.dialog)
+            return
+        self.result = list(self.sources)
+        self.dialog.destroy()
@@ -1,9 +1,106 @@
+import os
+import time
+import queue
+import logging
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from config import load_config, save_config, load_ignore_list, save_ignore_list
+from config import (
+    HASH_CACHE_FILE,
+    SCAN_INDEX_FILE,
+    load_config,
+    save_config,
+    add_history,
+    load_ignore_list,
+    add_to_ignore_list,
+)
 from utils.file_analyzer import get_all_files, find_unsorted_files, format_file_size
-from utils.file_operations import create_result_folder, copy_unsorted_files
-from ui.dialogs import IgnoreListDialog
+from utils.scan_index import open_scan_index
+from utils.ignore_patterns import compile_ignore_list, dir_pattern, extension_pattern
+from utils.file_records import sort_keys
+from utils.live_unsorted import LiveUnsorted, UnsortedTracker
+from utils.match_index import MATCH_KEYS
+from utils.content_match import open_hash_cache
+from utils.copy_verify import import_manifest
+from utils.search_index import SearchIndex, parse_query, is_empty_query, matching_rows
+from utils.rollups import SizeRollup, select_records
+from utils.batch_analysis import analyze_batch, batch_sources
+from utils.file_operations import (
+    TRANSFER_MODES,
+    ARCHIVE_FORMATS,
+    create_result_folder,
+    copy_unsorted_files,
+    resume_copy_job,
+)
+from utils.copy_journal import journal_path
+from utils.archive_output import result_archive_path
+from utils import metrics
+from ui.dialogs import IgnoreListDialog, BatchDialog
+from ui.virtual_table import VirtualTable
+from ui.rollup_view import RollupView
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_POLL_MS = 50  # период опроса фонового анализа
+WATCH_POLL_MS = 250  # период проверки обновлений от слежения за папками
+FILTER_DELAY_MS = 30  # нажатия клавиш в полях фильтра чаще этого дают одно обновление
+
+TRANSFER_MODE_LABELS = {
+    "copy": "Копия",
+    "hardlink": "Жёсткая ссылка",
+    "reflink": "Reflink (btrfs/XFS)",
+    "move": "Перемещение",
+    "tar": "Архив tar",
+    "tar.gz": "Архив tar.gz",
+    "zip": "Архив zip",
+}
+
+MATCH_KEY_LABELS = {
+    "name": "Имя",
+    "path": "Относительный путь",
+    "name_size": "Имя и размер",
+    "normalized_name": "Имя без учёта регистра",
+    "name_mtime": "Имя и время изменения",
+}
+
+
+COLUMN_HEADINGS = {
+    "name": "Имя",
+    "size": "Размер",
+    "modified": "Изменён",
+    "type": "Тип",
+    "path": "Путь",
+}
+
+# Поля для сортировки по исходным данным, а не по отображаемым строкам:
+# размер — число байт, дата — mtime, текст — без учёта регистра
+SORT_FIELDS = {
+    "name": "name",
+    "size": "size",
+    "modified": "mtime",
+    "type": "extension",
+    "path": "path",
+}
+
+
+def format_row(file_info):
+    """Значения колонок таблицы для записи о файле"""
+
+    return (
+        file_info["name"],
+        format_file_size(file_info["size"]),
+        file_info["modified"].strftime("%Y-%m-%d %H:%M:%S"),
+        file_info["extension"],
+        file_info["path"],
+    )
+
+
+def format_duration(seconds):
+    """Оценка оставшегося времени в виде м:сс или ч:мм:сс"""
+
+    minutes, secs = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
 
 
 class MainWindow:
@@ -14,6 +111,28 @@ class MainWindow:
 
         self.config = load_config()
         self.unsorted_files = []
+        self.scan_index = None
+        self.hash_cache = None
+        self.analysis_thread = None
+        self.analysis_active = False
+        self.analysis_queue = None
+        self.cancel_event = None
+        self.scanned_count = 0
+        self.job_started = 0.0
+        self.copy_total = None  # байт к копированию, пока идёт копирование (0 — неизвестно)
+        self.copy_done = (0, 0)
+        self.run_metrics = None  # utils.metrics.RunMetrics последнего фонового запуска
+        self.results = None  # utils.live_unsorted.UnsortedTracker последнего анализа по имени
+        self.rows_version = None  # версия состояния results, по которой построен unsorted_files
+        self.search_index = None  # utils.search_index.SearchIndex по unsorted_files
+        self.filter_job = None
+        self.filter_active = False
+        self.filter_query = None  # последний разобранный запрос фильтра
+        self.batch_results = []  # результаты пакетного анализа по исходным папкам
+        self.batch_current = None  # номер показанного результата пакета
+        self.batch_total = 0  # папок в идущем пакетном анализе
+        self.live = None  # utils.live_unsorted.LiveUnsorted, пока включено слежение
+        self.watch_queue = None
         self.sort_column_name = None  # Текущая колонка сортировки
         self.sort_reverse = False  # Направление сортировки
 
@@ -46,36 +165,135 @@ class MainWindow:
             row=1, column=2, pady=2
         )
 
+        ttk.Label(path_frame, text="Режим переноса:").grid(
+            row=2, column=0, sticky=tk.W, pady=2
+        )
+        self.transfer_mode_box = ttk.Combobox(
+            path_frame,
+            values=[TRANSFER_MODE_LABELS[mode] for mode in TRANSFER_MODES + ARCHIVE_FORMATS],
+            state="readonly",
+            width=25,
+        )
+        self.transfer_mode_box.set(
+            TRANSFER_MODE_LABELS.get(self.config.get("transfer_mode"), "Копия")
+        )
+        self.transfer_mode_box.bind("<<ComboboxSelected>>", self.select_transfer_mode)
+        self.transfer_mode_box.grid(row=2, column=1, sticky=tk.W, padx=5, pady=2)
+
+        ttk.Label(path_frame, text="Ключ сравнения:").grid(
+            row=3, column=0, sticky=tk.W, pady=2
+        )
+        self.match_key_box = ttk.Combobox(
+            path_frame,
+            values=[MATCH_KEY_LABELS[key] for key in MATCH_KEYS],
+            state="readonly",
+            width=25,
+        )
+        self.match_key_box.set(MATCH_KEY_LABELS.get(self.config.get("match_key"), "Имя"))
+        self.match_key_box.bind("<<ComboboxSelected>>", self.select_match_key)
+        self.match_key_box.grid(row=3, column=1, sticky=tk.W, padx=5, pady=2)
+
         # Фрейм кнопок действий
         action_frame = ttk.Frame(self.root, padding=10)
         action_frame.pack(fill=tk.X, padx=10)
 
-        ttk.Button(action_frame, text="Анализировать", command=self.analyze_files).pack(
-            side=tk.LEFT, padx=5
+        self.analyze_button = ttk.Button(
+            action_frame, text="Анализировать", command=self.analyze_files
         )
+        self.analyze_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(
+            action_frame, text="Пакетный анализ", command=self.analyze_batch
+        ).pack(side=tk.LEFT, padx=5)
         ttk.Button(
             action_frame, text="Копировать неотсортированные", command=self.copy_files
         ).pack(side=tk.LEFT, padx=5)
+        ttk.Button(
+            action_frame, text="Продолжить копирование", command=self.resume_copy
+        ).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Игнор-лист", command=self.show_ignore_list).pack(
             side=tk.LEFT, padx=5
         )
         ttk.Button(
             action_frame, text="Очистить историю", command=self.clear_history
         ).pack(side=tk.LEFT, padx=5)
+        ttk.Button(
+            action_frame, text="Перестроить индекс", command=self.rebuild_index
+        ).pack(side=tk.LEFT, padx=5)
+        self.content_match_var = tk.BooleanVar(
+            value=self.config.get("match_mode", "name") == "content"
+        )
+        ttk.Checkbutton(
+            action_frame,
+            text="По содержимому",
+            variable=self.content_match_var,
+            command=self.toggle_match_mode,
+        ).pack(side=tk.LEFT, padx=5)
+        self.watch_var = tk.BooleanVar(value=self.config.get("watch_changes", False))
+        ttk.Checkbutton(
+            action_frame,
+            text="Следить за изменениями",
+            variable=self.watch_var,
+            command=self.toggle_watch,
+        ).pack(side=tk.LEFT, padx=5)
+        self.verify_var = tk.BooleanVar(value=bool(self.config.get("verify_copy")))
+        ttk.Checkbutton(
+            action_frame,
+            text="Проверять копии",
+            variable=self.verify_var,
+            command=self.toggle_verify,
+        ).pack(side=tk.LEFT, padx=5)
 
         # Фрейм результатов
         result_frame = ttk.LabelFrame(self.root, text="Результаты", padding=10)
         result_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
 
-        self.result_label = ttk.Label(result_frame, text="Файлов не найдено")
-        self.result_label.pack(anchor=tk.W, pady=5)
+        status_frame = ttk.Frame(result_frame)
+        status_frame.pack(fill=tk.X, pady=5)
 
-        # Таблица файлов
-        columns = ("name", "size", "modified", "type", "path")
-        self.tree = ttk.Treeview(
-            result_frame, columns=columns, show="headings", selectmode=tk.EXTENDED
+        self.result_label = ttk.Label(status_frame, text="Файлов не найдено")
+        self.result_label.pack(side=tk.LEFT)
+        # Выбор исходной папки пакета; показывается только после пакетного анализа
+        self.batch_box = ttk.Combobox(status_frame, state="readonly", width=60)
+        self.batch_box.bind("<<ComboboxSelected>>", lambda e: self.select_batch(self.batch_box.current()))
+        self.cancel_button = ttk.Button(
+            status_frame, text="Отмена", command=self.cancel_analysis, state=tk.DISABLED
+        )
+        self.cancel_button.pack(side=tk.RIGHT)
+        self.progress_bar = ttk.Progressbar(status_frame, mode="determinate", length=200)
+        self.progress_bar.pack(side=tk.RIGHT, padx=5)
+
+        # Фильтр результатов: таблица обновляется при каждом нажатии клавиши
+        filter_frame = ttk.Frame(result_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        self.filter_vars = {}
+        for field, label, width in (
+            ("text", "Имя содержит:", 20),
+            ("extensions", "Расширения:", 10),
+            ("size_from", "Размер от:", 8),
+            ("size_to", "до:", 8),
+            ("date_from", "Изменён с:", 11),
+            ("date_to", "по:", 11),
+        ):
+            ttk.Label(filter_frame, text=label).pack(side=tk.LEFT, padx=(5, 2))
+            var = tk.StringVar()
+            var.trace_add("write", self.schedule_filter)
+            ttk.Entry(filter_frame, textvariable=var, width=width).pack(side=tk.LEFT)
+            self.filter_vars[field] = var
+        ttk.Button(filter_frame, text="Сбросить", command=self.reset_filter).pack(
+            side=tk.RIGHT, padx=5
         )
 
+        # Слева сводка по папкам и расширениям, справа плоский список
+        panes = ttk.PanedWindow(result_frame, orient=tk.HORIZONTAL)
+        panes.pack(fill=tk.BOTH, expand=True)
+        self.rollup_view = RollupView(panes)
+        panes.add(self.rollup_view.frame, weight=1)
+
+        # Таблица файлов: в Treeview живут только строки видимой области
+        columns = ("name", "size", "modified", "type", "path")
+        self.table = VirtualTable(panes, columns, format_row)
+        self.tree = self.table.tree
+
         self.tree.heading("name", text="Имя", command=lambda: self.sort_column("name"))
         self.tree.heading(
             "size", text="Размер", command=lambda: self.sort_column("size")
@@ -92,13 +310,7 @@ class MainWindow:
         self.tree.column("type", width=80)
         self.tree.column("path", width=300)
 
-        scrollbar = ttk.Scrollbar(
-            result_frame, orient=tk.VERTICAL, command=self.tree.yview
-        )
-        self.tree.configure(yscrollcommand=scrollbar.set)
-
-        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        panes.add(self.table.frame, weight=3)
 
         # Контекстное меню
         self.context_menu = tk.Menu(self.root, tearoff=0)
@@ -108,6 +320,13 @@ class MainWindow:
         self.tree.bind("<Button-2>", self.show_context_menu)  # ПКМ на Маке
         self.tree.bind("<Button-3>", self.show_context_menu)  # ПКМ на Windows/Linux
 
+        # Меню сводки: папка или расширение целиком
+        self.rollup_menu = tk.Menu(self.root, tearoff=0)
+        self.rollup_menu.add_command(label="Копировать", command=self.copy_rollup)
+        self.rollup_menu.add_command(label="Добавить в игнор-лист", command=self.ignore_rollup)
+        self.rollup_view.bind("<Button-2>", self.show_rollup_menu)
+        self.rollup_view.bind("<Button-3>", self.show_rollup_menu)
+
     def center_window(self):
         """Центрировать окно на экране"""
 
@@ -162,6 +381,20 @@ class MainWindow:
             self.config["sorted_folder"] = folder
             save_config(self.config)
 
+    def select_transfer_mode(self, event=None):
+        label = self.transfer_mode_box.get()
+        for mode, mode_label in TRANSFER_MODE_LABELS.items():
+            if mode_label == label:
+                self.config["transfer_mode"] = mode
+                save_config(self.config)
+
+    def select_match_key(self, event=None):
+        label = self.match_key_box.get()
+        for key, key_label in MATCH_KEY_LABELS.items():
+            if key_label == label:
+                self.config["match_key"] = key
+                save_config(self.config)
+
     def analyze_files(self):
         source_folder = self.source_entry.get()
         sorted_folder = self.sorted_entry.get()
@@ -169,46 +402,674 @@ class MainWindow:
         if not source_folder or not sorted_folder:
             messagebox.showwarning("Предупреждение", "Выберите обе папки")
             return
+        if self.is_analyzing():
+            return
+
+        self.reset_results()
+        match_mode = self.config.get("match_mode", "name")
+        params = {
+            "source_folder": source_folder,
+            "sorted_folder": sorted_folder,
+            "ignore": compile_ignore_list(load_ignore_list(source_folder)),
+            "workers": self.config.get("scan_workers"),
+            "index": self.get_scan_index(),
+            "match_mode": match_mode,
+            "match_key": self.config.get("match_key", "name"),
+            "hash_cache": self.get_hash_cache() if match_mode == "content" else None,
+            # Слежение поддерживает только сравнение по имени
+            "watch": self.watch_var.get() and match_mode == "name",
+        }
+
+        self.start_background(self.run_analysis, params, "Сканирование...", "analyze")
+
+    def reset_results(self):
+        """Убрать прежние результаты перед новым анализом"""
+
+        self.stop_watching()
+        self.table.clear()
+        self.rollup_view.set_rollup(None)
+        self.unsorted_files = []
+        self.results = None
+        self.rows_version = None
+        self.search_index = None
+        self.scanned_count = 0
+        self.batch_results = []
+        self.batch_current = None
+        self.batch_total = 0
+        self.batch_box.set("")
+        self.batch_box.pack_forget()
+
+    def analyze_batch(self):
+        """Проверить несколько исходных папок против одной отсортированной"""
+
+        sorted_folder = self.sorted_entry.get()
+        if not sorted_folder:
+            messagebox.showwarning("Предупреждение", "Выберите папку отсортированных")
+            return
+        if self.is_analyzing():
+            return
+        initial = self.config.get("batch_folders") or [
+            folder for folder in (self.source_entry.get(),) if folder
+        ]
+        dialog = BatchDialog(self.root, initial, self.config.get("history", []))
+        self.root.wait_window(dialog.dialog)
+        if dialog.result is None:
+            return
+        self.config["batch_folders"] = dialog.result
+        save_config(self.config)
+
+        sorted_key = os.path.normcase(os.path.abspath(sorted_folder))
+        sources = [
+            folder for folder in batch_sources(dialog.result)
+            if os.path.normcase(os.path.abspath(folder)) != sorted_key
+        ]
+        if not sources:
+            messagebox.showwarning("Предупреждение", "Нет существующих исходных папок")
+            return
+
+        self.reset_results()
+        self.batch_total = len(sources)
+        self.start_background(
+            self.run_batch, self.batch_params(sources, sorted_folder), "Пакетный анализ...", "batch"
+        )
 
-        self.tree.delete(*self.tree.get_children())
+    def batch_params(self, sources, sorted_folder):
+        match_mode = self.config.get("match_mode", "name")
+        return {
+            "sources": sources,
+            "sorted_folder": sorted_folder,
+            "ignore_lists": {folder: load_ignore_list(folder) for folder in sources},
+            "workers": self.config.get("scan_workers"),
+            "index": self.get_scan_index(),
+            "match_mode": match_mode,
+            "match_key": self.config.get("match_key", "name"),
+            "hash_cache": self.get_hash_cache() if match_mode == "content" else None,
+            "source_workers": self.config.get("batch_parallel"),
+        }
 
-        source_files = get_all_files(source_folder)
-        sorted_files = get_all_files(sorted_folder)
-        ignore_list = load_ignore_list(source_folder)
+    def run_batch(self, params):
+        """Пакетный анализ в фоновом потоке: результат каждой папки отдаётся, как только готов"""
 
-        self.unsorted_files = find_unsorted_files(
-            source_files, sorted_files, ignore_list
+        events = self.analysis_queue
+        for result in self.iter_batch(params):
+            events.put(("batch_item", result))
+        events.put(("cancelled", None) if self.cancel_event.is_set() else ("batch_done", None))
+
+    def run_batch_source(self, params):
+        """Повторный анализ показанной папки пакета: результат заменит её прежний"""
+
+        for result in self.iter_batch(params):
+            self.analysis_queue.put(("batch_source", result))
+            return
+        self.analysis_queue.put(("cancelled", None))
+
+    def iter_batch(self, params):
+        events = self.analysis_queue
+        if params["match_mode"] == "content":
+            for folder in [params["sorted_folder"]] + params["sources"]:
+                import_manifest(folder, params["hash_cache"])
+        yield from analyze_batch(
+            params["sources"],
+            params["sorted_folder"],
+            params["ignore_lists"],
+            match_mode=params["match_mode"],
+            match_key=params["match_key"],
+            workers=params["workers"],
+            index=params["index"],
+            hash_cache=params["hash_cache"],
+            source_workers=params["source_workers"],
+            cancel_event=self.cancel_event,
+            on_progress=lambda count: events.put(("progress", count)),
         )
 
-        for file_info in self.unsorted_files:
-            self.tree.insert(
-                "",
-                tk.END,
-                values=(
-                    file_info["name"],
-                    format_file_size(file_info["size"]),
-                    file_info["modified"].strftime("%Y-%m-%d %H:%M:%S"),
-                    file_info["extension"],
-                    file_info["path"],
-                ),
+    def start_background(self, target, params, status, run_name):
+        """Запустить target(params) в фоновом потоке; события забирает poll_analysis
+
+        Каждый запуск собирает метрики (utils.metrics) под именем run_name.
+        """
+
+        self.cancel_event = threading.Event()
+        self.analysis_queue = queue.Queue()
+        self.run_metrics = metrics.start_run(run_name)
+        self.analysis_thread = threading.Thread(
+            target=self.run_job, args=(target, params, self.run_metrics), daemon=True
+        )
+        self.analysis_active = True
+        self.job_started = time.monotonic()
+        self.analyze_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.result_label.config(text=status)
+        self.progress_bar.config(mode="indeterminate", value=0)
+        self.progress_bar.start()
+        self.analysis_thread.start()
+        self.root.after(ANALYSIS_POLL_MS, self.poll_analysis)
+
+    def run_job(self, target, params, run_metrics):
+        """Фоновый запуск с профилированием по настройке profile_mode и отчётом metrics_report"""
+
+        try:
+            with metrics.profile_run(run_metrics, self.config.get("profile_mode")):
+                target(params)
+        except Exception as e:
+            self.analysis_queue.put(("error", str(e)))
+        finally:
+            metrics.finish_run(run_metrics)
+            if self.config.get("metrics_report"):
+                try:
+                    run_metrics.write_json(metrics.report_path(run_metrics))
+                except OSError as e:
+                    logger.error("Не удалось записать отчёт о метриках: %s", e)
+
+    def is_analyzing(self):
+        return self.analysis_active
+
+    def run_analysis(self, params):
+        """Анализ в фоновом потоке; с Tk общается только через analysis_queue"""
+
+        events = self.analysis_queue
+        cancel_event = self.cancel_event
+
+        def progress(count):
+            events.put(("progress", count))
+
+        def result(unsorted, tracker=None, live=None, watch_queue=None, version=None):
+            # Индекс фильтра строится здесь же, чтобы не занимать поток интерфейса
+            events.put(
+                ("result", (unsorted, tracker, live, watch_queue, SearchIndex(unsorted), rollup, version))
             )
 
-        self.result_label.config(
-            text=f"Найдено неотсортированных файлов: {len(self.unsorted_files)}"
+        # Сводка по папкам и расширениям копится вместе с построением списка
+        rollup = SizeRollup()
+
+        live = None
+        if params["watch"]:
+            watch_queue = queue.Queue()
+
+            def publish(version, added, removed):
+                watch_queue.put((version, added, removed))
+
+            live = LiveUnsorted(
+                params["source_folder"],
+                params["sorted_folder"],
+                params["ignore"],
+                on_update=publish,
+                match_key=params["match_key"],
+            )
+        # Отброшенное игнор-листом запоминается, чтобы снятие шаблона не требовало пересканирования
+        skipped = []
+        try:
+            if live is not None:
+                # Слежение запускается до сканирования, чтобы не пропустить изменения
+                live.watch()
+            source_files = get_all_files(
+                params["source_folder"],
+                workers=params["workers"],
+                index=params["index"],
+                cancel_event=cancel_event,
+                on_progress=progress,
+                ignore=params["ignore"],
+                skipped=skipped,
+            )
+            sorted_files = get_all_files(
+                params["sorted_folder"],
+                workers=params["workers"],
+                index=params["index"],
+                cancel_event=cancel_event,
+                on_progress=progress,
+            )
+            if cancel_event.is_set():
+                events.put(("cancelled", None))
+                return
+            if live is not None:
+                unsorted, version = live.attach(source_files, sorted_files, skipped, rollup)
+                result(unsorted, live.tracker, live, watch_queue, version)
+                live = None
+                return
+            if params["match_mode"] == "name":
+                tracker = UnsortedTracker(
+                    params["source_folder"],
+                    params["sorted_folder"],
+                    source_files,
+                    sorted_files,
+                    params["ignore"],
+                    skipped,
+                    params["match_key"],
+                )
+                unsorted, version = tracker.snapshot(rollup)
+                result(unsorted, tracker, version=version)
+                return
+
+            # Хэши проверенных копий из манифестов не нужно считать заново
+            for folder in (params["source_folder"], params["sorted_folder"]):
+                import_manifest(folder, params["hash_cache"])
+            unsorted = find_unsorted_files(
+                source_files,
+                sorted_files,
+                params["ignore"],
+                match_mode=params["match_mode"],
+                hash_cache=params["hash_cache"],
+                cancel_event=cancel_event,
+                rollup=rollup,
+            )
+            if cancel_event.is_set():
+                events.put(("cancelled", None))
+                return
+            result(unsorted)
+        except Exception as e:
+            events.put(("error", str(e)))
+        finally:
+            if live is not None:
+                live.stop()
+
+    def poll_analysis(self):
+        """Забрать события из фонового потока и обновить счётчик или таблицу"""
+
+        try:
+            while True:
+                kind, payload = self.analysis_queue.get_nowait()
+                if kind == "progress":
+                    self.scanned_count += payload
+                elif kind == "copy_progress":
+                    self.copy_done = payload
+                elif kind == "copied":
+                    self.finish_analysis("Копирование завершено")
+                    self.finish_copy(*payload)
+                    return
+                elif kind == "result":
+                    # Таблица виртуальная: отдаём весь список сразу, строки
+                    # форматируются только для видимой области
+                    (unsorted, self.results, self.live, self.watch_queue, self.search_index, rollup,
+                     self.rows_version) = payload
+                    self.unsorted_files = unsorted
+                    self.table.set_rows(unsorted)
+                    self.rollup_view.set_rollup(rollup, self.rollup_label())
+                    self.apply_sort()
+                    self.apply_filter()
+                    self.finish_analysis(self.result_message())
+                    if self.live is not None:
+                        self.root.after(WATCH_POLL_MS, self.poll_watch)
+                    return
+                elif kind == "rows":
+                    rows, search_index, rollup, self.rows_version = payload
+                    self.show_rows(rows, search_index, rollup)
+                    self.finish_analysis(self.result_message())
+                    return
+                elif kind == "batch_item":
+                    self.batch_results.append(payload)
+                elif kind == "batch_done":
+                    self.finish_analysis("Пакетный анализ завершён")
+                    self.show_batch()
+                    return
+                elif kind == "batch_source":
+                    self.batch_results[self.batch_current] = payload
+                    self.finish_analysis("")
+                    self.select_batch(self.batch_current)
+                    return
+                elif kind == "error":
+                    self.finish_analysis("Ошибка")
+                    messagebox.showerror("Ошибка", payload)
+                    return
+                else:
+                    if self.batch_current is not None:
+                        # Отменён повторный анализ одной папки: в таблице остаётся её прежний результат
+                        self.finish_analysis("Анализ отменён")
+                    elif self.batch_total:
+                        # В пакете остались только папки, проверенные до отмены
+                        self.finish_analysis(
+                            f"Анализ отменён, папок готово: {len(self.batch_results)} из {self.batch_total}"
+                        )
+                    else:
+                        self.finish_analysis("Анализ отменён")
+                    if self.batch_results:
+                        self.show_batch()
+                    return
+        except queue.Empty:
+            pass
+
+        self.update_progress()
+        self.root.after(ANALYSIS_POLL_MS, self.poll_analysis)
+
+    def update_progress(self):
+        """Полоса и строка состояния: скорость сканирования или доля, скорость и ETA копирования"""
+
+        elapsed = max(time.monotonic() - self.job_started, 1e-6)
+        if self.copy_total is not None:
+            files, done = self.copy_done
+            text = f"Копирование... файлов: {files}, {format_file_size(done)}"
+            if self.copy_total:
+                self.progress_bar.config(value=min(100.0, 100.0 * done / self.copy_total))
+                text += f" из {format_file_size(self.copy_total)}"
+                if done:
+                    remaining = (self.copy_total - done) * elapsed / done
+                    text += f", осталось ~{format_duration(remaining)}"
+            text += f" ({format_file_size(done / elapsed)}/с)"
+        elif self.scanned_count:
+            text = (
+                f"Сканирование... просмотрено файлов: {self.scanned_count}"
+                f" ({self.scanned_count / elapsed:.0f} файлов/с)"
+            )
+            if self.batch_total and self.batch_current is None:
+                text += f", папок готово: {len(self.batch_results)} из {self.batch_total}"
+        else:
+            return
+        self.result_label.config(text=text)
+
+    def finish_analysis(self, message):
+        self.analysis_active = False
+        self.copy_total = None
+        self.progress_bar.stop()
+        self.progress_bar.config(mode="determinate", value=0)
+        self.result_label.config(text=message)
+        self.analyze_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+
+    def result_message(self):
+        message = f"Найдено неотсортированных файлов: {len(self.unsorted_files)}"
+        if self.filter_active:
+            message += f", показано: {len(self.table)}"
+        return message + " (слежение)" if self.live is not None else message
+
+    def poll_watch(self):
+        """Внести в таблицу накопившиеся изменения от слежения одной правкой
+
+        Пока идёт фоновая работа, изменения ждут в очереди: её результат —
+        полный список, и изменения, уже учтённые в нём (по версии), пропускаются.
+        """
+
+        if self.live is None:
+            return
+        if not self.is_analyzing():
+            added, removed = {}, {}
+            try:
+                while True:
+                    version, rows_added, rows_removed = self.watch_queue.get_nowait()
+                    if version <= self.rows_version:
+                        continue
+                    self.rows_version = version
+                    # Запись, добавленная и убранная между опросами, взаимно сокращается
+                    for row in rows_removed:
+                        if added.pop(id(row), None) is None:
+                            removed[id(row)] = row
+                    for row in rows_added:
+                        if removed.pop(id(row), None) is None:
+                            added[id(row)] = row
+            except queue.Empty:
+                pass
+            if added or removed:
+                self.patch_rows(list(added.values()), list(removed.values()))
+                self.result_label.config(text=self.result_message())
+        self.root.after(WATCH_POLL_MS, self.poll_watch)
+
+    def patch_rows(self, added, removed):
+        """Внести изменения списка без пересортировки и перестройки сводки
+
+        Таблица сливает новые записи с кэшем сортировки, сводка и дерево
+        обновляются только по затронутым папкам. Индекс фильтра по старому
+        списку сбрасывается и строится заново при следующем изменении фильтра,
+        новые записи проверяются по текущему запросу отдельно.
+        """
+
+        shown_added = None
+        if self.filter_active and added:
+            shown_added = matching_rows(added, self.filter_query)
+        removed = self.table.patch_rows(added, removed, shown_added)
+        self.unsorted_files = self.table.rows
+        self.search_index = None
+        rollup = self.rollup_view.rollup
+        if rollup is None:
+            self.rollup_view.set_rollup(SizeRollup(self.unsorted_files), self.rollup_label())
+        else:
+            self.rollup_view.refresh_dirs(rollup.update(added, removed))
+
+    def show_rows(self, rows, search_index=None, rollup=None):
+        """Обновить таблицу новым списком, сохранив выделение, прокрутку, сортировку и фильтр
+
+        search_index — индекс фильтра по rows, если уже построен; иначе он
+        строится при первом использовании фильтра. rollup — сводка по rows,
+        если уже собрана.
+        """
+
+        if rollup is None:
+            rollup = SizeRollup(rows)
+        self.unsorted_files = rows
+        self.search_index = search_index
+        self.rollup_view.set_rollup(rollup, self.rollup_label())
+        self.table.replace_rows(rows)
+        if self.batch_current is not None:
+            # Изменения (игнор-лист, перемещение) остаются в результате своей папки пакета
+            self.batch_results[self.batch_current].update(files=rows, rollup=rollup)
+            self.batch_box.config(values=[self.batch_label(result) for result in self.batch_results])
+            self.batch_box.current(self.batch_current)
+        self.apply_sort()
+        if self.filter_active:
+            self.apply_filter()
+
+    def show_batch(self):
+        """Показать выбор папки пакета и открыть папку с наибольшим объёмом находок"""
+
+        self.batch_results.sort(key=lambda result: result["source"])
+        self.batch_box.config(values=[self.batch_label(result) for result in self.batch_results])
+        self.batch_box.pack(side=tk.LEFT, padx=10)
+        largest = max(
+            range(len(self.batch_results)),
+            key=lambda i: self.batch_results[i]["rollup"].total()[1],
         )
+        self.select_batch(largest)
+
+    @staticmethod
+    def batch_label(result):
+        if result["error"] is not None:
+            return f"{result['source']} — ошибка: {result['error']}"
+        files, size = result["rollup"].total()
+        return f"{result['source']} — {files} файлов, {format_file_size(size)}"
+
+    def select_batch(self, index):
+        """Показать результат одной папки пакета; копирование и игнор-лист относятся к ней"""
+
+        if index < 0 or self.is_analyzing():
+            return
+        result = self.batch_results[index]
+        self.batch_current = index
+        self.source_entry.delete(0, tk.END)
+        self.source_entry.insert(0, result["source"])
+        self.results = None
+        self.show_rows(result["files"], None, result["rollup"])
+        self.result_label.config(text=self.result_message())
+
+    def schedule_filter(self, *args):
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(FILTER_DELAY_MS, self.apply_filter)
+
+    def apply_filter(self):
+        """Показать в таблице только записи, подходящие под поля фильтра"""
+
+        self.filter_job = None
+        try:
+            query = parse_query(**{field: var.get() for field, var in self.filter_vars.items()})
+        except ValueError as e:
+            self.result_label.config(text=f"Фильтр: {e}")
+            return
+        self.filter_query = query
+        self.filter_active = not is_empty_query(query)
+        if not self.filter_active:
+            self.table.set_filter(None)
+        elif self.unsorted_files:
+            if self.search_index is None:
+                self.search_index = SearchIndex(self.unsorted_files)
+            self.table.set_filter(self.search_index.search(query))
+        if not self.is_analyzing():
+            self.result_label.config(text=self.result_message())
 
-    def copy_files(self):
-        if not self.unsorted_files:
+    def reset_filter(self):
+        for var in self.filter_vars.values():
+            var.set("")
+
+    def stop_watching(self):
+        if self.live is not None:
+            self.live.stop()
+            self.live = None
+            self.watch_queue = None
+
+    def toggle_watch(self):
+        self.config["watch_changes"] = self.watch_var.get()
+        save_config(self.config)
+        if not self.watch_var.get():
+            self.stop_watching()
+            self.result_label.config(text=self.result_message())
+        elif self.live is None and not self.is_analyzing() and self.unsorted_files:
+            # Для слежения нужно состояние обеих папок — проще один раз пересканировать
+            self.analyze_files()
+
+    def cancel_analysis(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def get_scan_index(self):
+        """Индекс сканирования открывается один раз за сессию"""
+
+        if self.scan_index is None and self.config.get("use_scan_index", True):
+            self.scan_index = open_scan_index(SCAN_INDEX_FILE)
+        return self.scan_index
+
+    def get_hash_cache(self):
+        if self.hash_cache is None:
+            self.hash_cache = open_hash_cache(HASH_CACHE_FILE)
+        return self.hash_cache
+
+    def toggle_verify(self):
+        # "fresh" (сверка с носителем) включается только в файле настроек
+        if not self.verify_var.get():
+            self.config["verify_copy"] = None
+        elif not self.config.get("verify_copy"):
+            self.config["verify_copy"] = "hash"
+        save_config(self.config)
+
+    def toggle_match_mode(self):
+        self.config["match_mode"] = "content" if self.content_match_var.get() else "name"
+        save_config(self.config)
+
+    def rebuild_index(self):
+        """Сбросить индекс для выбранных папок и выполнить полный анализ заново"""
+
+        if self.is_analyzing():
+            return
+        index = self.get_scan_index()
+        if index is None:
+            messagebox.showwarning("Предупреждение", "Индекс сканирования отключён")
+            return
+
+        for folder in (self.source_entry.get(), self.sorted_entry.get()):
+            if folder:
+                index.invalidate(folder)
+        self.analyze_files()
+
+    def copy_files(self, files=None):
+        """Скопировать найденные файлы (files — часть из них, например папку из сводки)"""
+
+        if self.is_analyzing():
+            messagebox.showwarning("Предупреждение", "Дождитесь окончания анализа")
+            return
+        if files is None:
+            files = self.unsorted_files
+        if not files:
             messagebox.showwarning("Предупреждение", "Нет файлов для копирования")
             return
 
         source_folder = self.source_entry.get()
-        result_folder = create_result_folder(source_folder)
-
-        copied, errors = copy_unsorted_files(
-            self.unsorted_files, source_folder, result_folder
+        mode = self.config.get("transfer_mode", "copy")
+        if mode in ARCHIVE_FORMATS:
+            dest = result_archive_path(source_folder, mode)
+        else:
+            dest = create_result_folder(source_folder)
+        self.start_copy(
+            {
+                "files": files,
+                "source_folder": source_folder,
+                "dest": dest,
+                "mode": mode,
+                "workers": self.config.get("copy_workers"),
+                "verify": self.config.get("verify_copy"),
+                "hash_cache": self.get_hash_cache() if self.config.get("verify_copy") else None,
+            },
+            sum(file_info["size"] for file_info in files),
         )
 
+    def start_copy(self, params, total_bytes):
+        """Копирование в фоновом потоке; total_bytes — для полосы и оценки времени (0 — неизвестно)"""
+
+        self.copy_total = total_bytes
+        self.copy_done = (0, 0)
+        self.start_background(self.run_copy, params, "Копирование...", "copy")
+        # Копирование не отменяется, прерванное задание продолжается по журналу
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_bar.stop()
+        self.progress_bar.config(mode="determinate", value=0)
+
+    def run_copy(self, params):
+        events = self.analysis_queue
+        last_report = [0.0]
+
+        def progress(files, size):
+            # Вызывается после каждого файла; в очередь — не чаще опроса интерфейса
+            now = time.monotonic()
+            if now - last_report[0] >= ANALYSIS_POLL_MS / 1000:
+                last_report[0] = now
+                events.put(("copy_progress", (files, size)))
+
+        try:
+            if params.get("resume"):
+                copied, errors = resume_copy_job(
+                    params["dest"],
+                    workers=params["workers"],
+                    on_progress=progress,
+                    hash_cache=params["hash_cache"],
+                )
+            else:
+                copied, errors = copy_unsorted_files(
+                    params["files"],
+                    params["source_folder"],
+                    params["dest"],
+                    workers=params["workers"],
+                    on_progress=progress,
+                    mode=params["mode"],
+                    verify=params["verify"],
+                    hash_cache=params["hash_cache"],
+                )
+            events.put(("copied", (params, copied, errors)))
+        except Exception as e:
+            events.put(("error", str(e)))
+
+    def finish_copy(self, params, copied, errors):
+        result_folder = params["dest"]
+        if params.get("resume"):
+            if errors:
+                messagebox.showwarning(
+                    "Предупреждение", f"Докопировано: {copied}\nОшибок: {len(errors)}"
+                )
+            else:
+                messagebox.showinfo(
+                    "Успех", f"Докопировано {copied} файлов в:\n{result_folder}"
+                )
+            return
+        if params["mode"] in ARCHIVE_FORMATS:
+            if errors:
+                messagebox.showwarning(
+                    "Предупреждение", f"В архив добавлено: {copied}\nОшибок: {len(errors)}"
+                )
+            else:
+                messagebox.showinfo("Успех", f"В архив добавлено {copied} файлов:\n{result_folder}")
+            return
+
+        if params["mode"] == "move":
+            # Перемещённых файлов в исходной папке больше нет; не перенесённые
+            # из-за ошибок остаются в таблице, чтобы их можно было повторить
+            moved = {id(file_info) for file_info in params["files"] if not os.path.exists(file_info["path"])}
+            self.show_rows([f for f in self.unsorted_files if id(f) not in moved])
+            self.result_label.config(text=self.result_message())
+            if self.live is None:
+                self.results = None
+
         if errors:
             messagebox.showwarning(
                 "Предупреждение", f"Скопировано: {copied}\nОшибок: {len(errors)}"
@@ -219,9 +1080,7 @@ class MainWindow:
             )
 
         # Сохранить в истории
-        if "history" not in self.config:
-            self.config["history"] = []
-        self.config["history"].append(result_folder)
+        add_history(self.config, result_folder)
         if messagebox.askyesno(
             "Использовать новый каталог?",
             f"Использовать новый каталог?\n\n{result_folder}",
@@ -231,37 +1090,157 @@ class MainWindow:
             self.config["source_folder"] = result_folder
         save_config(self.config)
 
+    def resume_copy(self):
+        """Продолжить прерванное копирование в выбранную папку с результатами"""
+
+        if self.is_analyzing():
+            messagebox.showwarning("Предупреждение", "Дождитесь окончания анализа")
+            return
+        result_folder = filedialog.askdirectory(
+            title="Выберите папку с прерванным копированием", initialdir="./"
+        )
+        if not result_folder:
+            return
+        if not journal_path(result_folder).exists():
+            messagebox.showwarning(
+                "Предупреждение", "В папке нет журнала незавершённого копирования"
+            )
+            return
+
+        self.start_copy(
+            {
+                "resume": True,
+                "dest": result_folder,
+                "workers": self.config.get("copy_workers"),
+                # Проверка берётся из журнала задания; кэш пригодится, если она была включена
+                "hash_cache": self.get_hash_cache(),
+            },
+            0,
+        )
+
     def show_ignore_list(self):
         source_folder = self.source_entry.get()
         if not source_folder:
             messagebox.showwarning("Предупреждение", "Выберите исходную папку")
             return
 
+        before = set(load_ignore_list(source_folder))
         dialog = IgnoreListDialog(self.root, source_folder)
         self.root.wait_window(dialog.dialog)
+        after = set(dialog.ignore_list)
+        self.apply_ignore_change(after - before, before - after)
 
     def add_to_ignore(self):
-        selected = self.tree.selection()
+        selected = self.table.selected_rows()
         if not selected:
             return
 
         source_folder = self.source_entry.get()
-        ignore_list = load_ignore_list(source_folder)
+        added = add_to_ignore_list(source_folder, [file_info["name"] for file_info in selected])
+        self.apply_ignore_change(added, ())
+        messagebox.showinfo("Успех", "Файлы добавлены в игнор-лист")
 
-        for item in selected:
-            values = self.tree.item(item, "values")
-            filename = values[0]
-            if filename not in ignore_list:
-                ignore_list.append(filename)
+    def apply_ignore_change(self, added, removed):
+        """Применить изменения игнор-листа к текущим результатам без пересканирования папок"""
 
-        save_ignore_list(source_folder, ignore_list)
-        messagebox.showinfo("Успех", "Файлы добавлены в игнор-лист")
-        self.analyze_files()
+        if not (added or removed) or self.is_analyzing():
+            return
+        if self.results is None:
+            if not self.unsorted_files:
+                return
+            if removed:
+                # Сравнение по содержимому: снятым шаблонам нужны хеши, проще повторить анализ
+                if self.batch_current is None:
+                    self.analyze_files()
+                    return
+                # Из пакета повторно анализируется только показанная папка, остальные результаты остаются
+                source = self.batch_results[self.batch_current]["source"]
+                self.start_background(
+                    self.run_batch_source,
+                    self.batch_params([source], self.sorted_entry.get()),
+                    "Повторный анализ папки...",
+                    "batch_source",
+                )
+                return
+            # Новые шаблоны только скрывают строки
+            delta = compile_ignore_list(added)
+            self.show_rows(
+                [f for f in self.unsorted_files if not delta.match_entry(f["name"], f["relative_path"])]
+            )
+            self.result_label.config(text=self.result_message())
+            return
+
+        params = {
+            "ignore": compile_ignore_list(load_ignore_list(self.source_entry.get())),
+            "workers": self.config.get("scan_workers"),
+        }
+        self.start_background(
+            self.run_ignore_update, params, "Применение игнор-листа...", "ignore_update"
+        )
+
+    def run_ignore_update(self, params):
+        """Фоновое обновление результатов по новому игнор-листу (см. UnsortedTracker.update_ignore)"""
+
+        try:
+            if self.live is not None:
+                self.live.update_ignore(params["ignore"], workers=params["workers"])
+            else:
+                self.results.update_ignore(params["ignore"], workers=params["workers"])
+            rollup = SizeRollup()
+            rows, version = self.results.snapshot(rollup)
+            self.analysis_queue.put(("rows", (rows, SearchIndex(rows), rollup, version)))
+        except Exception as e:
+            self.analysis_queue.put(("error", str(e)))
 
     def show_context_menu(self, event):
-        if self.tree.selection():
+        if self.table.selected:
             self.context_menu.post(event.x_root, event.y_root)
 
+    def rollup_label(self):
+        return os.path.basename(os.path.normpath(self.source_entry.get())) or None
+
+    def show_rollup_menu(self, event):
+        iid = event.widget.identify_row(event.y)
+        if iid and not iid.endswith(RollupView.PLACEHOLDER):
+            event.widget.selection_set(iid)
+            self.rollup_menu.post(event.x_root, event.y_root)
+
+    def rollup_files(self):
+        """Найденные файлы выбранной в сводке папки (с подпапками) или расширения"""
+
+        node = self.rollup_view.selected()
+        if node is None:
+            return []
+        kind, value = node
+        if kind == "dir":
+            return select_records(self.unsorted_files, prefix=value)
+        return select_records(self.unsorted_files, extension=value)
+
+    def copy_rollup(self):
+        files = self.rollup_files()
+        if files:
+            self.copy_files(files)
+
+    def ignore_rollup(self):
+        node = self.rollup_view.selected()
+        if node is None or self.is_analyzing():
+            return
+        kind, value = node
+        if not value:
+            text = "всю исходную папку" if kind == "dir" else "файлы без расширения"
+            messagebox.showwarning("Предупреждение", f"Нельзя добавить в игнор-лист {text}")
+            return
+        if kind == "dir":
+            patterns = [dir_pattern(value)]
+        else:
+            # Игнор-лист различает регистр: шаблон на каждое написание расширения
+            patterns = sorted(
+                {extension_pattern(os.path.splitext(f["name"])[1]) for f in self.rollup_files()}
+            )
+        added = add_to_ignore_list(self.source_entry.get(), patterns)
+        self.apply_ignore_change(added, ())
+        messagebox.showinfo("Успех", "Добавлено в игнор-лист: " + ", ".join(patterns))
+
     def sort_column(self, col):
         if self.sort_column_name == col:
             self.sort_reverse = not self.sort_reverse
@@ -269,32 +1248,22 @@ class MainWindow:
             self.sort_column_name = col
             self.sort_reverse = False
 
-        data = [
-            (self.tree.set(child, col), child) for child in self.tree.get_children("")
-        ]
-        data.sort(reverse=self.sort_reverse)
-
-        for index, (_, child) in enumerate(data):
-            self.tree.move(child, "", index)
-
-        for column in ("name", "size", "modified", "type", "path"):
-            heading = self.tree.heading(column, "text")
-            heading = heading.split(" ")[0]
+        self.apply_sort()
 
+        for column, heading in COLUMN_HEADINGS.items():
             if column == col:
                 heading += " ↑" if self.sort_reverse else " ↓"
+            self.tree.heading(column, text=heading)
 
-            if column != col:
-                heading_map = {
-                    "name": "Имя",
-                    "size": "Размер",
-                    "modified": "Изменён",
-                    "type": "Тип",
-                    "path": "Путь",
-                }
-                heading = heading_map.get(column, heading)
+    def apply_sort(self):
+        """Применить текущую сортировку (после смены колонки или обновления записей)"""
 
-            self.tree.heading(column, text=heading)
+        if self.sort_column_name is None:
+            return
+        field = SORT_FIELDS[self.sort_column_name]
+        self.table.sort(
+            self.sort_column_name, lambda rows: sort_keys(rows, field), reverse=self.sort_reverse
+        )
 
     def clear_history(self):
         if messagebox.askyesno("Подтверждение", "Очистить историю созданных папок?"):
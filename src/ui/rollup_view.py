@@ -0,0 +1,172 @@
+import os
+import tkinter as tk
+from tkinter import ttk
+from utils.file_analyzer import format_file_size
+
+
+class RollupView:
+    """Сводка неотсортированных файлов: дерево папок и список расширений
+
+    Папки показываются с итогом по всему поддереву, крупные первыми. Узлы
+    дерева создаются при раскрытии, поэтому размер дерева не зависит от числа
+    папок. При обновлении сводки раскрытые папки остаются раскрытыми;
+    после SizeRollup.update достаточно refresh_dirs — меняются только
+    затронутые узлы.
+    """
+
+    PLACEHOLDER = "…"  # суффикс iid пустого потомка, пока папка не раскрыта (префиксы кончаются на os.sep)
+
+    def __init__(self, parent, root_label=""):
+        self.rollup = None
+        self.root_label = root_label
+
+        self.frame = ttk.Notebook(parent)
+        dirs_frame = ttk.Frame(self.frame)
+        extensions_frame = ttk.Frame(self.frame)
+        self.frame.add(dirs_frame, text="Папки")
+        self.frame.add(extensions_frame, text="Расширения")
+
+        self.dirs_tree = self._make_tree(dirs_frame, "tree headings")
+        self.dirs_tree.heading("#0", text="Папка")
+        self.dirs_tree.column("#0", width=180)
+        self.dirs_tree.bind("<<TreeviewOpen>>", self.on_open)
+
+        self.extensions_tree = self._make_tree(extensions_frame, "headings", ("extension",))
+        self.extensions_tree.heading("extension", text="Расширение")
+        self.extensions_tree.column("extension", width=100)
+
+    def _make_tree(self, parent, show, columns=()):
+        tree = ttk.Treeview(parent, columns=columns + ("files", "size"), show=show, selectmode=tk.BROWSE)
+        tree.heading("files", text="Файлов")
+        tree.heading("size", text="Размер")
+        tree.column("files", width=60, anchor=tk.E)
+        tree.column("size", width=90, anchor=tk.E)
+        scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        return tree
+
+    def bind(self, sequence, handler):
+        self.dirs_tree.bind(sequence, handler)
+        self.extensions_tree.bind(sequence, handler)
+
+    def set_rollup(self, rollup, root_label=None):
+        """Показать сводку utils.rollups.SizeRollup (None — очистить)"""
+
+        if root_label is not None:
+            self.root_label = root_label
+        tree = self.dirs_tree
+        opened = {iid for iid in self._walk("") if tree.item(iid, "open")}
+        selection = tree.selection()
+        tree.delete(*tree.get_children())
+        self.extensions_tree.delete(*self.extensions_tree.get_children())
+        self.rollup = rollup
+        if rollup is None:
+            return
+
+        files, size = rollup.total()
+        self._insert_dir("", "", self.root_label or "(исходная папка)", files, size)
+        # Раскрыть заново то, что было раскрыто, сверху вниз
+        pending = ["dir:"] if not opened else sorted(opened, key=len)
+        for iid in pending:
+            if tree.exists(iid):
+                self._fill(iid)
+                tree.item(iid, open=True)
+        kept = [iid for iid in selection if tree.exists(iid)]
+        if kept:
+            tree.selection_set(kept)
+        self._fill_extensions()
+
+    def refresh_dirs(self, prefixes):
+        """Обновить узлы папок prefixes (результат SizeRollup.update) без перестройки дерева"""
+
+        if self.rollup is None:
+            return
+        tree = self.dirs_tree
+        # Родители раньше детей: удалённый родитель уносит с собой поддерево
+        for prefix in sorted(prefixes, key=len):
+            iid = "dir:" + prefix
+            if not tree.exists(iid):
+                continue
+            if prefix not in self.rollup.dirs:
+                tree.delete(iid)
+                continue
+            files, size = self.rollup.total(prefix)
+            tree.item(iid, values=(files, format_file_size(size)))
+            placeholder = iid + self.PLACEHOLDER
+            has_subdirs = bool(self.rollup.subdirs.get(prefix))
+            if tree.exists(placeholder):
+                if not has_subdirs:
+                    tree.delete(placeholder)
+            elif tree.get_children(iid):
+                self._sync_children(iid, prefix)
+            elif has_subdirs:
+                tree.insert(iid, tk.END, iid=placeholder)
+                if tree.item(iid, "open"):
+                    self._fill(iid)
+        selection = self.extensions_tree.selection()
+        self.extensions_tree.delete(*self.extensions_tree.get_children())
+        self._fill_extensions()
+        kept = [iid for iid in selection if self.extensions_tree.exists(iid)]
+        if kept:
+            self.extensions_tree.selection_set(kept)
+
+    def _sync_children(self, iid, prefix):
+        """Привести уже показанные подпапки узла к сводке: новые добавить, порядок по размеру"""
+
+        tree = self.dirs_tree
+        wanted = self.rollup.children(prefix)
+        wanted_iids = {"dir:" + child for child, _, _ in wanted}
+        for child_iid in tree.get_children(iid):
+            if child_iid not in wanted_iids:
+                tree.delete(child_iid)
+        for position, (child, files, size) in enumerate(wanted):
+            child_iid = "dir:" + child
+            if not tree.exists(child_iid):
+                self._insert_dir(iid, child, os.path.basename(child.rstrip(os.sep)), files, size)
+            tree.move(child_iid, iid, position)
+
+    def _fill_extensions(self):
+        for extension, files, size in self.rollup.by_extension():
+            self.extensions_tree.insert(
+                "",
+                tk.END,
+                iid="ext:" + extension,
+                values=(extension or "(без расширения)", files, format_file_size(size)),
+            )
+
+    def _walk(self, parent):
+        for iid in self.dirs_tree.get_children(parent):
+            if not iid.endswith(self.PLACEHOLDER):
+                yield iid
+                yield from self._walk(iid)
+
+    def _insert_dir(self, parent, prefix, text, files, size):
+        iid = "dir:" + prefix
+        self.dirs_tree.insert(parent, tk.END, iid=iid, text=text, values=(files, format_file_size(size)))
+        if self.rollup.subdirs.get(prefix):
+            self.dirs_tree.insert(iid, tk.END, iid=iid + self.PLACEHOLDER)
+
+    def _fill(self, iid):
+        placeholder = iid + self.PLACEHOLDER
+        if not self.dirs_tree.exists(placeholder):
+            return
+        self.dirs_tree.delete(placeholder)
+        for child, files, size in self.rollup.children(iid[len("dir:"):]):
+            self._insert_dir(iid, child, os.path.basename(child.rstrip(os.sep)), files, size)
+
+    def on_open(self, event=None):
+        iid = self.dirs_tree.focus()
+        if iid:
+            self._fill(iid)
+
+    def selected(self):
+        """Выбранный узел видимой вкладки: ("dir", префикс), ("ext", расширение) или None"""
+
+        tree = self.dirs_tree if self.frame.index("current") == 0 else self.extensions_tree
+        selection = tree.selection()
+        if not selection:
+            return None
+        kind, _, value = selection[0].partition(":")
+        return kind, value
@@ -0,0 +1,361 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+def _insert_position(order, keys, key, low):
+    """Позиция в order (индексы по возрастанию keys) после всех ключей <= key, начиная с low"""
+
+    high = len(order)
+    while low < high:
+        middle = (low + high) // 2
+        if key < keys[order[middle]]:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+class VirtualTable:
+    """Таблица с виртуальной прокруткой поверх ttk.Treeview
+
+    Данные хранятся в обычном списке записей, а в Treeview существует только пул строк
+    на видимую область (плюс небольшой запас). При прокрутке строки пула не создаются
+    заново, а получают значения других записей. Сортировка и выделение работают
+    с логическими строками: order — порядок отображения (индексы в rows),
+    selected — индексы выделенных записей в rows. Фильтр (set_filter) оставляет
+    в order только часть записей, не меняя rows и сортировку. patch_rows
+    вносит небольшие изменения списка без полной пересортировки.
+    """
+
+    def __init__(self, parent, columns, formatter, margin=5):
+        self.formatter = formatter  # запись -> кортеж значений колонок
+        self.margin = margin
+
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(
+            self.frame, columns=columns, show="headings", selectmode=tk.NONE
+        )
+        self.scrollbar = ttk.Scrollbar(
+            self.frame, orient=tk.VERTICAL, command=self.on_scrollbar
+        )
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.rows = []
+        self.order = []
+        self.base_order = None  # порядок без фильтра; None — естественный порядок rows
+        self.shown = None  # записи, прошедшие фильтр (индексы по возрастанию); None — все
+        self.sort_cache = {}  # колонка -> (порядок по возрастанию, ключи записей, make_keys), до следующего set_rows
+        self.sort_state = None  # (колонка, по убыванию) текущей сортировки
+        self.selected = set()
+        self.anchor = None  # позиция в order, от которой идёт выделение с Shift
+        self.offset = 0  # позиция в order первой видимой строки
+        self.visible = 20
+        self.pool = []
+        self.attached = set()
+        self.row_height = self.lookup_row_height()
+
+        self.tree.bind("<Configure>", self.on_configure)
+        self.tree.bind("<Button-1>", self.on_click)
+        self.tree.bind("<Shift-Button-1>", self.on_shift_click)
+        self.tree.bind("<Control-Button-1>", self.on_control_click)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<Up>", lambda e: self.move_cursor(-1))
+        self.tree.bind("<Down>", lambda e: self.move_cursor(1))
+        self.tree.bind("<Prior>", lambda e: self.scroll_by(-self.visible))
+        self.tree.bind("<Next>", lambda e: self.scroll_by(self.visible))
+        self.tree.bind("<Home>", lambda e: self.scroll_to(0))
+        self.tree.bind("<End>", lambda e: self.scroll_to(len(self.order)))
+        self.tree.bind("<Control-a>", self.select_all)
+
+    def lookup_row_height(self):
+        height = ttk.Style().lookup("Treeview", "rowheight")
+        try:
+            return max(1, int(height))
+        except (TypeError, ValueError):
+            return 20
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def __len__(self):
+        return len(self.order)
+
+    # Данные
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.order = list(range(len(rows)))
+        self.base_order = None
+        self.shown = None
+        self.sort_cache = {}
+        self.sort_state = None
+        self.selected = set()
+        self.anchor = None
+        self.offset = 0
+        self.refresh()
+
+    def replace_rows(self, rows):
+        """Заменить записи, сохранив выделение (по тем же объектам) и прокрутку
+
+        Для живого обновления: неизменившиеся записи остаются теми же объектами.
+        Порядок и фильтр сбрасываются, сортировку и фильтр при необходимости
+        применяет вызывающий код.
+        """
+
+        selected = {id(self.rows[i]) for i in self.selected}
+        self.selected = {i for i, row in enumerate(rows) if id(row) in selected} if selected else set()
+        self.rows = rows
+        self.order = list(range(len(rows)))
+        self.base_order = None
+        self.shown = None
+        self.sort_cache = {}
+        self.sort_state = None
+        self.anchor = None
+        self.refresh()
+
+    def patch_rows(self, added, removed, shown_added=None):
+        """Добавить записи added в конец и убрать записи removed (по объектам)
+
+        Выделение, прокрутка, сортировка и фильтр сохраняются: порядок текущей
+        сортировки не строится заново, а сливается с ключами только новых
+        записей. shown_added — номера в added, прошедшие фильтр (None — все).
+        Возвращает действительно убранные записи.
+        """
+
+        removed_ids = {id(row) for row in removed}
+        old_rows = self.rows
+        positions = []
+        if removed_ids:
+            positions = [i for i, row_id in enumerate(map(id, old_rows)) if row_id in removed_ids]
+        dropped = [old_rows[i] for i in positions]
+        if positions:
+            # Новые индексы сдвигаются отрезками между убранными записями
+            rows, remap = [], list(range(len(old_rows)))
+            previous = 0
+            for shift, position in enumerate(positions):
+                rows.extend(old_rows[previous:position])
+                remap[previous:position] = range(previous - shift, position - shift)
+                remap[position] = -1
+                previous = position + 1
+            rows.extend(old_rows[previous:])
+            remap[previous:] = range(previous - len(positions), len(old_rows) - len(positions))
+        else:
+            rows, remap = list(old_rows), None
+        start = len(rows)
+        rows.extend(added)
+        new_indices = range(start, len(rows))
+
+        def kept(indices):
+            return list(indices) if remap is None else [remap[i] for i in indices if remap[i] >= 0]
+
+        # Сливается только порядок текущей колонки; остальные отсортируются заново при выборе
+        patched = {}
+        for column, (ascending, keys, make_keys) in self.sort_cache.items():
+            if self.sort_state is None or column != self.sort_state[0]:
+                continue
+            if remap is not None:
+                keys = [key for key, i in zip(keys, remap) if i >= 0]
+            keys = keys + make_keys(added)
+            ascending = kept(ascending)
+            if added:
+                # Новые записи встают после равных им, как при устойчивой сортировке
+                merged = []
+                previous = 0
+                for i in sorted(new_indices, key=keys.__getitem__):
+                    position = _insert_position(ascending, keys, keys[i], previous)
+                    merged.extend(ascending[previous:position])
+                    merged.append(i)
+                    previous = position
+                merged.extend(ascending[previous:])
+                ascending = merged
+            patched[column] = (ascending, keys, make_keys)
+        self.sort_cache = patched
+
+        self.rows = rows
+        self.selected = set(kept(self.selected))
+        if self.shown is not None:
+            extra = new_indices if shown_added is None else [start + i for i in shown_added]
+            self.shown = kept(self.shown) + list(extra)
+        if self.sort_state is not None:
+            ascending = self.sort_cache[self.sort_state[0]][0]
+            self.base_order = ascending[::-1] if self.sort_state[1] else ascending
+        elif self.base_order is not None:
+            self.base_order = kept(self.base_order) + list(new_indices)
+        self.order = self.filtered_order()
+        self.anchor = None
+        self.refresh()
+        return dropped
+
+    def clear(self):
+        self.set_rows([])
+
+    def set_order(self, order):
+        """Задать порядок отображения (список индексов в rows); фильтр сохраняется"""
+
+        self.base_order = order
+        self.order = self.filtered_order()
+        self.anchor = None
+        self.refresh()
+
+    def set_filter(self, shown):
+        """Показывать только записи shown (индексы в rows по возрастанию); None — все
+
+        Выделение скрытых записей снимается, прокрутка возвращается к началу.
+        """
+
+        self.shown = shown
+        if shown is not None and self.selected:
+            self.selected &= set(shown)
+        self.order = self.filtered_order()
+        self.offset = 0
+        self.anchor = None
+        self.refresh()
+
+    def filtered_order(self):
+        if self.base_order is None:
+            return list(range(len(self.rows))) if self.shown is None else self.shown
+        if self.shown is None:
+            return self.base_order
+        shown = set(self.shown)
+        return [i for i in self.base_order if i in shown]
+
+    def sort(self, column, make_keys, reverse=False):
+        """Отсортировать по колонке; make_keys(rows) — список ключей для всех записей
+
+        Ключи вычисляются один раз на строку, порядок по возрастанию кэшируется
+        для колонки, а обратное направление — просто перевёрнутый список.
+        """
+
+        cached = self.sort_cache.get(column)
+        if cached is None:
+            keys = make_keys(self.rows)
+            ascending = sorted(range(len(keys)), key=keys.__getitem__)
+            self.sort_cache[column] = (ascending, keys, make_keys)
+        else:
+            ascending = cached[0]
+        self.sort_state = (column, reverse)
+        self.set_order(ascending[::-1] if reverse else ascending)
+
+    def selected_rows(self):
+        return [self.rows[i] for i in sorted(self.selected)]
+
+    # Отрисовка
+
+    def on_configure(self, event):
+        # Первая «строка» занята заголовками колонок
+        self.visible = max(1, event.height // self.row_height - 1)
+        needed = self.visible + self.margin
+        while len(self.pool) < needed:
+            self.pool.append(self.tree.insert("", tk.END))
+            self.attached.add(self.pool[-1])
+        self.refresh()
+
+    def refresh(self):
+        total = len(self.order)
+        self.offset = max(0, min(self.offset, total - self.visible))
+        count = min(len(self.pool), total - self.offset)
+
+        shown = []
+        for p, iid in enumerate(self.pool):
+            if p < count:
+                row_index = self.order[self.offset + p]
+                self.tree.item(iid, values=self.formatter(self.rows[row_index]))
+                if iid not in self.attached:
+                    self.tree.move(iid, "", p)
+                    self.attached.add(iid)
+                if row_index in self.selected:
+                    shown.append(iid)
+            elif iid in self.attached:
+                self.tree.detach(iid)
+                self.attached.discard(iid)
+        self.tree.selection_set(shown)
+        self.tree.yview_moveto(0)
+
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    # Прокрутка
+
+    def scroll_to(self, offset):
+        self.offset = offset
+        self.refresh()
+        return "break"
+
+    def scroll_by(self, delta):
+        return self.scroll_to(self.offset + delta)
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.order)))
+        elif unit == "pages":
+            self.scroll_by(int(value) * self.visible)
+        else:
+            self.scroll_by(int(value))
+
+    def on_mousewheel(self, event):
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    # Выделение
+
+    def position_at(self, y):
+        """Позиция в order для строки под курсором или None"""
+
+        iid = self.tree.identify_row(y)
+        if not iid:
+            return None
+        position = self.offset + self.pool.index(iid)
+        return position if position < len(self.order) else None
+
+    def on_click(self, event):
+        if self.tree.identify_region(event.x, event.y) in ("heading", "separator"):
+            return None  # клики по заголовкам и границам колонок обрабатывает Treeview
+        self.tree.focus_set()
+        position = self.position_at(event.y)
+        if position is not None:
+            self.selected = {self.order[position]}
+            self.anchor = position
+            self.refresh()
+        return "break"
+
+    def on_control_click(self, event):
+        position = self.position_at(event.y)
+        if position is not None:
+            self.selected ^= {self.order[position]}
+            self.anchor = position
+            self.refresh()
+        return "break"
+
+    def on_shift_click(self, event):
+        position = self.position_at(event.y)
+        if position is None:
+            return "break"
+        if self.anchor is None:
+            self.anchor = position
+        low, high = sorted((self.anchor, position))
+        self.selected = set(self.order[low : high + 1])
+        self.refresh()
+        return "break"
+
+    def move_cursor(self, delta):
+        if not self.order:
+            return "break"
+        position = self.anchor if self.anchor is not None else self.offset - delta
+        position = max(0, min(len(self.order) - 1, position + delta))
+        self.selected = {self.order[position]}
+        self.anchor = position
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + self.visible:
+            self.offset = position - self.visible + 1
+        self.refresh()
+        return "break"
+
+    def select_all(self, event=None):
+        self.selected = set(self.order)
+        self.refresh()
+        return "break"
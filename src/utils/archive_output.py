@@ -0,0 +1,217 @@
+import os
+import stat
+import time
+import zlib
+import tarfile
+import zipfile
+import tempfile
+import logging
+from pathlib import Path
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from utils.logging_setup import ProgressLog
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Форматы архива: tar без сжатия, tar со сжатием gzip, zip (deflate)
+ARCHIVE_FORMATS = ("tar", "tar.gz", "zip")
+ARCHIVE_CHUNK_SIZE = 1024 * 1024  # кусок потока tar, который сжимается отдельно
+ARCHIVE_PENDING_PER_WORKER = 2  # кусков в очереди на поток сжатия
+ARCHIVE_READ_BUFFER = 1024 * 1024
+GZIP_LEVEL = 6
+
+
+def result_archive_path(base_path, fmt):
+    """Путь нового архива рядом с исходной папкой, как у create_result_folder"""
+
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return str(Path(base_path).parent / f"неотсортированное-{timestamp}.{fmt}")
+
+
+def _gzip_member(data, level):
+    # wbits=31: отдельный поток gzip с заголовком и контрольной суммой
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class _ParallelGzipWriter:
+    """Файловый объект только для записи: сжатие кусками в несколько потоков
+
+    Поток делится на куски по chunk_size, каждый сжимается в отдельный член
+    gzip (zlib отпускает GIL), члены пишутся в исходном порядке. Склеенные
+    члены — корректный gzip, его читают gzip, tar и модуль tarfile. В памяти
+    не больше workers * ARCHIVE_PENDING_PER_WORKER кусков.
+    """
+
+    def __init__(self, raw, workers, level=GZIP_LEVEL, chunk_size=ARCHIVE_CHUNK_SIZE):
+        self.raw = raw
+        self.level = level
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.max_depth = 0
+        self.max_pending = max(1, workers) * ARCHIVE_PENDING_PER_WORKER
+        self.pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            chunk = bytes(self.buffer[: self.chunk_size])
+            del self.buffer[: self.chunk_size]
+            self._submit(chunk)
+        return len(data)
+
+    def _submit(self, chunk):
+        if self.pool is None:
+            self.raw.write(_gzip_member(chunk, self.level))
+            return
+        self.pending.append(self.pool.submit(_gzip_member, chunk, self.level))
+        self.max_depth = max(self.max_depth, len(self.pending))
+        while len(self.pending) > self.max_pending:
+            self.raw.write(self.pending.popleft().result())
+
+    def close(self):
+        try:
+            if self.buffer:
+                self._submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.raw.write(self.pending.popleft().result())
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class _ExactReader:
+    """Чтение ровно size байт: файл, укоротившийся после stat, дополняется нулями
+
+    Иначе tarfile оборвёт весь архив; о таком файле сообщает флаг short.
+    """
+
+    def __init__(self, f, size):
+        self.f = f
+        self.remaining = size
+        self.short = False
+
+    def read(self, n=-1):
+        if n is None or n < 0 or n > self.remaining:
+            n = self.remaining
+        data = b""
+        if not self.short:
+            try:
+                data = self.f.read(n)
+            except OSError as e:
+                logger.debug("Ошибка чтения %s: %s", self.f.name, e)
+        if len(data) < n:
+            self.short = True
+            data += bytes(n - len(data))
+        self.remaining -= n
+        return data
+
+
+def _archive_name(relative_path):
+    return relative_path.replace(os.sep, "/")
+
+
+def _add_tar(archive, f, st, name):
+    info = tarfile.TarInfo(name)
+    info.size = st.st_size
+    info.mtime = st.st_mtime
+    info.mode = stat.S_IMODE(st.st_mode)
+    reader = _ExactReader(f, st.st_size)
+    archive.addfile(info, reader)
+    return reader.short
+
+
+def _add_zip(archive, f, st, name):
+    info = zipfile.ZipInfo(name, time.localtime(max(st.st_mtime, 315532800))[:6])  # zip: не раньше 1980
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = (stat.S_IMODE(st.st_mode) | stat.S_IFREG) << 16
+    reader = _ExactReader(f, st.st_size)
+    with archive.open(info, "w", force_zip64=True) as out:
+        while reader.remaining:
+            out.write(reader.read(ARCHIVE_READ_BUFFER))
+    return reader.short
+
+
+def write_archive(files, source_folder, archive_path, fmt="tar.gz", workers=None, on_progress=None):
+    """Записать файлы в один архив с сохранением relative_path и времени изменения
+
+    files — список или итератор (например, из stream_unsorted_files), читается
+    по одному файлу, поэтому память не зависит от числа файлов. Для "tar.gz"
+    сжатие идёт в workers потоков (_ParallelGzipWriter). on_progress(files, bytes)
+    вызывается после каждого файла. Архив пишется во временный файл и
+    переименовывается в archive_path только в конце, поэтому оборванный архив
+    не остаётся под итоговым именем. Возвращает (добавлено файлов, ошибки).
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"Неизвестный формат архива: {fmt}")
+    logger.info("Начало записи архива，исходная папка：%s，архив：%s，формат：%s", source_folder, archive_path, fmt)
+
+    archive_path = Path(archive_path)
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=archive_path.name + ".", suffix=".tmp", dir=archive_path.parent)
+    progress = ProgressLog(logger, "Архивирование")
+    errors = []
+    run_metrics = metrics.current()
+    started = time.monotonic()
+    with run_metrics.phase("archive"):
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                if fmt == "zip":
+                    archive = zipfile.ZipFile(raw, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+                    add = _add_zip
+                    out = None
+                else:
+                    out = _ParallelGzipWriter(raw, workers or os.cpu_count() or 1) if fmt == "tar.gz" else raw
+                    archive = tarfile.open(fileobj=out, mode="w|", format=tarfile.PAX_FORMAT)
+                    add = _add_tar
+                try:
+                    for file_info in files:
+                        try:
+                            f = open(file_info["path"], "rb")
+                            st = os.fstat(f.fileno())
+                        except OSError as e:
+                            errors.append(f"Ошибка архивирования {file_info['name']}: {e}")
+                            logger.error(errors[-1])
+                            continue
+                        # Ошибки записи в архив не перехватываются: архив тогда уже испорчен
+                        with f:
+                            short = add(archive, f, st, _archive_name(file_info["relative_path"]))
+                        if short:
+                            errors.append(f"Ошибка архивирования {file_info['name']}: файл не дочитан, дополнен нулями")
+                            logger.error(errors[-1])
+                        files_done, bytes_done = progress.add(1, st.st_size)
+                        if on_progress is not None:
+                            on_progress(files_done, bytes_done)
+                finally:
+                    archive.close()
+                    if out is not None and out is not raw:
+                        out.close()
+                        run_metrics.queue_depth("archive.chunks", out.max_depth)
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    run_metrics.add_counts(
+        "archive.",
+        {"files": progress.files, "bytes": progress.bytes, "errors": len(errors),
+         "written_bytes": archive_path.stat().st_size},
+    )
+    logger.info("Запись архива завершена，добавлено файлов：%d，количество ошибок：%d，размер архива：%d байт",
+                progress.files, len(errors), archive_path.stat().st_size)
+    logger.info("Скорость архивирования：%d байт за %.2f с，%.1f МБ/с",
+                progress.bytes, elapsed, progress.bytes / elapsed / (1024 * 1024))
+    if errors:
+        logger.warning("Детали ошибок архивирования：%s", "; ".join(errors[:5]))
+    return progress.files, errors
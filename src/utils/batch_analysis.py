@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.file_analyzer import get_all_files, find_unsorted_files, build_match_index
+from utils.ignore_patterns import compile_ignore_list
+from utils.rollups import SizeRollup
+from utils.scanner import DEFAULT_SCAN_WORKERS
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SOURCES = 4  # исходных папок, анализируемых одновременно
+
+
+def batch_sources(folders, history=()):
+    """Список исходных папок пакета: folders и папки из истории, без повторов и несуществующих"""
+
+    sources = []
+    seen = set()
+    for folder in list(folders) + list(history):
+        if not folder:
+            continue
+        key = os.path.normcase(os.path.abspath(folder))
+        if key in seen:
+            continue
+        if not os.path.isdir(folder):
+            logger.warning("Папка пакета пропущена, её нет：%s", folder)
+            continue
+        seen.add(key)
+        sources.append(folder)
+    return sources
+
+
+def analyze_batch(source_folders, sorted_folder, ignore_lists=None, match_mode="name", match_key="name",
+                  workers=None, index=None, hash_cache=None, source_workers=None, cancel_event=None,
+                  on_progress=None):
+    """Пакетный анализ: много исходных папок против одной отсортированной
+
+    Отсортированная папка обходится один раз: для сравнения по ключу строится
+    общий MatchIndex (build_match_index), по содержимому — общий список записей
+    (хэши из hash_cache тоже общие). Исходные папки анализируются параллельно,
+    по source_workers одновременно, каждая со своим игнор-листом из ignore_lists
+    ({папка: строки}). Генератор отдаёт результат каждой папки, как только она
+    готова: словарь source, files (неотсортированные), rollup
+    (utils.rollups.SizeRollup), seconds и error (текст ошибки или None).
+    Папки, анализ которых застала отмена (cancel_event), не отдаются: их
+    обход прерван, и список находок был бы неполным.
+    """
+
+    ignore_lists = ignore_lists or {}
+    source_workers = max(1, min(int(source_workers or DEFAULT_BATCH_SOURCES), len(source_folders) or 1))
+    total_workers = int(workers or DEFAULT_SCAN_WORKERS)
+    # Потоки обхода делятся между одновременно анализируемыми папками
+    scan_workers = max(2, total_workers // source_workers)
+    started = time.monotonic()
+    logger.info("Начало пакетного анализа：%d исходных папок，отсортированная папка=%s，одновременно %d",
+                len(source_folders), sorted_folder, source_workers)
+
+    if match_mode == "content":
+        shared = get_all_files(sorted_folder, workers=total_workers, index=index, cancel_event=cancel_event,
+                               on_progress=on_progress)
+    else:
+        shared = build_match_index(sorted_folder, (match_key,), workers=total_workers, index=index,
+                                   cancel_event=cancel_event, on_progress=on_progress)
+    if cancel_event is not None and cancel_event.is_set():
+        return
+
+    def analyze(source):
+        result = {"source": source, "files": [], "rollup": SizeRollup(), "seconds": 0.0, "error": None}
+        source_started = time.monotonic()
+        try:
+            if not os.path.isdir(source):
+                raise FileNotFoundError(f"Папка не существует: {source}")
+            ignore = compile_ignore_list(ignore_lists.get(source))
+            source_files = get_all_files(source, workers=scan_workers, index=index, cancel_event=cancel_event,
+                                         on_progress=on_progress, ignore=ignore)
+            result["files"] = find_unsorted_files(
+                source_files,
+                shared,
+                ignore,
+                match_mode=match_mode,
+                hash_cache=hash_cache,
+                cancel_event=cancel_event,
+                match_key=match_key,
+                rollup=result["rollup"],
+            )
+        except Exception as e:
+            logger.error("Ошибка пакетного анализа папки %s: %s", source, e)
+            result["error"] = str(e)
+        if cancel_event is not None and cancel_event.is_set():
+            logger.info("Анализ папки пакета прерван：%s", source)
+            return None
+        result["seconds"] = time.monotonic() - source_started
+        return result
+
+    run_metrics = metrics.current()
+    with ThreadPoolExecutor(max_workers=source_workers) as executor:
+        futures = [executor.submit(analyze, source) for source in source_folders]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                continue
+            run_metrics.add("batch.sources")
+            if result["error"] is not None:
+                run_metrics.add("batch.errors")
+            logger.info("Папка пакета проверена：%s，найдено %d неотсортированных файлов за %.2f с",
+                        result["source"], len(result["files"]), result["seconds"])
+            yield result
+    logger.info("Пакетный анализ завершен：%d папок за %.2f с", len(source_folders), time.monotonic() - started)
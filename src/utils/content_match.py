@@ -0,0 +1,235 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+EDGE_BLOCK_SIZE = 64 * 1024  # размер первого и последнего блока для быстрого хэша
+READ_CHUNK_SIZE = 1024 * 1024
+DEFAULT_HASH_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    edge BLOB,
+    full BLOB
+) WITHOUT ROWID;
+"""
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=20)
+
+
+class HashCache:
+    """Кэш хэшей содержимого на SQLite
+
+    Запись действительна, пока у файла не изменились (path, size, mtime, inode),
+    поэтому повторные запуски не читают данные заново.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+    def get(self, path, stat):
+        """Пара (edge, full) для файла; None на месте неизвестных хэшей"""
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, inode, edge, full FROM hashes WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None or row[:3] != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return None, None
+        return row[3], row[4]
+
+    def put(self, path, stat, edge=None, full=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, inode, edge, full FROM hashes WHERE path = ?", (path,)
+            ).fetchone()
+            if row is not None and row[:3] == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                edge = edge or row[3]
+                full = full or row[4]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, inode, edge, full) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, edge, full),
+            )
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def open_hash_cache(db_path):
+    """Открыть кэш хэшей; при ошибке вернуть None (сравнение пойдёт без кэша)"""
+
+    try:
+        return HashCache(db_path)
+    except sqlite3.Error as e:
+        logger.error("Не удалось открыть кэш хэшей %s: %s", db_path, e)
+        return None
+
+
+class ContentHasher:
+    """Вычисление быстрых (по краям файла) и полных хэшей с учётом кэша"""
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def _count(self, n):
+        with self._lock:
+            self.bytes_read += n
+
+    def edge_hash(self, path):
+        """Хэш первого и последнего блока; для малых файлов совпадает с полным"""
+
+        stat = os.stat(path)
+        if self.cache is not None:
+            edge, _ = self.cache.get(path, stat)
+            if edge is not None:
+                return edge
+
+        h = _new_hash()
+        with open(path, "rb") as f:
+            if stat.st_size <= 2 * EDGE_BLOCK_SIZE:
+                data = f.read()
+                h.update(data)
+                self._count(len(data))
+                digest = h.digest()
+                if self.cache is not None:
+                    self.cache.put(path, stat, edge=digest, full=digest)
+                return digest
+            head = f.read(EDGE_BLOCK_SIZE)
+            f.seek(-EDGE_BLOCK_SIZE, os.SEEK_END)
+            tail = f.read(EDGE_BLOCK_SIZE)
+        h.update(head)
+        h.update(tail)
+        self._count(len(head) + len(tail))
+        digest = h.digest()
+        if self.cache is not None:
+            self.cache.put(path, stat, edge=digest)
+        return digest
+
+    def full_hash(self, path):
+        stat = os.stat(path)
+        if self.cache is not None:
+            _, full = self.cache.get(path, stat)
+            if full is not None:
+                return full
+
+        h = _new_hash()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+                self._count(len(chunk))
+        digest = h.digest()
+        if self.cache is not None:
+            self.cache.put(path, stat, full=digest)
+        return digest
+
+
+def _hash_all(pool, func, paths, cancel_event=None):
+    """Хэшировать пути параллельно; недоступные файлы пропускаются"""
+
+    def safe(path):
+        if cancel_event is not None and cancel_event.is_set():
+            return path, None
+        try:
+            return path, func(path)
+        except OSError as e:
+            logger.error("Ошибка чтения файла %s: %s", path, e)
+            return path, None
+
+    return {path: digest for path, digest in pool.map(safe, paths) if digest is not None}
+
+
+def find_content_matches(source_files, sorted_files, cache=None, workers=None, cancel_event=None):
+    """Пути исходных файлов, содержимое которых есть в отсортированной папке
+
+    Сравнение идёт по уровням, чтобы читать как можно меньше данных:
+    1) размер — файлы уникального размера не читаются вовсе;
+    2) хэш первого и последнего блока — только для совпавших размеров;
+    3) полный хэш — только для оставшихся совпадений больших файлов.
+    После установки cancel_event файлы больше не читаются и считаются несовпавшими.
+    """
+
+    hasher = ContentHasher(cache)
+    sorted_by_size = defaultdict(list)
+    for f in sorted_files:
+        sorted_by_size[f["size"]].append(f["path"])
+
+    candidates = defaultdict(list)
+    for f in source_files:
+        if f["size"] in sorted_by_size:
+            candidates[f["size"]].append(f["path"])
+    logger.info("Сравнение по содержимому：%d из %d исходных файлов совпали по размеру",
+                sum(len(p) for p in candidates.values()), len(source_files))
+
+    matched = set()
+    run_metrics = metrics.current()
+    with run_metrics.phase("hash"), ThreadPoolExecutor(max_workers=workers or DEFAULT_HASH_WORKERS) as pool:
+        # Уровень 2: хэш по краям файла
+        edge_paths = [p for size in candidates for p in candidates[size] + sorted_by_size[size]]
+        edges = _hash_all(pool, hasher.edge_hash, edge_paths, cancel_event)
+
+        full_source, full_sorted = [], set()
+        for size, paths in candidates.items():
+            sorted_edges = defaultdict(list)
+            for p in sorted_by_size[size]:
+                if p in edges:
+                    sorted_edges[edges[p]].append(p)
+            for p in paths:
+                if p not in edges or edges[p] not in sorted_edges:
+                    continue
+                if size <= 2 * EDGE_BLOCK_SIZE:
+                    matched.add(p)  # хэш по краям уже покрывает весь файл
+                else:
+                    full_source.append(p)
+                    full_sorted.update(sorted_edges[edges[p]])
+
+        # Уровень 3: полный хэш только для оставшихся коллизий
+        fulls = _hash_all(
+            pool, hasher.full_hash, full_source + list(full_sorted), cancel_event
+        )
+        sorted_fulls = {fulls[p] for p in full_sorted if p in fulls}
+        for p in full_source:
+            if p in fulls and fulls[p] in sorted_fulls:
+                matched.add(p)
+
+    if cache is not None:
+        cache.commit()
+    run_metrics.add_counts(
+        "hash.",
+        {
+            "bytes": hasher.bytes_read,
+            "edge_files": len(edge_paths),
+            "full_files": len(full_source) + len(full_sorted),
+        },
+    )
+    logger.info("Сравнение по содержимому завершено：совпало %d файлов,прочитано %d байт",
+                len(matched), hasher.bytes_read)
+    return matched
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import threading
+import logging
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = ".copy_journal.jsonl"
+MANIFEST_NAME = ".hash_manifest.jsonl"  # хэши проверенных копий (utils.copy_verify)
+# Служебные файлы в корне папки результата; сканер их не показывает
+SERVICE_FILES = frozenset((JOURNAL_NAME, MANIFEST_NAME))
+FLUSH_INTERVAL = 0.5  # секунды между сбросами буфера журнала на диск
+MTIME_TOLERANCE = 2.0  # FAT/exFAT хранят время изменения с точностью до 2 секунд
+
+
+def journal_path(dest_folder):
+    return Path(dest_folder) / JOURNAL_NAME
+
+
+class CopyJournal:
+    """Журнал задания копирования, только дозапись (JSON Lines)
+
+    Записи: {"op": "job"} — параметры задания, "plan" — файл, который нужно
+    скопировать, "planned" — план записан полностью, "start"/"done" — начало
+    и успешное окончание копирования файла, "resume" — продолжение задания.
+    Буфер журнала сбрасывается на диск раз в FLUSH_INTERVAL: потерянные при
+    сбое записи "done" лишь приведут к повторному копированию этих файлов (при
+    перемещении готовность проверяется по самим файлам, см. is_copy_complete).
+    План же записывается на диск (sync) до начала копирования: журнал с частью
+    плана выдал бы часть задания за всё задание.
+    """
+
+    def __init__(self, dest_folder):
+        self.path = journal_path(dest_folder)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._last_flush = time.monotonic()
+        if self._file.tell() and not _ends_with_newline(self.path):
+            self._file.write("\n")  # не дописывать к строке, оборванной при сбое
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def write_job(self, source_folder, mode="copy", verify=None, stream=False):
+        """Параметры задания; stream — план дописывается по ходу копирования (см. plan_complete)"""
+
+        self.write(
+            {
+                "op": "job",
+                "source_folder": source_folder,
+                "mode": mode,
+                "verify": verify,
+                "stream": stream,
+                "created": time.time(),
+            }
+        )
+
+    def plan(self, file_info):
+        self.write(
+            {
+                "op": "plan",
+                "path": file_info["path"],
+                "name": file_info["name"],
+                "rel": file_info["relative_path"],
+                "size": file_info["size"],
+            }
+        )
+
+    def write_plan(self, source_folder, files, mode="copy", verify=None):
+        self.write_job(source_folder, mode, verify)
+        for file_info in files:
+            self.plan(file_info)
+        self.plan_complete()
+
+    def plan_complete(self):
+        """Отметить, что все файлы задания внесены в план, и записать журнал на диск"""
+
+        self.write({"op": "planned"})
+        self.sync()
+
+    def start(self, relative_path):
+        self.write({"op": "start", "rel": relative_path})
+
+    def done(self, relative_path):
+        self.write({"op": "done", "rel": relative_path})
+
+    def sync(self):
+        """Сбросить буфер и дождаться записи журнала на диск"""
+
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def load_copy_journal(dest_folder):
+    """Прочитать журнал: (source_folder, режим, проверка копий, запланированные файлы,
+    множество завершённых, полон ли план)
+
+    План потокового задания полон, только если в журнале есть запись "planned":
+    иначе сбой случился до конца сканирования и часть файлов в план не попала.
+    Оборванная последняя строка (сбой во время записи) пропускается.
+    """
+
+    source_folder = None
+    mode = "copy"
+    verify = None
+    stream = False
+    plan_complete = False
+    planned = {}
+    done = set()
+    with open(journal_path(dest_folder), "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("Пропущена повреждённая строка журнала копирования：%r", line[:200])
+                continue
+            op = record.get("op")
+            if op == "job":
+                source_folder = source_folder or record.get("source_folder")
+                mode = record.get("mode", mode)
+                verify = record.get("verify", verify)
+                stream = stream or record.get("stream", False)
+            elif op == "planned":
+                plan_complete = True
+            elif op == "plan":
+                planned[record["rel"]] = {
+                    "path": record["path"],
+                    "name": record["name"],
+                    "relative_path": record["rel"],
+                    "size": record["size"],
+                }
+            elif op == "done":
+                done.add(record["rel"])
+    return source_folder, mode, verify, list(planned.values()), done, plan_complete or not stream
+
+
+def is_copy_complete(file_info, dest_folder, mode="copy"):
+    """Совпадают ли у копии размер и время изменения с исходным файлом
+
+    При перемещении исходного файла уже нет: перенос завершён, если файл есть
+    в назначении и его нет в источнике. Размер не сверяется — файл мог вырасти
+    после сканирования, а повторять перенос уже не из чего.
+    """
+
+    if mode == "move":
+        return os.path.lexists(os.path.join(dest_folder, file_info["relative_path"])) and not os.path.lexists(
+            file_info["path"]
+        )
+    try:
+        src = os.stat(file_info["path"])
+        dest = os.stat(os.path.join(dest_folder, file_info["relative_path"]))
+    except OSError:
+        return False
+    return src.st_size == dest.st_size and abs(src.st_mtime - dest.st_mtime) <= MTIME_TOLERANCE
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import shutil
+import threading
+import logging
+from utils.content_match import EDGE_BLOCK_SIZE, READ_CHUNK_SIZE, _new_hash
+from utils.copy_journal import MANIFEST_NAME, _ends_with_newline
+
+
+logger = logging.getLogger(__name__)
+
+# "hash" — копия перечитывается (обычно из страничного кэша) и сверяется по хэшу;
+# "fresh" — перед перечитыванием копия сбрасывается на диск и вытесняется из кэша,
+# поэтому сверяются данные с носителя
+VERIFY_MODES = ("hash", "fresh")
+
+
+class CopyVerifyError(OSError):
+    """Копия не совпала с исходным файлом по размеру или хэшу"""
+
+
+def manifest_path(dest_folder):
+    return os.path.join(dest_folder, MANIFEST_NAME)
+
+
+def _edge_digest(head, tail):
+    h = _new_hash()
+    h.update(head)
+    h.update(tail)
+    return h.digest()
+
+
+def hashing_copy(src, dest):
+    """Скопировать файл, считая хэши того же потока данных, что пишется в копию
+
+    Исходный файл читается один раз. Возвращает (stat исходного до чтения,
+    stat после, скопировано байт, хэш по краям, полный хэш) — хэши в том же
+    виде, что у utils.content_match.ContentHasher, поэтому годятся для HashCache.
+    """
+
+    full = _new_hash()
+    head = b""
+    prev = chunk = b""
+    copied = 0
+    buffer = bytearray(READ_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        before = os.fstat(fsrc.fileno())
+        while True:
+            n = fsrc.readinto(buffer)
+            if not n:
+                break
+            data = view[:n]
+            full.update(data)
+            fdst.write(data)
+            if copied < EDGE_BLOCK_SIZE:
+                head += bytes(data[: EDGE_BLOCK_SIZE - copied])
+            # Хвост собирается из двух последних кусков: последний может быть короче блока
+            prev, chunk = chunk, bytes(data[-EDGE_BLOCK_SIZE:])
+            copied += n
+        after = os.fstat(fsrc.fileno())
+    full_digest = full.digest()
+    if copied <= 2 * EDGE_BLOCK_SIZE:
+        edge_digest = full_digest
+    else:
+        edge_digest = _edge_digest(head, (prev + chunk)[-EDGE_BLOCK_SIZE:])
+    shutil.copystat(src, dest)
+    return before, after, copied, edge_digest, full_digest
+
+
+def file_digest(path, fresh=False):
+    """Полный хэш файла; fresh — сначала сбросить файл на диск и вытеснить из кэша"""
+
+    h = _new_hash()
+    with open(path, "rb") as f:
+        if fresh and hasattr(os, "posix_fadvise"):
+            os.fsync(f.fileno())
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.digest()
+
+
+def verified_copy(src, dest, verify="hash"):
+    """Копирование с проверкой: хэш считается при копировании, копия сверяется с ним
+
+    Возвращает (stat исходного файла или None, если он менялся во время
+    копирования, stat копии, хэш по краям, полный хэш). При несовпадении
+    размера или хэша бросает CopyVerifyError.
+    """
+
+    before, after, copied, edge, full = hashing_copy(src, dest)
+    dest_stat = os.stat(dest)
+    if dest_stat.st_size != copied:
+        raise CopyVerifyError(f"размер копии {dest_stat.st_size} вместо {copied}: {dest}")
+    if file_digest(dest, fresh=verify == "fresh") != full:
+        raise CopyVerifyError(f"хэш копии не совпал с исходным: {dest}")
+    unchanged = before.st_size == after.st_size == copied and before.st_mtime_ns == after.st_mtime_ns
+    return (after if unchanged else None), dest_stat, edge, full
+
+
+class HashManifest:
+    """Манифест хэшей проверенных копий в папке результата (JSON Lines, дозапись)
+
+    Строка на файл: относительный путь, размер, mtime_ns и хэши копии (edge и
+    full в hex). По манифесту кэш хэшей заполняется без чтения данных
+    (import_manifest), в том числе на другой машине или после удаления кэша.
+    """
+
+    def __init__(self, dest_folder):
+        self.path = manifest_path(dest_folder)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() and not _ends_with_newline(self.path):
+            self._file.write("\n")  # не дописывать к строке, оборванной при сбое
+
+    def add(self, relative_path, stat, edge, full):
+        line = json.dumps(
+            {
+                "rel": relative_path,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "edge": edge.hex(),
+                "full": full.hex(),
+                "verified": time.time(),
+            },
+            ensure_ascii=False,
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_manifest(folder):
+    """Записи манифеста папки: {относительный путь: запись}; поздние записи важнее"""
+
+    entries = {}
+    try:
+        f = open(manifest_path(folder), "r", encoding="utf-8")
+    except FileNotFoundError:
+        return entries
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # строка, оборванная при сбое
+            entries[record["rel"]] = record
+    return entries
+
+
+def import_manifest(folder, cache):
+    """Перенести хэши из манифеста папки в кэш хэшей (utils.content_match.HashCache)
+
+    Берутся только записи, у которых файл не изменился (размер и mtime_ns).
+    Возвращает число перенесённых записей.
+    """
+
+    if cache is None:
+        return 0
+    folder = os.path.normpath(os.fspath(folder))
+    imported = 0
+    for relative_path, record in load_manifest(folder).items():
+        path = os.path.join(folder, relative_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if (stat.st_size, stat.st_mtime_ns) != (record["size"], record["mtime_ns"]):
+            continue
+        cache.put(path, stat, edge=bytes.fromhex(record["edge"]), full=bytes.fromhex(record["full"]))
+        imported += 1
+    if imported:
+        cache.commit()
+        logger.info("Хэши из манифеста перенесены в кэш：%s，%d файлов", folder, imported)
+    return imported
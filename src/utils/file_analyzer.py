@@ -1,69 +1,172 @@
 import os
+import time
 from datetime import datetime
 import logging
+from utils.scanner import scan_files, iter_file_batches
+from utils.ignore_patterns import compile_ignore_list
+from utils.match_index import MatchIndex
+from utils import metrics
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - [%(levelname)s] - функция:%(funcName)s - содержание:%(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("analizator_faylov.log", encoding="utf-8")
-    ]
-)
 logger = logging.getLogger(__name__)
 
-def get_all_files(folder_path):
+def get_all_files(folder_path, workers=None, index=None, cancel_event=None, on_progress=None,
+                  ignore=None, skipped=None):
+    """Рекурсивный сбор информации о файлах папки
+
+    Обход каталогов распределяется между workers потоками (см. utils.scanner),
+    неизменившиеся каталоги берутся из index (utils.scan_index), если он передан.
+    Файлы и папки, совпавшие с ignore (игнор-лист), пропускаются при обходе
+    и дописываются в список skipped, если он передан.
+    Возвращает колоночное хранилище (utils.file_records.FileRecordStore), записи
+    которого читаются как словари: file_info["path"], file_info["size"] и т.д.
+    """
 
     files = []
+    started = time.monotonic()
     try:
         # 开始/начало
         logger.info("Начало рекурсивного сканирования папки：%s", folder_path)
-        for root, _, filenames in os.walk(folder_path):
-            # 调试级扫描进度/прогресс сканирования уровня отладки
-            logger.debug("Сканирование подпапки：%s,найдено %d файлов", root, len(filenames))
-            for filename in filenames:
-                file_path = os.path.join(root, filename)
-                try:
-                    stat = os.stat(file_path)
-                    files.append(
-                        {
-                            "path": file_path,
-                            "name": filename,
-                            "relative_path": os.path.relpath(file_path, folder_path),
-                            "size": stat.st_size,
-                            "modified": datetime.fromtimestamp(stat.st_mtime),
-                            "extension": os.path.splitext(filename)[1],
-                        }
-                    )
-                    logger.debug("Файл успешно добавлен：%s（размер：%s）", file_path, format_file_size(stat.st_size))
-                except Exception as e:
-                    logger.error("Ошибка обработки файла %s: %s", file_path, e)
+        files = scan_files(
+            folder_path,
+            workers=workers,
+            index=index,
+            cancel_event=cancel_event,
+            on_progress=on_progress,
+            ignore=compile_ignore_list(ignore) if ignore is not None else None,
+            skipped=skipped,
+        )
     except Exception as e:
         logger.error("Ошибка сканирования папки %s: %s", folder_path, e)
     
-    logger.info("Сканирование папки завершено：%s,собрано %d действительных файлов", folder_path, len(files))
+    logger.info("Сканирование папки завершено：%s,собрано %d действительных файлов за %.2f с",
+                folder_path, len(files), time.monotonic() - started)
     return files
 
 
-def find_unsorted_files(source_files, sorted_files, ignore_list):
-    """Определение неотсортированных файлов"""
-
-    logger.info("Начало фильтрации неотсортированных файлов：общее количество исходных файлов=%d,общее количество отсортированных файлов=%d,список игнорируемых файлов=%s",
-                len(source_files), len(sorted_files), ignore_list)
-    sorted_names = {os.path.basename(f["path"]) for f in sorted_files}
+def find_unsorted_files(source_files, sorted_files, ignore_list, match_mode="name", hash_cache=None,
+                        cancel_event=None, match_key="name", rollup=None):
+    """Определение неотсортированных файлов
+
+    match_mode="name" — файл считается отсортированным, если в отсортированной папке
+    есть файл с тем же ключом match_key (см. utils.match_index.MATCH_KEYS: имя,
+    относительный путь, имя и размер, нормализованное имя, имя и время изменения);
+    sorted_files — записи или готовый MatchIndex. match_mode="content" — если там
+    есть файл с тем же содержимым (см. utils.content_match), независимо от имени.
+    ignore_list — строки игнор-листа или готовый IgnoreMatcher (utils.ignore_patterns).
+    Если передан rollup (utils.rollups.SizeRollup), в него добавляются найденные файлы.
+    """
+
+    with metrics.current().phase("match"):
+        unsorted = _find_unsorted_files(
+            source_files, sorted_files, ignore_list, match_mode, hash_cache, cancel_event, match_key
+        )
+        if rollup is not None:
+            rollup.add(unsorted)
+    metrics.current().add_counts("match.", {"files": len(source_files), "unsorted": len(unsorted)})
+    return unsorted
 
-    unsorted = []
-    for file_info in source_files:
-        filename = file_info["name"]
-        if filename not in ignore_list and filename not in sorted_names:
-            unsorted.append(file_info)
-            logger.debug("Найден неотсортированный файл：%s(путь：%s)", filename, file_info["path"])
 
-    logger.info("Фильтрация неотсортированных файлов завершена,найдено %d неотсортированных файлов", len(unsorted))
+def _find_unsorted_files(source_files, sorted_files, ignore_list, match_mode, hash_cache, cancel_event,
+                         match_key):
+    started = time.monotonic()
+    ignore = compile_ignore_list(ignore_list)
+    logger.info("Начало фильтрации неотсортированных файлов：общее количество исходных файлов=%d,общее количество отсортированных файлов=%d,шаблонов игнор-листа=%d",
+                len(source_files), len(sorted_files), len(ignore.patterns))
+    if match_mode == "content":
+        # sqlite3/hashlib/concurrent.futures нужны только этому режиму
+        from utils.content_match import find_content_matches
+
+        candidates = [f for f in source_files if not _is_ignored(ignore, f)]
+        matched = find_content_matches(
+            candidates, sorted_files, cache=hash_cache, cancel_event=cancel_event
+        )
+        unsorted = [f for f in candidates if f["path"] not in matched]
+        logger.info("Фильтрация неотсортированных файлов завершена,найдено %d неотсортированных файлов за %.2f с",
+                    len(unsorted), time.monotonic() - started)
+        return unsorted
+
+    index = _match_index(sorted_files, match_key)
+    unsorted = [f for f in index.unsorted(source_files, match_key) if not _is_ignored(ignore, f)]
+
+    logger.info("Фильтрация неотсортированных файлов завершена,найдено %d неотсортированных файлов за %.2f с",
+                len(unsorted), time.monotonic() - started)
     return unsorted
 
 
+def build_match_index(folder_path, keys=("name",), workers=None, index=None, cancel_event=None,
+                      on_progress=None):
+    """Индекс отсортированной папки (utils.match_index.MatchIndex) за один обход
+
+    Записи о файлах не накапливаются, память пропорциональна числу разных ключей.
+    on_progress(n) вызывается после каждой пачки из n файлов, как в get_all_files.
+    """
+
+    match_index = MatchIndex(keys)
+    with metrics.current().phase("index"):
+        for batch in iter_file_batches(folder_path, workers=workers, index=index, cancel_event=cancel_event):
+            match_index.add(batch)
+            if on_progress is not None:
+                on_progress(len(batch))
+    metrics.current().add("index.files", len(match_index))
+    logger.info("Индекс отсортированной папки построен：%s,%d файлов,ключи：%s",
+                folder_path, len(match_index), ", ".join(match_index.keys))
+    return match_index
+
+
+def iter_unsorted_files(source_batches, sorted_files, ignore_list, match_key="name", rollup=None):
+    """Потоковый вариант find_unsorted_files для сравнения по ключу
+
+    source_batches — итерируемые пачки записей исходной папки (например,
+    utils.scanner.iter_file_batches); неотсортированные файлы отдаются по пачкам,
+    как только пачка проверена. sorted_files — записи отсортированной папки
+    или готовый MatchIndex (build_match_index). rollup (utils.rollups.SizeRollup)
+    пополняется каждой пачкой до того, как она отдана.
+    """
+
+    match_index = _match_index(sorted_files, match_key)
+    ignore = compile_ignore_list(ignore_list)
+    run_metrics = metrics.current()
+    for batch in source_batches:
+        with run_metrics.phase("match"):
+            unsorted = [f for f in match_index.unsorted(batch, match_key) if not _is_ignored(ignore, f)]
+        run_metrics.add_counts("match.", {"files": len(batch), "unsorted": len(unsorted)})
+        if unsorted:
+            if rollup is not None:
+                rollup.add(unsorted)
+            yield unsorted
+
+
+def stream_unsorted_files(source_folder, sorted_folder, ignore_list, workers=None, index=None,
+                          cancel_event=None, match_key="name", rollup=None):
+    """Конвейер сканирование → сравнение по ключу: генератор пачек неотсортированных файлов
+
+    Сначала строится индекс отсортированной папки, затем исходная папка
+    обходится потоково, и каждая пачка сразу проверяется. Потребитель задаёт темп:
+    пока он занят (например, копированием), обход приостанавливается, поэтому
+    память не зависит от размера исходной папки.
+    """
+
+    ignore = compile_ignore_list(ignore_list)
+    match_index = build_match_index(
+        sorted_folder, (match_key,), workers=workers, index=index, cancel_event=cancel_event
+    )
+    batches = iter_file_batches(
+        source_folder, workers=workers, index=index, cancel_event=cancel_event, ignore=ignore
+    )
+    yield from iter_unsorted_files(batches, match_index, ignore, match_key, rollup)
+
+
+def _match_index(sorted_files, match_key):
+    if isinstance(sorted_files, MatchIndex) and match_key in sorted_files.keys:
+        return sorted_files
+    return MatchIndex((match_key,), sorted_files)
+
+
+def _is_ignored(ignore, file_info):
+    return ignore.match_entry(file_info["name"], file_info.get("relative_path"))
+
+
 def format_file_size(size_bytes):
     """Форматирование размера файла"""
 
@@ -75,43 +178,36 @@ def format_file_size(size_bytes):
     return f"{size_bytes:.2f} ПБ"
 
 
-def analyze_files(source_folder, sorted_folder, ignore_list):
+def analyze_files(source_folder, sorted_folder, ignore_list, match_key="name", rollup=None):
+    """Неотсортированные файлы исходной папки по ключу match_key
+
+    Отсортированная папка индексируется целиком, со всеми подпапками
+    (build_match_index), исходная обходится потоково (stream_unsorted_files).
+    Сводка по папкам и расширениям копится в rollup (utils.rollups.SizeRollup).
+    """
+
     unsorted_files = []
 
-    logger.info("Начало анализа неотсортированных файлов：исходная папка=%s,отсортированная папка=%s,список игнорируемых файлов=%s",
-                source_folder, sorted_folder, ignore_list)
+    ignore = compile_ignore_list(ignore_list)
+    logger.info("Начало анализа неотсортированных файлов：исходная папка=%s,отсортированная папка=%s,шаблонов игнор-листа=%d,ключ сравнения=%s",
+                source_folder, sorted_folder, len(ignore.patterns), match_key)
     if not os.path.exists(source_folder) or not os.path.exists(sorted_folder):
         logger.error("Папка не существует：существует ли исходная папка[%s]?%s；существует ли отсортированная папка[%s]？%s",
                     source_folder, os.path.exists(source_folder),
                     sorted_folder, os.path.exists(sorted_folder))
         raise FileNotFoundError("Одна из указанных папок не существует.")
 
-    sorted_files = set(os.listdir(sorted_folder))
-    logger.debug("Отсортированная папка содержит %d файлов", len(sorted_files))
-
-    file_count = 0  # 统计总扫描文件数/Посчитать общее количество отсканированных файлов
-    for root, _, files in os.walk(source_folder):
-        file_count += len(files)
-        for file in files:
-            if file not in sorted_files and file not in ignore_list:
-                file_path = os.path.join(root, file)
-                try:
-                    file_size = os.path.getsize(file_path)
-                    file_mtime = os.path.getmtime(file_path)
-                    unsorted_files.append(
-                        {
-                            "name": file,
-                            "path": file_path,
-                            "size": file_size,
-                            "mtime": file_mtime,
-                        }
-                    )
-                    logger.debug("Добавлен неотсортированный файл：%s(размер：%s,дата изменения：%s)",
-                                file_path, format_file_size(file_size),
-                                datetime.fromtimestamp(file_mtime).strftime("%Y-%m-%d %H:%M:%S"))
-                except Exception as e:
-                    logger.error("Ошибка чтения информации о файле：%s,причина ошибки：%s", file_path, str(e))
-
-    logger.info("Анализ файлов завершен：всего отсканировано %d файлов в исходной папке,найдено %d неотсортированных файлов",
-                file_count, len(unsorted_files))
-    return unsorted_files
\ No newline at end of file
+    # 只在需要时格式化/Форматировать размер и дату только при включённом DEBUG
+    log_each_file = logger.isEnabledFor(logging.DEBUG)
+    # Ход обхода периодически пишет сам сканер
+    for batch in stream_unsorted_files(source_folder, sorted_folder, ignore, match_key=match_key,
+                                       rollup=rollup):
+        unsorted_files.extend(batch)
+        if log_each_file:
+            for file_info in batch:
+                logger.debug("Добавлен неотсортированный файл：%s(размер：%s,дата изменения：%s)",
+                            file_info["path"], format_file_size(file_info["size"]),
+                            datetime.fromtimestamp(file_info["mtime"]).strftime("%Y-%m-%d %H:%M:%S"))
+
+    logger.info("Анализ файлов завершен：найдено %d неотсортированных файлов", len(unsorted_files))
+    return unsorted_files
@@ -1,20 +1,50 @@
 import os
+import sys
+import time
+import errno
 import shutil
+import threading
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from utils.logging_setup import ProgressLog
+from utils import metrics
+from utils.copy_journal import CopyJournal, journal_path, load_copy_journal, is_copy_complete
+from utils.archive_output import ARCHIVE_FORMATS, write_archive
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - [%(levelname)s] - функция:%(funcName)s - содержание:%(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("operatsii_s_faylami.log", encoding="utf-8")
-    ]
-)
 logger = logging.getLogger(__name__)
 
+DEFAULT_COPY_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+COPY_QUEUE_PER_WORKER = 4  # файлов в очереди на поток при потоковом копировании
+LARGE_FILE_SIZE = 8 * 1024 * 1024
+LARGE_COPY_BUFFER = 4 * 1024 * 1024
+KERNEL_COPY_CHUNK = 1024 * 1024 * 1024
+
+# Копирование в ядре: copy_file_range (Linux 4.5+, Python 3.8+) и sendfile между файлами (Linux)
+_KERNEL_COPY = {
+    "copy_file_range": hasattr(os, "copy_file_range"),
+    "sendfile": hasattr(os, "sendfile") and sys.platform.startswith("linux"),
+}
+# Режимы переноса: полная копия, жёсткая ссылка, reflink (общие блоки в btrfs/XFS), перемещение
+TRANSFER_MODES = ("copy", "hardlink", "reflink", "move")
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) из linux/fs.h
+
+_KERNEL_COPY_FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.EBADF,
+    errno.ETXTBSY,
+}
+
 def create_result_folder(base_path):
     logger.info("Начало создания папки с результатами，базовый путь：%s", base_path)
 
@@ -27,31 +57,336 @@ def create_result_folder(base_path):
     return str(result_path)
 
 
-def copy_unsorted_files(unsorted_files, source_folder, dest_folder):
-    """Копирование неотсортированных файлов с сохранением структуры按结构复制未排序的文件"""
-    logger.info("Начало копирования неотсортированных файлов，количество файлов для копирования：%d，исходная папка：%s，целевая папка：%s",
-                len(unsorted_files), source_folder, dest_folder)
+class _DirCache:
+    """Уже созданные каталоги назначения, чтобы не вызывать mkdir для каждого файла"""
+
+    def __init__(self):
+        self._created = set()
+        self._lock = threading.Lock()
+
+    def ensure(self, path):
+        if path in self._created:
+            return
+        path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._created.add(path)
+
+
+def _kernel_copy(fsrc, fdst):
+    """Копирование средствами ядра (copy_file_range, затем sendfile)
+
+    Копирует до конца файла, даже если он вырос после сканирования. Возвращает False,
+    если ни один способ не поддерживается для этой пары файлов — тогда вызывающий
+    копирует через буфер.
+    """
+
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    for name in ("copy_file_range", "sendfile"):
+        if not _KERNEL_COPY.get(name):
+            continue
+        func = getattr(os, name)
+        offset = 0
+        try:
+            while True:
+                if name == "copy_file_range":
+                    sent = func(in_fd, out_fd, KERNEL_COPY_CHUNK, offset, offset)
+                else:
+                    sent = func(out_fd, in_fd, offset, KERNEL_COPY_CHUNK)
+                if sent == 0:
+                    return True
+                offset += sent
+        except OSError as e:
+            if offset or e.errno not in _KERNEL_COPY_FALLBACK_ERRNOS:
+                raise
+    return False
+
+
+def fast_copy_file(src, dest, size=None):
+    """Копирование содержимого и метаданных файла (аналог shutil.copy2)
+
+    На Linux данные копирует ядро без передачи через Python; на остальных
+    системах используется shutil.copyfile с его собственными быстрыми путями,
+    а для больших файлов — увеличенный буфер.
+    """
+
+    if size is None:
+        size = os.path.getsize(src)
+    if not any(_KERNEL_COPY.values()) and (size < LARGE_FILE_SIZE or sys.platform == "darwin"):
+        # На macOS shutil.copyfile сам использует fcopyfile
+        shutil.copyfile(src, dest)
+    else:
+        with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+            if not _kernel_copy(fsrc, fdst):
+                shutil.copyfileobj(fsrc, fdst, LARGE_COPY_BUFFER)
+    shutil.copystat(src, dest)
+
+
+def _remove_stale(dest):
+    """Убрать оставшийся от прерванного задания файл назначения"""
+
+    try:
+        os.unlink(dest)
+    except FileNotFoundError:
+        pass
+
+
+def _reflink(src, dest):
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dest)
+
+
+def transfer_file(src, dest, mode="copy", size=None):
+    """Перенести файл выбранным способом
+
+    Если быстрый путь невозможен (другая файловая система, нет поддержки reflink,
+    нет прав на ссылку), именно этот файл копируется побайтно. Возвращает True,
+    если понадобился такой откат.
+    """
+
+    if mode == "copy":
+        fast_copy_file(src, dest, size)
+        return False
+    if mode in ("hardlink", "move") and not os.path.lexists(src):
+        # Файл назначения может быть единственной копией (перемещение прошло,
+        # а запись "done" не дошла до журнала) — его нельзя удалять
+        raise FileNotFoundError(errno.ENOENT, "Исходный файл не найден", src)
+    try:
+        if mode == "hardlink":
+            _remove_stale(dest)
+            os.link(src, dest)
+            return False
+        if mode == "reflink":
+            if fcntl is None:
+                raise OSError(errno.EOPNOTSUPP, "reflink не поддерживается")
+            _reflink(src, dest)
+            return False
+        if mode == "move":
+            _remove_stale(dest)
+            os.rename(src, dest)  # в пределах одного устройства — только запись в каталоге
+            return False
+        raise ValueError(f"Неизвестный режим переноса: {mode}")
+    except OSError as e:
+        logger.debug("Быстрый перенос (%s) невозможен для %s: %s", mode, src, e)
+    if mode == "move":
+        move_file(src, dest)  # shutil.move: копирование и удаление источника
+    else:
+        fast_copy_file(src, dest, size)
+    return True
+
 
-    copied = 0
+def copy_unsorted_files(unsorted_files, source_folder, dest_folder, workers=None, on_progress=None,
+                        mode="copy", verify=None, hash_cache=None):
+    """Копирование неотсортированных файлов с сохранением структуры按结构复制未排序的文件
+
+    Файлы копируются параллельно в workers потоков. on_progress(files, bytes)
+    вызывается из рабочих потоков после каждого скопированного файла. Ход задания
+    пишется в журнал в папке назначения (utils.copy_journal), поэтому прерванное
+    копирование можно продолжить через resume_copy_job. mode — один из
+    TRANSFER_MODES (см. transfer_file) или ARCHIVE_FORMATS — тогда dest_folder
+    это путь архива, а файлы пишутся в него одним потоком (utils.archive_output).
+    verify — один из utils.copy_verify.VERIFY_MODES: при копировании считается
+    хэш, копия сверяется с ним, хэши пишутся в манифест папки назначения и в
+    hash_cache (utils.content_match.HashCache), если он передан.
+    """
+    if mode in ARCHIVE_FORMATS:
+        return write_archive(unsorted_files, source_folder, dest_folder, mode, workers, on_progress)
+    logger.info("Начало копирования неотсортированных файлов，количество файлов для копирования：%d，исходная папка：%s，целевая папка：%s，режим：%s",
+                len(unsorted_files), source_folder, dest_folder, mode)
+
+    Path(dest_folder).mkdir(parents=True, exist_ok=True)
+    with CopyJournal(dest_folder) as journal:
+        journal.write_plan(source_folder, unsorted_files, mode, verify)
+        copied, errors = _copy_files(
+            unsorted_files, dest_folder, journal, workers, on_progress, mode, verify, hash_cache
+        )
+    _finish_job(dest_folder, errors)
+    return copied, errors
+
+
+def copy_file_stream(files, source_folder, dest_folder, workers=None, on_progress=None, mode="copy",
+                     verify=None, hash_cache=None):
+    """Потоковое копирование: файлы берутся из итератора по мере поступления
+
+    Подходит для конвейера сканирование → сравнение → копирование: копирование
+    начинается до конца сканирования. Очередь заданий ограничена
+    (COPY_QUEUE_PER_WORKER файлов на поток), поэтому медленное копирование
+    притормаживает источник, и память не растёт с размером дерева. Каждый файл
+    вносится в план журнала перед отправкой на копирование, а когда итератор
+    исчерпан, план отмечается полным. После сбоя до этой отметки
+    resume_copy_job докопирует уже полученные файлы, но сообщит о неполном
+    плане и сохранит журнал.
+    Режимы ARCHIVE_FORMATS и verify — как у copy_unsorted_files.
+    """
+    if mode in ARCHIVE_FORMATS:
+        return write_archive(files, source_folder, dest_folder, mode, workers, on_progress)
+    logger.info("Начало потокового копирования，исходная папка：%s，целевая папка：%s，режим：%s",
+                source_folder, dest_folder, mode)
+
+    Path(dest_folder).mkdir(parents=True, exist_ok=True)
+    with CopyJournal(dest_folder) as journal:
+        journal.write_job(source_folder, mode, verify, stream=True)
+
+        def planned():
+            for file_info in files:
+                journal.plan(file_info)
+                yield file_info
+            journal.plan_complete()
+
+        copied, errors = _copy_files(
+            planned(), dest_folder, journal, workers, on_progress, mode, verify, hash_cache
+        )
+    _finish_job(dest_folder, errors)
+    return copied, errors
+
+
+def resume_copy_job(dest_folder, workers=None, on_progress=None, hash_cache=None):
+    """Продолжить прерванное копирование по журналу в папке назначения
+
+    Файлы, отмеченные в журнале как скопированные и совпадающие с исходными по
+    размеру и времени изменения, пропускаются; недописанные копии перезаписываются
+    с нуля (с проверкой, если она была включена у задания). При перемещении файл,
+    которого уже нет в источнике, но который есть в назначении, считается
+    перенесённым и без записи "done". Если план потокового задания неполон
+    (сбой во время сканирования), копируются известные файлы, а в ошибки
+    добавляется сообщение об этом — журнал остаётся, задание нужно повторить.
+    Возвращает (скопировано в этом запуске, ошибки).
+    """
+    source_folder, mode, verify, planned, done, plan_complete = load_copy_journal(dest_folder)
+    remaining = [
+        f for f in planned
+        if (mode != "move" and f["relative_path"] not in done) or not is_copy_complete(f, dest_folder, mode)
+    ]
+    logger.info("Продолжение копирования：исходная папка：%s，целевая папка：%s，режим：%s，всего в задании：%d，осталось：%d",
+                source_folder, dest_folder, mode, len(planned), len(remaining))
+
+    with CopyJournal(dest_folder) as journal:
+        journal.write({"op": "resume", "created": time.time()})
+        copied, errors = _copy_files(
+            remaining, dest_folder, journal, workers, on_progress, mode, verify, hash_cache
+        )
+    if not plan_complete:
+        # Файлы, до которых сканирование не дошло, в журнале не упомянуты
+        message = (
+            f"План задания записан не полностью (сбой во время сканирования {source_folder}): "
+            "докопированы только запланированные файлы, повторите анализ и копирование"
+        )
+        logger.warning(message)
+        errors.append(message)
+    _finish_job(dest_folder, errors)
+    return copied, errors
+
+
+def _finish_job(dest_folder, errors):
+    """Журнал завершённого без ошибок задания больше не нужен"""
+
+    if not errors:
+        try:
+            journal_path(dest_folder).unlink()
+        except OSError as e:
+            logger.warning("Не удалось удалить журнал копирования %s: %s", dest_folder, e)
+
+
+def _copy_files(files, dest_folder, journal, workers, on_progress, mode, verify=None, hash_cache=None):
+    dest_root = Path(dest_folder)
+    dir_cache = _DirCache()
+    lock = threading.Lock()
+    progress = ProgressLog(logger, "Копирование")
+    totals = {"fallbacks": 0, "verified": 0}
     errors = []
+    manifest = None
+    if verify and mode != "copy":
+        # Ссылки и перемещение не копируют данные — сверять нечего
+        logger.warning("Проверка копий выполняется только в режиме copy，режим：%s", mode)
+        verify = None
+    if verify:
+        # hashlib и манифест нужны только проверке
+        from utils.copy_verify import HashManifest, verified_copy
+
+        manifest = HashManifest(dest_folder)
+
+    def copy_verified(source_path, relative_path, dest_path):
+        source_stat, dest_stat, edge, full = verified_copy(source_path, dest_path, verify)
+        manifest.add(relative_path, dest_stat, edge, full)
+        if hash_cache is not None:
+            hash_cache.put(str(dest_path), dest_stat, edge=edge, full=full)
+            if source_stat is not None:
+                hash_cache.put(source_path, source_stat, edge=edge, full=full)
+        with lock:
+            totals["verified"] += 1
 
-    for file_info in unsorted_files:
+    def copy_one(file_info):
         try:
             source_path = file_info["path"]
             relative_path = file_info["relative_path"]
-            dest_path = Path(dest_folder) / relative_path
+            dest_path = dest_root / relative_path
 
-            dest_path.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(source_path, dest_path)
-            copied += 1
-            logger.debug("Файл успешно скопирован：исходный путь=%s → целевой путь=%s", source_path, str(dest_path))
+            dir_cache.ensure(dest_path.parent)
+            journal.start(relative_path)
+            # Файл назначения открывается с усечением, недописанная копия пишется заново
+            if verify:
+                copy_verified(source_path, relative_path, dest_path)
+                fell_back = False
+            else:
+                fell_back = transfer_file(source_path, dest_path, mode, file_info["size"])
+            journal.done(relative_path)
+            if fell_back:
+                with lock:
+                    totals["fallbacks"] += 1
+            # Вместо сообщения на каждый файл — периодическая сводка
+            files_done, bytes_done = progress.add(1, file_info["size"])
+            if on_progress is not None:
+                on_progress(files_done, bytes_done)
         except Exception as e:
             error_msg = f"Ошибка копирования {file_info['name']}: {e}"
-            errors.append(error_msg)
+            with lock:
+                errors.append(error_msg)
             logger.error(error_msg)
 
+    workers = workers or DEFAULT_COPY_WORKERS
+    # Ограниченная очередь: итератор files не опережает копирование больше чем на slots файлов
+    slots = threading.BoundedSemaphore(workers * COPY_QUEUE_PER_WORKER)
+    run_metrics = metrics.current()
+    in_flight = [0]
+
+    def release(_):
+        with lock:
+            in_flight[0] -= 1
+        slots.release()
+
+    started = time.monotonic()
+    with run_metrics.phase("copy"), ThreadPoolExecutor(max_workers=workers) as pool:
+        for file_info in files:
+            slots.acquire()
+            with lock:
+                in_flight[0] += 1
+                depth = in_flight[0]
+            run_metrics.queue_depth("copy.files", depth)
+            pool.submit(copy_one, file_info).add_done_callback(release)
+    elapsed = max(time.monotonic() - started, 1e-9)
+    if manifest is not None:
+        manifest.close()
+        if hash_cache is not None:
+            hash_cache.commit()
+        logger.info("Проверено копий：%d，хэши записаны в %s", totals["verified"], manifest.path)
+    run_metrics.add_counts(
+        "copy.",
+        {
+            "files": progress.files,
+            "bytes": progress.bytes,
+            "fallbacks": totals["fallbacks"],
+            "verified": totals["verified"],
+            "errors": len(errors),
+        },
+    )
+
     # 记录复制结果/Запись результатов копирования
+    copied = progress.files
     logger.info("Копирование неотсортированных файлов завершено，скопировано файлов：%d，количество ошибок：%d", copied, len(errors))
+    logger.info("Скорость копирования：%d байт за %.2f с，%.1f МБ/с，%.1f файлов/с",
+                progress.bytes, elapsed, progress.bytes / elapsed / (1024 * 1024), copied / elapsed)
+    if totals["fallbacks"]:
+        logger.info("Режим %s недоступен для %d файлов，они скопированы побайтно", mode, totals["fallbacks"])
     if errors:
         logger.warning("Детали ошибок копирования：%s", "; ".join(errors[:5]))  # 以免日志过载/Логируем первые 5 ошибок，чтобы не перегружать лог
     return copied, errors
@@ -105,8 +440,9 @@ def get_file_modification_time(file_path):
     logger.debug("Получение времени последней модификации файла：путь=%s", file_path)
     try:
         mtime = os.path.getmtime(file_path)
-        formatted_mtime = datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
-        logger.debug("Время последней модификации файла %s: %s", file_path, formatted_mtime)
+        if logger.isEnabledFor(logging.DEBUG):
+            formatted_mtime = datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+            logger.debug("Время последней модификации файла %s: %s", file_path, formatted_mtime)
         return mtime
     except Exception as e:
         logger.error("Ошибка получения времени последней модификации файла %s: %s", file_path, str(e))
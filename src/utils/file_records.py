@@ -0,0 +1,139 @@
+import os
+import sys
+import threading
+from array import array
+from datetime import datetime
+
+
+class FileRecord:
+    """Лёгкое представление одной записи хранилища с доступом как к словарю
+
+    Поддерживает ключи прежних записей get_all_files: path, name, relative_path,
+    size, modified (datetime), extension, а также mtime (секунды). Пути, расширение
+    и datetime вычисляются при обращении и нигде не хранятся.
+    """
+
+    __slots__ = ("store", "index")
+
+    KEYS = ("path", "name", "relative_path", "size", "modified", "extension", "mtime")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        store, i = self.store, self.index
+        if key == "name":
+            return store.names[i]
+        if key == "size":
+            return store.sizes[i]
+        if key == "relative_path":
+            return store.dirs[store.dir_ids[i]] + store.names[i]
+        if key == "path":
+            return os.path.join(store.root, store.dirs[store.dir_ids[i]] + store.names[i])
+        if key == "mtime":
+            return store.mtimes[i]
+        if key == "modified":
+            return datetime.fromtimestamp(store.mtimes[i])
+        if key == "extension":
+            return os.path.splitext(store.names[i])[1]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def keys(self):
+        return self.KEYS
+
+    def __repr__(self):
+        return f"FileRecord({self['path']!r}, size={self['size']})"
+
+
+class FileRecordStore:
+    """Колоночное хранилище записей о файлах одной папки
+
+    Вместо словаря на каждый файл хранятся: список имён, номер папки (array) и
+    колонки размера и времени изменения (array). Префиксы относительных путей
+    папок хранятся один раз (интернированы). Индексирование и итерация отдают
+    FileRecord, поэтому анализ, копирование и интерфейс работают с хранилищем
+    так же, как со списком словарей.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.normpath(os.fspath(root))
+        self.dirs = []  # относительные префиксы папок: "" или "a/b/"
+        self._dir_ids = {}
+        self.dir_ids = array("I")
+        self.names = []
+        self.sizes = array("q")
+        self.mtimes = array("d")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [FileRecord(self, i) for i in range(len(self.names))[index]]
+        if index < 0:
+            index += len(self.names)
+        if not 0 <= index < len(self.names):
+            raise IndexError(index)
+        return FileRecord(self, index)
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield FileRecord(self, i)
+
+    def add_dir_entries(self, rel_prefix, entries):
+        """Добавить файлы одной папки: entries — [(имя, размер, mtime), ...]"""
+
+        with self._lock:
+            dir_id = self._dir_ids.get(rel_prefix)
+            if dir_id is None:
+                dir_id = len(self.dirs)
+                self.dirs.append(sys.intern(rel_prefix))
+                self._dir_ids[rel_prefix] = dir_id
+            for name, size, mtime in entries:
+                self.names.append(name)
+                self.dir_ids.append(dir_id)
+                self.sizes.append(size)
+                self.mtimes.append(mtime)
+
+
+def sort_keys(records, field):
+    """Типизированные ключи сортировки для списка записей FileRecord
+
+    field: name, size, mtime, extension или path. Значения берутся прямо из
+    колонок хранилища; строки сравниваются без учёта регистра, пути папок
+    собираются один раз на папку.
+    """
+
+    if field == "size":
+        return [r.store.sizes[r.index] for r in records]
+    if field == "mtime":
+        return [r.store.mtimes[r.index] for r in records]
+    if field == "name":
+        return [r.store.names[r.index].casefold() for r in records]
+    if field == "extension":
+        splitext = os.path.splitext
+        return [splitext(r.store.names[r.index])[1].casefold() for r in records]
+    if field == "path":
+        prefixes = {}
+        keys = []
+        for r in records:
+            store, i = r.store, r.index
+            key = (id(store), store.dir_ids[i])
+            prefix = prefixes.get(key)
+            if prefix is None:
+                prefix = os.path.join(store.root, store.dirs[store.dir_ids[i]]).casefold()
+                prefixes[key] = prefix
+            keys.append(prefix + store.names[i].casefold())
+        return keys
+    raise ValueError(f"Неизвестное поле сортировки: {field}")
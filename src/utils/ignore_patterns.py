@@ -0,0 +1,201 @@
+import os
+import re
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+REGEX_PREFIX = "re:"
+_GLOB_CHARS = set("*?[")
+
+
+def _glob_to_regex(pattern):
+    """Перевод glob в регулярное выражение: * и ? не переходят через «/», ** — переходит"""
+
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 2)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : j]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\").replace("[", "\\[") + "]")
+                i = j + 1
+                continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def _combine(regexes):
+    if not regexes:
+        return None
+    return re.compile("|".join(f"(?:{r})" for r in regexes))
+
+
+def validate_pattern(pattern):
+    """Текст ошибки для некорректного шаблона или None"""
+
+    if pattern.startswith(REGEX_PREFIX):
+        try:
+            re.compile(pattern[len(REGEX_PREFIX):])
+        except re.error as e:
+            return str(e)
+    return None
+
+
+def escape_glob(text):
+    """Экранировать *, ? и [ так, чтобы glob совпадал только с самим текстом"""
+
+    return re.sub(r"([*?\[])", r"[\1]", text)
+
+
+def dir_pattern(relative_dir):
+    """Шаблон для одной папки (путь от корня) вместе с поддеревом: "/a/b/" """
+
+    return "/" + escape_glob(relative_dir.strip(os.sep).replace(os.sep, "/")) + "/"
+
+
+def extension_pattern(extension):
+    """Шаблон для всех файлов с расширением: ".jpg" -> "*.jpg" """
+
+    return "*" + escape_glob(extension)
+
+
+class IgnoreMatcher:
+    """Скомпилированный игнор-лист
+
+    Строки игнор-листа:
+      имя.ext      — точное имя файла (быстрая проверка по множеству); папки
+                     с таким именем не пропускаются — для них нужен «имя/»;
+      *.tmp        — glob по имени; * и ? не переходят через «/», ** — переходит;
+      docs/*.bak   — glob по относительному пути от корня папки (есть «/» внутри);
+      node_modules/ — завершающий «/»: только папки, их поддерево не обходится;
+      re:регвыр    — регулярное выражение, ищется в относительном пути с «/».
+    Любая строка также сравнивается как точное имя, поэтому старые списки
+    с именами файлов вроде «фото[1].jpg» продолжают работать и не скрывают
+    одноимённые папки.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.names = set()  # точные имена только файлов
+        self.dir_names = set()  # точные имена только папок
+        name_globs, dir_name_globs = [], []
+        path_globs, dir_path_globs = [], []
+        regexes = []
+
+        for raw in self.patterns:
+            pattern = raw.strip()
+            if not pattern:
+                continue
+            if pattern.startswith(REGEX_PREFIX):
+                error = validate_pattern(pattern)
+                if error:
+                    logger.error("Некорректный шаблон игнор-листа %s: %s", pattern, error)
+                else:
+                    regexes.append(pattern[len(REGEX_PREFIX):])
+                continue
+
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if not pattern:
+                continue
+            (self.dir_names if dir_only else self.names).add(pattern)
+            if "/" in pattern:
+                target = dir_path_globs if dir_only else path_globs
+                target.append(_glob_to_regex(pattern.lstrip("/")))
+            elif _GLOB_CHARS & set(pattern):
+                target = dir_name_globs if dir_only else name_globs
+                target.append(_glob_to_regex(pattern))
+
+        self.name_re = _combine(name_globs)
+        self.dir_name_re = _combine(dir_name_globs)
+        self.path_re = _combine(path_globs)
+        self.dir_path_re = _combine(dir_path_globs)
+        self.search_re = _combine(regexes)
+        self.uses_paths = bool(path_globs or dir_path_globs or regexes)
+        self._dir_cache = {}  # относительный путь папки -> игнорируется ли она (с предками)
+
+    def __bool__(self):
+        return bool(self.names or self.dir_names or self.name_re or self.dir_name_re or self.uses_paths)
+
+    def _match(self, name, relative_path, name_re, path_re):
+        if name_re is not None and name_re.fullmatch(name):
+            return True
+        if not self.uses_paths or relative_path is None:
+            return False
+        if os.sep != "/":
+            relative_path = relative_path.replace(os.sep, "/")
+        if path_re is not None and path_re.fullmatch(relative_path):
+            return True
+        return self.search_re is not None and self.search_re.search(relative_path) is not None
+
+    def match_file(self, name, relative_path=None):
+        if name in self.names:
+            return True
+        return self._match(name, relative_path, self.name_re, self.path_re)
+
+    def match_dir(self, name, relative_path=None):
+        """Нужно ли пропустить папку вместе со всем поддеревом"""
+
+        if name in self.dir_names:
+            return True
+        if self._match(name, relative_path, self.name_re, self.path_re):
+            return True
+        if self.dir_name_re is not None and self.dir_name_re.fullmatch(name):
+            return True
+        if self.dir_path_re is not None and relative_path is not None:
+            if os.sep != "/":
+                relative_path = relative_path.replace(os.sep, "/")
+            return self.dir_path_re.fullmatch(relative_path) is not None
+        return False
+
+    def match_entry(self, name, relative_path=None):
+        """Файл совпал сам или лежит внутри игнорируемой папки"""
+
+        if not self:
+            return False
+        if self.match_file(name, relative_path):
+            return True
+        if not relative_path:
+            return False
+        parent = os.path.dirname(relative_path)
+        return bool(parent) and self._dir_ignored(parent)
+
+    def match_dir_path(self, relative_dir):
+        """Папка (путь относительно корня) совпала сама или лежит внутри игнорируемой"""
+
+        return bool(self) and self._dir_ignored(relative_dir)
+
+    def _dir_ignored(self, relative_dir):
+        ignored = self._dir_cache.get(relative_dir)
+        if ignored is None:
+            parent, name = os.path.split(relative_dir)
+            ignored = self.match_dir(name, relative_dir) or (
+                bool(parent) and self._dir_ignored(parent)
+            )
+            self._dir_cache[relative_dir] = ignored
+        return ignored
+
+
+def compile_ignore_list(ignore_list):
+    """IgnoreMatcher из списка строк; готовый IgnoreMatcher возвращается как есть"""
+
+    if isinstance(ignore_list, IgnoreMatcher):
+        return ignore_list
+    return IgnoreMatcher(ignore_list or [])
@@ -0,0 +1,419 @@
+import os
+import stat
+import threading
+import logging
+from collections import defaultdict
+from utils.file_records import FileRecordStore
+from utils.ignore_patterns import IgnoreMatcher, compile_ignore_list
+from utils.match_index import MatchIndex, match_key_func
+from utils.copy_journal import SERVICE_FILES
+from utils.scanner import scan_files
+from utils.watcher import ChangeSet, start_watcher
+
+
+logger = logging.getLogger(__name__)
+
+WATCH_FLUSH_INTERVAL = 0.5  # секунды между применениями накопленных изменений
+
+SOURCE = "source"
+SORTED = "sorted"
+
+
+def _split(relative_path):
+    """Относительный путь -> (префикс папки с os.sep на конце или "", имя)"""
+
+    head, name = os.path.split(relative_path)
+    return (head + os.sep if head else ""), name
+
+
+class UnsortedTracker:
+    """Состояние сравнения по имени, которое обновляется по одному файлу
+
+    Хранит файлы исходной папки по папкам и по ключам сравнения
+    (match_key, см. utils.match_index) и MatchIndex отсортированной папки.
+    Изменение применяется через stat
+    пути, поэтому повторные и переставленные события безвредны. Записи
+    новых файлов дописываются в собственное FileRecordStore, неизменившиеся
+    записи остаются теми же объектами.
+
+    Отброшенное игнор-листом (skipped из сканирования) запоминается, поэтому
+    изменения игнор-листа применяются через update_ignore без пересканирования.
+    Каждое изменение состояния увеличивает version: apply возвращает разницу
+    с предыдущей версией (добавленные и убранные записи), snapshot — полный
+    список вместе с его версией. Методы можно вызывать из разных потоков.
+    """
+
+    def __init__(self, source_folder, sorted_folder, source_files, sorted_files, ignore_list=None,
+                 skipped=None, match_key="name"):
+        self.match_key = match_key
+        self._key = match_key_func(match_key)
+        self.roots = {
+            SOURCE: os.path.normpath(os.fspath(source_folder)),
+            SORTED: os.path.normpath(os.fspath(sorted_folder)),
+        }
+        self.ignore = compile_ignore_list(ignore_list)
+        self.store = FileRecordStore(source_folder)  # записи файлов, появившихся при слежении
+        self.version = 0
+        self._lock = threading.RLock()
+        self._before = None  # на время apply: ключ -> показанные до изменения записи {путь: запись}
+        self._load_source(source_files, skipped)
+        self._load_sorted(sorted_files)
+
+    def _load_source(self, source_files, skipped=None):
+        self.source_dirs = defaultdict(dict)  # префикс -> {имя: запись}
+        self.source_keys = defaultdict(dict)  # ключ сравнения -> {относительный путь: запись}
+        self.skipped = dict(skipped or ())  # относительный путь -> папка ли; отброшено игнор-листом
+        for file_info in source_files:
+            name = file_info["name"]
+            relative_path = file_info["relative_path"]
+            prefix = _split(relative_path)[0]
+            if self.ignore.match_entry(name, relative_path):
+                self.skipped[relative_path] = False
+                continue
+            self.source_dirs[prefix][name] = file_info
+            self.source_keys[self._entry_key(name, file_info)][relative_path] = file_info
+
+    def _entry_key(self, name, file_info):
+        # По имени ключ уже известен, запись не читается
+        return name if self.match_key == "name" else self._key(file_info)
+
+    def _is_sorted(self, key):
+        return self.sorted_index.has_key(self.match_key, key)
+
+    def _shown(self, key):
+        """Показываемые записи с ключом key: {относительный путь: запись}"""
+
+        if self._is_sorted(key):
+            return {}
+        return self.source_keys.get(key, {})
+
+    def _touch(self, key):
+        # Запомнить, что показывалось с этим ключом до первого изменения в apply
+        if self._before is not None and key is not None and key not in self._before:
+            self._before[key] = dict(self._shown(key))
+
+    def _add_source(self, prefix, name, file_info):
+        entries = self.source_dirs[prefix]
+        relative_path = prefix + name
+        if name in entries:
+            self._discard_source_key(self._entry_key(name, entries[name]), relative_path)
+        key = self._entry_key(name, file_info)
+        self._touch(key)
+        entries[name] = file_info
+        self.source_keys[key][relative_path] = file_info
+        self.skipped.pop(relative_path, None)
+
+    def _discard_source_key(self, key, relative_path):
+        self._touch(key)
+        records = self.source_keys[key]
+        records.pop(relative_path, None)
+        if not records:
+            del self.source_keys[key]
+
+    def _load_sorted(self, sorted_files):
+        self.sorted_dirs = defaultdict(dict)  # префикс -> {имя: ключ сравнения}
+        self.sorted_index = MatchIndex((self.match_key,))
+        for file_info in sorted_files:
+            name = file_info["name"]
+            key = self._entry_key(name, file_info)
+            self.sorted_dirs[_split(file_info["relative_path"])[0]][name] = key
+            self.sorted_index.add_key(self.match_key, key)
+
+    def unsorted_files(self, rollup=None):
+        """Список неотсортированных файлов; rollup (utils.rollups.SizeRollup) пополняется по папкам"""
+
+        return self.snapshot(rollup)[0]
+
+    def snapshot(self, rollup=None):
+        """(список неотсортированных файлов, версия состояния), как unsorted_files"""
+
+        with self._lock:
+            sorted_keys = self.sorted_index.counts[self.match_key]
+            entry_key = self._entry_key
+            unsorted = []
+            for prefix, entries in self.source_dirs.items():
+                rows = [
+                    file_info
+                    for name, file_info in entries.items()
+                    if entry_key(name, file_info) not in sorted_keys
+                ]
+                if rows:
+                    unsorted.extend(rows)
+                    if rollup is not None:
+                        rollup.add_dir(prefix, rows)
+            return unsorted, self.version
+
+    def update_ignore(self, ignore_list, workers=None, before_scan=None):
+        """Перейти на новый игнор-лист без пересканирования; True, если список изменился
+
+        Новые шаблоны проверяются только по известным файлам, снятые — только по
+        отброшенному ранее. Файлы, которые больше не игнорируются, проверяются
+        через stat; папки, которые раньше не обходились, сканируются (только они),
+        перед этим вызывается before_scan(относительный путь папки).
+        """
+
+        with self._lock:
+            new = compile_ignore_list(ignore_list)
+            added = set(new.patterns) - set(self.ignore.patterns)
+            self.ignore = new
+            changed = False
+
+            if added:
+                delta = IgnoreMatcher(added)
+                for prefix in list(self.source_dirs):
+                    for name in list(self.source_dirs[prefix]):
+                        relative_path = prefix + name
+                        if delta.match_entry(name, relative_path):
+                            changed |= not self._is_sorted(self._drop_source(prefix, name))
+                            self.skipped[relative_path] = False
+
+            for relative_path, is_dir in list(self.skipped.items()):
+                prefix, name = _split(relative_path)
+                if not is_dir:
+                    if not new.match_entry(name, relative_path):
+                        del self.skipped[relative_path]
+                        changed |= self._refresh_source(relative_path)
+                    continue
+                if new.match_dir_path(relative_path):
+                    continue
+                del self.skipped[relative_path]
+                if before_scan is not None:
+                    before_scan(relative_path)
+                changed |= self._scan_subdir(relative_path, workers)
+            # Разница с прежним списком не считается: после смены игнор-листа берётся snapshot
+            self.version += 1
+            return changed
+
+    def _scan_subdir(self, relative_dir, workers=None):
+        skipped = []
+        files = scan_files(
+            self.roots[SOURCE], workers=workers, ignore=self.ignore, skipped=skipped, subdir=relative_dir
+        )
+        changed = False
+        for file_info in files:
+            prefix, name = _split(file_info["relative_path"])
+            self._add_source(prefix, name, file_info)
+            changed |= not self._is_sorted(self._entry_key(name, file_info))
+        self.skipped.update(skipped)
+        return changed
+
+    def apply(self, changes):
+        """Применить изменения из utils.watcher.ChangeSet
+
+        Возвращает (новая версия, добавленные записи, убранные записи) или None,
+        если список неотсортированных не изменился.
+        """
+
+        with self._lock:
+            self._before = {}
+            try:
+                self._apply(changes)
+                delta = self._delta()
+            finally:
+                self._before = None
+            if delta is None:
+                return None
+            self.version += 1
+            return (self.version,) + delta
+
+    def _delta(self):
+        added, removed = [], []
+        for key, old in self._before.items():
+            new = self._shown(key)
+            removed.extend(record for path, record in old.items() if new.get(path) is not record)
+            added.extend(record for path, record in new.items() if old.get(path) is not record)
+        if not added and not removed:
+            return None
+        return added, removed
+
+    def _apply(self, changes):
+        changed = False
+        for tree, kind, relative_path in changes:
+            if kind == "rescan":
+                self._rescan(tree)
+                changed = True
+            elif kind == "dir_removed":
+                changed |= self._remove_dir(tree, relative_path + os.sep)
+            elif tree == SOURCE:
+                changed |= self._refresh_source(relative_path)
+            else:
+                changed |= self._refresh_sorted(relative_path)
+        return changed
+
+    def _stat(self, tree, relative_path):
+        try:
+            st = os.stat(os.path.join(self.roots[tree], relative_path))
+        except OSError:
+            return None
+        return st if stat.S_ISREG(st.st_mode) else None
+
+    def _refresh_source(self, relative_path):
+        prefix, name = _split(relative_path)
+        if not prefix and name in SERVICE_FILES:
+            return False
+        st = self._stat(SOURCE, relative_path)
+        entries = self.source_dirs.get(prefix)
+        current = entries.get(name) if entries else None
+        ignored = self.ignore.match_entry(name, relative_path)
+        if ignored and st is not None:
+            self.skipped[relative_path] = False
+        if st is None or ignored:
+            if current is None:
+                return False
+            return not self._is_sorted(self._drop_source(prefix, name))
+        if current is not None and current["size"] == st.st_size and current["mtime"] == st.st_mtime:
+            return False
+        was_shown = current is not None and not self._is_sorted(self._entry_key(name, current))
+        self.store.add_dir_entries(prefix, [(name, st.st_size, st.st_mtime)])
+        file_info = self.store[len(self.store) - 1]
+        self._add_source(prefix, name, file_info)
+        # Файл с ключом из отсортированной папки в списке не показывается
+        return was_shown or not self._is_sorted(self._entry_key(name, file_info))
+
+    def _drop_source(self, prefix, name):
+        """Убрать файл исходной папки; возвращает его ключ сравнения"""
+
+        entries = self.source_dirs[prefix]
+        key = self._entry_key(name, entries.pop(name))
+        if not entries:
+            del self.source_dirs[prefix]
+        self._discard_source_key(key, prefix + name)
+        return key
+
+    def _refresh_sorted(self, relative_path):
+        prefix, name = _split(relative_path)
+        present = self.sorted_dirs.get(prefix, {}).get(name)
+        st = self._stat(SORTED, relative_path)
+        key = None
+        if st is not None:
+            key = self._entry_key(
+                name, {"name": name, "relative_path": relative_path, "size": st.st_size, "mtime": st.st_mtime}
+            )
+        if key == present:
+            return False
+        if present is not None:
+            self._drop_sorted(prefix, name)
+        if key is not None:
+            self._touch(key)
+            self.sorted_dirs[prefix][name] = key
+            self.sorted_index.add_key(self.match_key, key)
+        # Список неотсортированных меняется, только если в исходной папке есть такой ключ
+        return present in self.source_keys or key in self.source_keys
+
+    def _drop_sorted(self, prefix, name):
+        names = self.sorted_dirs[prefix]
+        key = names.pop(name)
+        if not names:
+            del self.sorted_dirs[prefix]
+        self._touch(key)
+        self.sorted_index.discard_key(self.match_key, key)
+        return key
+
+    def _remove_dir(self, tree, prefix):
+        dirs = self.source_dirs if tree == SOURCE else self.sorted_dirs
+        if tree == SOURCE:
+            for relative_path in [p for p in self.skipped if p.startswith(prefix)]:
+                del self.skipped[relative_path]
+        changed = False
+        for p in [p for p in dirs if p.startswith(prefix)]:
+            for name in list(dirs[p]):
+                if tree == SOURCE:
+                    changed |= not self._is_sorted(self._drop_source(p, name))
+                else:
+                    changed |= self._drop_sorted(p, name) in self.source_keys
+        return changed
+
+    def _rescan(self, tree):
+        logger.info("Повторное сканирование после потери событий：%s", self.roots[tree])
+        for key in list(self.source_keys):
+            self._touch(key)
+        if tree == SOURCE:
+            skipped = []
+            self._load_source(scan_files(self.roots[SOURCE], ignore=self.ignore, skipped=skipped), skipped)
+            if self._before is not None:
+                # Ключей, которых не было до сканирования, не было и в списке
+                for key in self.source_keys:
+                    self._before.setdefault(key, {})
+        else:
+            self._load_sorted(scan_files(self.roots[SORTED]))
+
+
+class LiveUnsorted:
+    """Слежение за обеими папками с обновлением списка неотсортированных файлов
+
+    watch() запускается до сканирования, чтобы не пропустить изменения, attach()
+    — когда списки файлов готовы. Изменения копятся в ChangeSet и применяются
+    пачкой раз в flush_interval в отдельном потоке; on_update(версия, добавленные,
+    убранные) вызывается из этого потока, только если список действительно
+    изменился. Версии идут подряд от версии списка, который вернул attach.
+    """
+
+    def __init__(self, source_folder, sorted_folder, ignore_list, on_update,
+                 use_inotify=True, flush_interval=WATCH_FLUSH_INTERVAL, match_key="name"):
+        self.source_folder = source_folder
+        self.sorted_folder = sorted_folder
+        self.ignore = compile_ignore_list(ignore_list)
+        self.on_update = on_update
+        self.match_key = match_key
+        self.use_inotify = use_inotify
+        self.flush_interval = flush_interval
+        self.changes = ChangeSet()
+        self.tracker = None
+        self.watchers = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self):
+        self.watchers = [
+            start_watcher(SOURCE, self.source_folder, self.changes.add, self.ignore, self.use_inotify),
+            start_watcher(SORTED, self.sorted_folder, self.changes.add, None, self.use_inotify),
+        ]
+        logger.info("Слежение за изменениями запущено：%s，%s（%s）", self.source_folder, self.sorted_folder,
+                    type(self.watchers[0]).__name__)
+
+    def attach(self, source_files, sorted_files, skipped=None, rollup=None):
+        """Построить состояние по результатам сканирования; возвращает (список неотсортированных, версия)
+
+        rollup (utils.rollups.SizeRollup) пополняется вместе с построением списка.
+        """
+
+        self.tracker = UnsortedTracker(
+            self.source_folder, self.sorted_folder, source_files, sorted_files, self.ignore, skipped,
+            self.match_key,
+        )
+        # Изменения, случившиеся во время сканирования
+        self.tracker.apply(self.changes.drain())
+        snapshot = self.tracker.snapshot(rollup)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return snapshot
+
+    def update_ignore(self, ignore_list, workers=None):
+        """Новый игнор-лист: папки, которые больше не игнорируются, берутся под наблюдение"""
+
+        self.ignore = compile_ignore_list(ignore_list)
+        source_watcher = self.watchers[0]
+        source_watcher.set_ignore(self.ignore)
+        return self.tracker.update_ignore(
+            self.ignore, workers=workers, before_scan=source_watcher.watch_dir
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            changes = self.changes.drain()
+            if not changes:
+                continue
+            try:
+                delta = self.tracker.apply(changes)
+                if delta is not None:
+                    self.on_update(*delta)
+            except Exception:
+                logger.exception("Ошибка применения изменений файлов")
+
+    def stop(self):
+        self._stop.set()
+        for watcher in self.watchers:
+            watcher.stop()
+        if self._thread is not None:
+            self._thread.join()
+        logger.info("Слежение за изменениями остановлено：%s", self.source_folder)
@@ -0,0 +1,92 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+LOG_FORMAT = "%(asctime)s - [%(levelname)s] - функция:%(funcName)s - содержание:%(message)s"
+ANALYZER_LOG_FILE = "analizator_faylov.log"
+OPERATIONS_LOG_FILE = "operatsii_s_faylami.log"
+LOG_MAX_BYTES = 5 * 1024 * 1024  # размер файла журнала до ротации
+LOG_BACKUP_COUNT = 3  # сколько старых файлов журнала хранить
+PROGRESS_LOG_INTERVAL = 5.0  # секунды между сводками о ходе сканирования и копирования
+
+_listener = None
+
+
+def _rotating_handler(filename):
+    return RotatingFileHandler(
+        filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+
+
+def setup_logging(level=logging.INFO, log_files=True):
+    """Настройка логирования; вызывается один раз из точки входа
+
+    Модули utils только получают свои логгеры и не трогают конфигурацию при импорте.
+    Рабочие потоки лишь кладут записи в очередь (QueueHandler), а форматирование
+    и запись в консоль и файлы выполняет отдельный поток QueueListener.
+    Файлы журнала ротируются по размеру; сообщения об операциях с файлами
+    дополнительно пишутся в отдельный файл.
+    """
+
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    handlers = [logging.StreamHandler()]
+    if log_files:
+        handlers.append(_rotating_handler(ANALYZER_LOG_FILE))
+        operations_handler = _rotating_handler(OPERATIONS_LOG_FILE)
+        operations_handler.addFilter(logging.Filter("utils.file_operations"))
+        handlers.append(operations_handler)
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # При выходе дописать всё, что осталось в очереди
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(log_queue))
+    return _listener
+
+
+class ProgressLog:
+    """Периодическая сводка о ходе работы вместо сообщения на каждый файл
+
+    add() можно вызывать из нескольких потоков; сообщение уровня INFO пишется
+    не чаще раза в interval секунд, итог пишет сам вызывающий код.
+    """
+
+    def __init__(self, logger, label, interval=PROGRESS_LOG_INTERVAL):
+        self.logger = logger
+        self.label = label
+        self.interval = interval
+        self.files = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._next_report = time.monotonic() + interval
+
+    def add(self, files=1, size=0):
+        """Учесть обработанные файлы; возвращает (файлов, байт) с начала работы"""
+
+        with self._lock:
+            self.files += files
+            self.bytes += size
+            files, size = self.files, self.bytes
+            now = time.monotonic()
+            if now < self._next_report:
+                return files, size
+            self._next_report = now + self.interval
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                "%s: %d файлов, %.1f МБ", self.label, files, size / (1024 * 1024), stacklevel=2
+            )
+        return files, size
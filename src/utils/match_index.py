@@ -0,0 +1,121 @@
+import unicodedata
+import logging
+from collections import Counter
+from utils.file_records import FileRecord, FileRecordStore
+
+
+logger = logging.getLogger(__name__)
+
+# Ключи сравнения: файл считается отсортированным, если в отсортированной папке
+# есть файл с тем же ключом
+MATCH_KEYS = ("name", "path", "name_size", "normalized_name", "name_mtime")
+
+
+def normalize_name(name):
+    """Имя без учёта регистра и формы Unicode (NFC и NFD, как на macOS, совпадают)"""
+
+    return unicodedata.normalize("NFC", unicodedata.normalize("NFC", name).casefold())
+
+
+# Ключ по записи файла (словарь или FileRecord); время — с точностью до секунды
+_KEY_FUNCS = {
+    "name": lambda f: f["name"],
+    "path": lambda f: f["relative_path"],
+    "name_size": lambda f: (f["name"], f["size"]),
+    "normalized_name": lambda f: normalize_name(f["name"]),
+    "name_mtime": lambda f: (f["name"], int(f["mtime"])),
+}
+
+
+def match_key_func(key):
+    """Функция file_info -> ключ сравнения"""
+
+    try:
+        return _KEY_FUNCS[key]
+    except KeyError:
+        raise ValueError(f"Неизвестный ключ сравнения: {key}") from None
+
+
+def iter_keys(records, key):
+    """Ключи записей по порядку; для FileRecordStore читаются сразу колонки"""
+
+    if not isinstance(records, FileRecordStore):
+        return map(match_key_func(key), records)
+    names = records.names
+    if key == "name":
+        return iter(names)
+    if key == "path":
+        dirs = records.dirs
+        return (dirs[d] + n for d, n in zip(records.dir_ids, names))
+    if key == "name_size":
+        return zip(names, records.sizes)
+    if key == "normalized_name":
+        return map(normalize_name, names)
+    if key == "name_mtime":
+        return zip(names, map(int, records.mtimes))
+    return map(match_key_func(key), records)
+
+
+class MatchIndex:
+    """Хеш-индексы отсортированной папки по одному или нескольким ключам
+
+    Все индексы заполняются за один проход по записям (add можно вызывать
+    по пачкам во время обхода), проверка файла — одно обращение к словарю.
+    Индекс хранит число файлов на ключ, поэтому поддерживает и удаление (discard)
+    для слежения за папками.
+    """
+
+    def __init__(self, keys=("name",), records=()):
+        if isinstance(keys, str):
+            keys = (keys,)
+        for key in keys:
+            match_key_func(key)
+        self.keys = tuple(keys)
+        self.counts = {key: Counter() for key in self.keys}
+        self.files = 0
+        self.add(records)
+
+    def add(self, records):
+        if isinstance(records, FileRecordStore):
+            for key, counts in self.counts.items():
+                counts.update(iter_keys(records, key))
+            self.files += len(records)
+            return
+        funcs = [(self.counts[key], match_key_func(key)) for key in self.keys]
+        for file_info in records:
+            for counts, func in funcs:
+                counts[func(file_info)] += 1
+            self.files += 1
+
+    def add_key(self, key, value):
+        self.counts[key][value] += 1
+
+    def discard_key(self, key, value):
+        counts = self.counts[key]
+        counts[value] -= 1
+        if counts[value] <= 0:
+            del counts[value]
+
+    def has_key(self, key, value):
+        return value in self.counts[key]
+
+    def contains(self, file_info, key=None):
+        key = key or self.keys[0]
+        return match_key_func(key)(file_info) in self.counts[key]
+
+    def unsorted(self, records, key=None):
+        """Записи, ключа которых нет в индексе"""
+
+        key = key or self.keys[0]
+        counts = self.counts[key]
+        if isinstance(records, FileRecordStore):
+            return [
+                FileRecord(records, i)
+                for i, value in enumerate(iter_keys(records, key))
+                if value not in counts
+            ]
+        func = match_key_func(key)
+        return [f for f in records if func(f) not in counts]
+
+    def __len__(self):
+        return self.files
@@ -0,0 +1,215 @@
+import json
+import time
+import threading
+import logging
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "tracemalloc")
+PROFILE_TOP_LINES = 40  # строк статистики tracemalloc в отчёте
+METRICS_DIR = Path.home() / ".zhao_metrics"
+
+
+class RunMetrics:
+    """Счётчики, время фаз и глубина очередей одного запуска (анализ, копирование)
+
+    Счётчики именуются "фаза.что", например "scan.dirs", "copy.bytes". Время фазы
+    — сумма по всем её вызовам (source и sorted сканируются двумя вызовами "scan");
+    в конвейере фазы идут одновременно, поэтому их сумма может превышать общее
+    время. Все методы можно вызывать из разных потоков.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self._start = time.monotonic()
+        self.finished = None
+        self.counters = {}
+        self.phases = {}  # фаза -> {"seconds", "calls", "running"}
+        self.queues = {}  # очередь -> {"last", "max"}
+        self.extra = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_counts(self, prefix, counts):
+        with self._lock:
+            for name, value in counts.items():
+                key = prefix + name
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def queue_depth(self, name, depth):
+        with self._lock:
+            state = self.queues.setdefault(name, {"last": 0, "max": 0})
+            state["last"] = depth
+            state["max"] = max(state["max"], depth)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        with self._lock:
+            state = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0, "running": 0})
+            state["running"] += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                state["seconds"] += time.monotonic() - start
+                state["calls"] += 1
+                state["running"] -= 1
+
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self._start
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.monotonic()
+
+    def rate(self, counter, phase=None):
+        """Значение счётчика в секунду: за время фазы или с начала запуска"""
+
+        with self._lock:
+            value = self.counters.get(counter, 0)
+            seconds = self.phases[phase]["seconds"] if phase in self.phases else None
+        if seconds is None:
+            seconds = self.elapsed()
+        return value / seconds if seconds > 0 else 0.0
+
+    def report(self):
+        with self._lock:
+            counters = dict(self.counters)
+            phases = {
+                name: {"seconds": round(state["seconds"], 6), "calls": state["calls"]}
+                for name, state in self.phases.items()
+            }
+            queues = {name: dict(state) for name, state in self.queues.items()}
+        rates = {}
+        for name, state in phases.items():
+            for unit in ("files", "bytes", "dirs"):
+                value = counters.get(f"{name}.{unit}")
+                if value is not None and state["seconds"] > 0:
+                    rates[f"{name}.{unit}_per_sec"] = round(value / state["seconds"], 2)
+        return {
+            "run": self.name,
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "wall_seconds": round(self.elapsed(), 6),
+            "phases": phases,
+            "counters": counters,
+            "rates": rates,
+            "queues": queues,
+            **self.extra,
+        }
+
+    def write_json(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        logger.info("Отчёт о метриках записан：%s", str(path))
+        return path
+
+
+class _NullMetrics:
+    """Заглушка, пока запуск не начат: вызовы ничего не стоят"""
+
+    def add(self, name, value=1):
+        pass
+
+    def add_counts(self, prefix, counts):
+        pass
+
+    def queue_depth(self, name, depth):
+        pass
+
+    @contextmanager
+    def phase(self, name):
+        yield self
+
+
+_NULL = _NullMetrics()
+_current = None
+
+
+def current():
+    """Метрики текущего запуска или заглушка, если запуск не начат"""
+
+    return _current if _current is not None else _NULL
+
+
+def start_run(name):
+    global _current
+    _current = RunMetrics(name)
+    return _current
+
+
+def finish_run(metrics):
+    global _current
+    metrics.finish()
+    if _current is metrics:
+        _current = None
+    return metrics
+
+
+def report_path(metrics, folder=METRICS_DIR):
+    """Имя отчёта: <папка>/<время начала>-<запуск>.json"""
+
+    timestamp = datetime.fromtimestamp(metrics.started).strftime("%Y-%m-%d_%H-%M-%S")
+    return Path(folder) / f"{timestamp}-{metrics.name}.json"
+
+
+@contextmanager
+def profile_run(metrics, mode, folder=METRICS_DIR):
+    """Профилирование одного запуска: mode — "cprofile", "tracemalloc" или None
+
+    cProfile видит только поток, в котором выполняется блок (рабочие потоки
+    сканирования и копирования в профиль не попадают); результат — файл .prof
+    для pstats/snakeviz. tracemalloc учитывает все потоки; пик памяти
+    добавляется в отчёт, а крупнейшие места выделения — в файл .txt.
+    """
+
+    if not mode:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Неизвестный режим профилирования: {mode}")
+    base = report_path(metrics, folder).with_suffix("")
+    base.parent.mkdir(parents=True, exist_ok=True)
+    if mode == "cprofile":
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = f"{base}.prof"
+            profiler.dump_stats(path)
+            metrics.extra["profile"] = path
+            logger.info("Профиль cProfile записан：%s", path)
+        return
+
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current_size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        path = f"{base}.tracemalloc.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"peak_bytes={peak} current_bytes={current_size}\n")
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP_LINES]:
+                f.write(f"{stat}\n")
+        metrics.extra["memory_peak_bytes"] = peak
+        metrics.extra["profile"] = path
+        logger.info("Профиль памяти tracemalloc записан：%s，пик %d байт", path, peak)
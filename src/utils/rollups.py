@@ -0,0 +1,188 @@
+import os
+import json
+import logging
+from pathlib import Path
+from collections import defaultdict
+
+
+logger = logging.getLogger(__name__)
+
+
+def parent_prefix(prefix):
+    """Префикс родительской папки: "a/b/" -> "a/", "a/" -> "" """
+
+    head = os.path.dirname(prefix.rstrip(os.sep))
+    return head + os.sep if head else ""
+
+
+def record_prefix(record):
+    store = record.store
+    return store.dirs[store.dir_ids[record.index]]
+
+
+def record_extension(record):
+    return os.path.splitext(record.store.names[record.index])[1].casefold()
+
+
+class SizeRollup:
+    """Число файлов и байт по папкам и по расширениям
+
+    Папки — относительные префиксы ("" — корень, "a/b/"); у каждой папки учтено
+    всё её поддерево, поэтому значение корня — итог по всем файлам. Записи
+    (FileRecord) добавляются пачками по мере нахождения, без отдельного прохода
+    по результатам: пачка одной папки (add_dir) поднимается к корню один раз.
+    update учитывает изменения списка (добавленные и убранные записи), не
+    пересчитывая остальное; опустевшие папки и расширения удаляются.
+    """
+
+    def __init__(self, records=None):
+        self.dirs = {"": [0, 0]}  # префикс -> [файлов, байт] вместе с подпапками
+        self.subdirs = defaultdict(set)  # префикс -> префиксы непосредственных подпапок
+        self.extensions = {}  # расширение без учёта регистра ("" — без расширения) -> [файлов, байт]
+        if records is not None:
+            self.add(records)
+
+    def add(self, records):
+        """Учесть записи из любых папок"""
+
+        by_dir = defaultdict(list)
+        for record in records:
+            by_dir[record_prefix(record)].append(record)
+        for prefix, rows in by_dir.items():
+            self.add_dir(prefix, rows)
+
+    def add_dir(self, prefix, records):
+        """Учесть записи одной папки prefix"""
+
+        size = 0
+        extensions = self.extensions
+        for record in records:
+            file_size = record.store.sizes[record.index]
+            size += file_size
+            extension = record_extension(record)
+            stats = extensions.get(extension)
+            if stats is None:
+                extensions[extension] = [1, file_size]
+            else:
+                stats[0] += 1
+                stats[1] += file_size
+        files = len(records)
+        child = None
+        while True:
+            stats = self.dirs.get(prefix)
+            if stats is None:
+                self.dirs[prefix] = stats = [0, 0]
+            stats[0] += files
+            stats[1] += size
+            if child is not None:
+                self.subdirs[prefix].add(child)
+            if not prefix:
+                break
+            child, prefix = prefix, parent_prefix(prefix)
+
+    def remove_dir(self, prefix, records):
+        """Убрать записи одной папки prefix, учтённые раньше"""
+
+        size = 0
+        extensions = self.extensions
+        for record in records:
+            file_size = record.store.sizes[record.index]
+            size += file_size
+            extension = record_extension(record)
+            stats = extensions[extension]
+            stats[0] -= 1
+            stats[1] -= file_size
+            if stats[0] <= 0:
+                del extensions[extension]
+        files = len(records)
+        emptied = None
+        while True:
+            stats = self.dirs[prefix]
+            stats[0] -= files
+            stats[1] -= size
+            if emptied is not None:
+                children = self.subdirs[prefix]
+                children.discard(emptied)
+                if not children:
+                    del self.subdirs[prefix]
+                emptied = None
+            if not prefix:
+                break
+            if stats[0] <= 0:
+                del self.dirs[prefix]
+                self.subdirs.pop(prefix, None)
+                emptied = prefix
+            prefix = parent_prefix(prefix)
+
+    def update(self, added=(), removed=()):
+        """Учесть добавленные и убранные записи; возвращает затронутые папки вместе с предками"""
+
+        touched = set()
+        for records, apply in ((removed, self.remove_dir), (added, self.add_dir)):
+            by_dir = defaultdict(list)
+            for record in records:
+                by_dir[record_prefix(record)].append(record)
+            for prefix, rows in by_dir.items():
+                apply(prefix, rows)
+                while prefix not in touched:
+                    touched.add(prefix)
+                    if not prefix:
+                        break
+                    prefix = parent_prefix(prefix)
+        return touched
+
+    def total(self, prefix=""):
+        """(файлов, байт) в папке вместе с подпапками"""
+
+        return tuple(self.dirs.get(prefix, (0, 0)))
+
+    def children(self, prefix=""):
+        """Подпапки prefix: [(префикс, файлов, байт)], крупные первыми"""
+
+        rows = [(child, *self.dirs[child]) for child in self.subdirs.get(prefix, ())]
+        rows.sort(key=lambda row: (-row[2], row[0]))
+        return rows
+
+    def by_extension(self):
+        """[(расширение, файлов, байт)], крупные первыми"""
+
+        rows = [(extension, *stats) for extension, stats in self.extensions.items()]
+        rows.sort(key=lambda row: (-row[2], row[0]))
+        return rows
+
+    def report(self):
+        return {
+            "dirs": {
+                prefix.replace(os.sep, "/"): {"files": files, "bytes": size}
+                for prefix, (files, size) in sorted(self.dirs.items())
+            },
+            "extensions": {
+                extension: {"files": files, "bytes": size}
+                for extension, files, size in self.by_extension()
+            },
+        }
+
+    def write_json(self, path):
+        return write_report(path, self.report())
+
+
+def write_report(path, report):
+    """Записать сводку (SizeRollup.report или словарь таких сводок) в JSON"""
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info("Сводка по папкам и расширениям записана：%s", str(path))
+    return path
+
+
+def select_records(records, prefix=None, extension=None):
+    """Записи внутри папки prefix (с подпапками) и/или с расширением extension"""
+
+    rows = records
+    if prefix:
+        rows = [r for r in rows if record_prefix(r).startswith(prefix)]
+    if extension is not None:
+        rows = [r for r in rows if record_extension(r) == extension]
+    return rows if isinstance(rows, list) else list(rows)
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS entries (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (dir, name)
+) WITHOUT ROWID;
+"""
+
+
+def _subtree_bounds(path):
+    """Границы диапазона ключей для всех путей внутри path"""
+
+    prefix = path.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+class ScanIndex:
+    """Постоянный индекс содержимого каталогов на SQLite
+
+    Для каждого каталога хранится его mtime и список записей (подкаталоги и файлы
+    с размером и временем изменения). Если mtime каталога не изменился, сканер берёт
+    его содержимое из индекса, не вызывая scandir/stat для файлов.
+
+    mtime каталога меняется только при создании, удалении и переименовании записей,
+    поэтому изменение файла «на месте» индекс не замечает до перестройки.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, dir_path, mtime_ns):
+        """Список (name, is_dir, size, mtime) каталога или None, если индекс устарел"""
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns FROM dirs WHERE path = ?", (dir_path,)
+            ).fetchone()
+            if row is None or row[0] != mtime_ns:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._conn.execute(
+                "SELECT name, is_dir, size, mtime FROM entries WHERE dir = ?", (dir_path,)
+            ).fetchall()
+
+    def store(self, dir_path, mtime_ns, entries):
+        """Сохранить свежий список каталога, удалив исчезнувшие подкаталоги"""
+
+        new_dirs = {name for name, is_dir, _, _ in entries if is_dir}
+        with self._lock:
+            old_dirs = [
+                name
+                for (name,) in self._conn.execute(
+                    "SELECT name FROM entries WHERE dir = ? AND is_dir = 1", (dir_path,)
+                )
+            ]
+            for name in old_dirs:
+                if name not in new_dirs:
+                    self._delete_subtree(os.path.join(dir_path, name))
+            self._conn.execute("DELETE FROM entries WHERE dir = ?", (dir_path,))
+            self._conn.executemany(
+                "INSERT INTO entries (dir, name, is_dir, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                [(dir_path,) + tuple(entry) for entry in entries],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)",
+                (dir_path, mtime_ns),
+            )
+
+    def _delete_subtree(self, path):
+        low, high = _subtree_bounds(path)
+        for table, column in (("dirs", "path"), ("entries", "dir")):
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (path,))
+            self._conn.execute(
+                f"DELETE FROM {table} WHERE {column} >= ? AND {column} < ?", (low, high)
+            )
+
+    def invalidate(self, folder=None):
+        """Сбросить индекс для папки (со всем поддеревом) или целиком"""
+
+        with self._lock:
+            if folder is None:
+                self._conn.execute("DELETE FROM dirs")
+                self._conn.execute("DELETE FROM entries")
+            else:
+                self._delete_subtree(os.path.normpath(os.fspath(folder)))
+            self._conn.commit()
+        logger.info("Индекс сканирования сброшен：%s", folder or self.db_path)
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def open_scan_index(db_path):
+    """Открыть индекс; при ошибке (повреждённый файл и т.п.) вернуть None"""
+
+    try:
+        return ScanIndex(db_path)
+    except sqlite3.Error as e:
+        logger.error("Не удалось открыть индекс сканирования %s: %s", db_path, e)
+        return None
@@ -0,0 +1,316 @@
+import os
+import queue
+import threading
+import logging
+from collections import deque
+from utils.file_records import FileRecordStore
+from utils.copy_journal import SERVICE_FILES
+from utils.logging_setup import ProgressLog
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Обход упирается в задержку системных вызовов, а не в CPU, поэтому потоков больше, чем ядер
+DEFAULT_SCAN_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+QUEUE_SAMPLE_DIRS = 64  # глубина очереди каталогов пишется в метрики раз в столько каталогов
+
+
+class _DirQueues:
+    """Очереди каталогов с перехватом работы (work stealing)
+
+    У каждого потока своя deque: свои подкаталоги он берёт с конца (LIFO, обход в глубину),
+    а простаивающий поток забирает работу у соседей с начала очереди.
+    """
+
+    def __init__(self, workers, cancel_event=None):
+        self.deques = [deque() for _ in range(workers)]
+        self.cond = threading.Condition()
+        self.pending = 0  # каталоги в очередях и в обработке
+        self.cancel_event = cancel_event
+
+    def push(self, worker_id, item):
+        with self.cond:
+            self.pending += 1
+            self.cond.notify()
+        self.deques[worker_id].append(item)
+
+    def task_done(self):
+        with self.cond:
+            self.pending -= 1
+            if self.pending == 0:
+                self.cond.notify_all()
+
+    def get(self, worker_id):
+        own = self.deques[worker_id]
+        count = len(self.deques)
+        while True:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return None
+            try:
+                return own.pop()
+            except IndexError:
+                pass
+            for offset in range(1, count):
+                try:
+                    return self.deques[(worker_id + offset) % count].popleft()
+                except IndexError:
+                    continue
+            with self.cond:
+                if self.pending == 0:
+                    return None
+                self.cond.wait(0.05)
+
+
+class _Scan:
+    """Общие параметры одного обхода для всех рабочих потоков"""
+
+    def __init__(self, queues, sink, index=None, ignore=None, on_progress=None, skipped=None):
+        self.queues = queues
+        self.sink = sink  # sink(worker_id, rel_prefix, [(имя, размер, mtime), ...]) для каждой папки
+        self.index = index
+        self.ignore = ignore if ignore else None
+        self.on_progress = on_progress
+        self.skipped = skipped  # список (относительный путь, папка ли) отброшенных игнор-листом
+        self.progress = ProgressLog(logger, "Сканирование")
+
+    def skip_dir(self, name, rel_prefix):
+        if self.ignore is None or not self.ignore.match_dir(name, rel_prefix + name):
+            return False
+        if self.skipped is not None:
+            self.skipped.append((rel_prefix + name, True))
+        return True
+
+    def skip_file(self, name, rel_prefix):
+        if self.ignore is None or not self.ignore.match_file(name, rel_prefix + name):
+            return False
+        if self.skipped is not None:
+            self.skipped.append((rel_prefix + name, False))
+        return True
+
+
+def _scan_worker(worker_id, scan):
+    # Счётчики потока сводятся в метрики запуска один раз, в конце
+    stats = {"dirs": 0, "index_hits": 0, "stat_calls": 0, "files": 0, "bytes": 0}
+    run_metrics = metrics.current()
+    try:
+        while True:
+            item = scan.queues.get(worker_id)
+            if item is None:
+                return
+            dir_path, rel_prefix = item
+            batch = []
+            try:
+                _scan_dir(worker_id, scan, dir_path, rel_prefix, batch, stats)
+            finally:
+                scan.queues.task_done()
+            if stats["dirs"] % QUEUE_SAMPLE_DIRS == 0:
+                run_metrics.queue_depth("scan.dirs", scan.queues.pending)
+            if batch:
+                size = sum(entry[1] for entry in batch)
+                stats["files"] += len(batch)
+                stats["bytes"] += size
+                scan.sink(worker_id, rel_prefix, batch)
+                scan.progress.add(len(batch), size)
+            if scan.on_progress is not None:
+                scan.on_progress(len(batch))
+    finally:
+        run_metrics.add_counts("scan.", stats)
+
+
+def _scan_dir(worker_id, scan, dir_path, rel_prefix, files, stats):
+    queues, index = scan.queues, scan.index
+    stats["dirs"] += 1
+    if index is not None:
+        try:
+            dir_mtime = os.stat(dir_path).st_mtime_ns
+        except OSError as e:
+            logger.error("Ошибка сканирования папки %s: %s", dir_path, e)
+            return
+        cached = index.lookup(dir_path, dir_mtime)
+        if cached is not None:
+            stats["index_hits"] += 1
+            for name, is_dir, size, mtime in cached:
+                path = os.path.join(dir_path, name)
+                if is_dir:
+                    if not scan.skip_dir(name, rel_prefix):
+                        queues.push(worker_id, (path, rel_prefix + name + os.sep))
+                elif not scan.skip_file(name, rel_prefix) and not _is_service_file(name, rel_prefix):
+                    files.append((name, size, mtime))
+            logger.debug("Подпапка взята из индекса：%s,%d записей", dir_path, len(cached))
+            return
+
+    # В индекс всегда пишется полный листинг, чтобы смена игнор-листа его не портила
+    listing = []
+    count = 0
+    try:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                name = entry.name
+                try:
+                    if entry.is_dir():
+                        # Как и os.walk, не заходим в символические ссылки на каталоги
+                        if not entry.is_symlink():
+                            listing.append((name, 1, 0, 0.0))
+                            if not scan.skip_dir(name, rel_prefix):
+                                queues.push(worker_id, (entry.path, rel_prefix + name + os.sep))
+                        continue
+                except OSError:
+                    pass
+                skip = scan.skip_file(name, rel_prefix)
+                if skip and index is None:
+                    continue
+                stats["stat_calls"] += 1
+                try:
+                    stat = entry.stat()
+                except OSError as e:
+                    logger.error("Ошибка обработки файла %s: %s", entry.path, e)
+                    continue
+                listing.append((name, 0, stat.st_size, stat.st_mtime))
+                if skip or _is_service_file(name, rel_prefix):
+                    continue
+                files.append((name, stat.st_size, stat.st_mtime))
+                count += 1
+    except OSError as e:
+        logger.error("Ошибка сканирования папки %s: %s", dir_path, e)
+        return
+    if index is not None:
+        index.store(dir_path, dir_mtime, listing)
+    logger.debug("Сканирование подпапки：%s,найдено %d файлов", dir_path, count)
+
+
+def _is_service_file(name, rel_prefix):
+    # Журнал копирования и манифест хэшей в корне папки результата
+    return not rel_prefix and name in SERVICE_FILES
+
+
+def _run_scan(folder_path, workers, cancel_event, scan_args, subdir=None):
+    """Обойти дерево; scan_args — параметры _Scan (sink, index, ignore, on_progress, skipped)
+
+    subdir — обойти только эту подпапку; относительные пути при этом остаются
+    от folder_path.
+    """
+
+    queues = _DirQueues(workers, cancel_event)
+    scan = _Scan(queues, **scan_args)
+    root = os.path.normpath(os.fspath(folder_path))
+    if subdir:
+        queues.push(0, (os.path.join(root, subdir), subdir.rstrip(os.sep) + os.sep))
+    else:
+        queues.push(0, (root, ""))
+    threads = [
+        threading.Thread(target=_scan_worker, args=(i, scan), daemon=True)
+        for i in range(1, workers)
+    ]
+    with metrics.current().phase("scan"):
+        for thread in threads:
+            thread.start()
+        _scan_worker(0, scan)
+        for thread in threads:
+            thread.join()
+
+    if scan.index is not None:
+        scan.index.commit()
+
+
+def scan_files(folder_path, workers=None, index=None, cancel_event=None, on_progress=None, ignore=None,
+               skipped=None, subdir=None):
+    """Параллельное сканирование папки на os.scandir
+
+    Возвращает utils.file_records.FileRecordStore. Порядок записей не гарантируется.
+    Если передан index (utils.scan_index.ScanIndex), каталоги с неизменным mtime
+    берутся из него без повторного листинга. При установке cancel_event обход
+    прекращается и возвращается то, что успели собрать; on_progress(n) вызывается
+    из рабочих потоков после каждого каталога с числом найденных в нём файлов.
+    ignore (utils.ignore_patterns.IgnoreMatcher) отбрасывает файлы, а совпавшие
+    папки не обходятся вовсе; отброшенное дописывается в список skipped, если он
+    передан, как (относительный путь, папка ли). subdir ограничивает обход
+    подпапкой folder_path.
+    """
+
+    workers = max(1, int(workers or DEFAULT_SCAN_WORKERS))
+    store = FileRecordStore(folder_path)
+    _run_scan(
+        folder_path,
+        workers,
+        cancel_event,
+        {
+            "sink": lambda worker_id, rel_prefix, entries: store.add_dir_entries(rel_prefix, entries),
+            "index": index,
+            "ignore": ignore,
+            "on_progress": on_progress,
+            "skipped": skipped,
+        },
+        subdir=subdir,
+    )
+    return store
+
+
+def iter_file_batches(folder_path, workers=None, index=None, cancel_event=None, max_pending=64,
+                      ignore=None):
+    """Потоковый вариант scan_files: генератор записей по каталогам
+
+    Каждая пачка — FileRecordStore с файлами одной папки. Пачки отдаются по мере
+    обхода; не более max_pending необработанных пачек ждут потребителя, после чего
+    рабочие потоки приостанавливаются.
+    """
+
+    workers = max(1, int(workers or DEFAULT_SCAN_WORKERS))
+    batches = queue.Queue(maxsize=max_pending)
+    done = object()
+    stop = _AnyEvent(threading.Event(), cancel_event)
+
+    run_metrics = metrics.current()
+
+    def put_batch(worker_id, rel_prefix, entries):
+        batch = FileRecordStore(folder_path)
+        batch.add_dir_entries(rel_prefix, entries)
+        batches.put(batch)
+        run_metrics.queue_depth("scan.batches", batches.qsize())
+
+    def produce():
+        try:
+            _run_scan(
+                folder_path,
+                workers,
+                stop,
+                {
+                    "sink": put_batch,
+                    "index": index,
+                    "ignore": ignore,
+                },
+            )
+        finally:
+            batches.put(done)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    finished = False
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                finished = True
+                break
+            yield batch
+    finally:
+        if not finished:
+            # Потребитель прекратил чтение: останавливаем обход и освобождаем очередь
+            stop.set()
+            while batches.get() is not done:
+                pass
+        producer.join()
+
+
+class _AnyEvent:
+    """Событие отмены, установленное изнутри или снаружи (cancel_event)"""
+
+    def __init__(self, own, other):
+        self.own = own
+        self.other = other
+
+    def set(self):
+        self.own.set()
+
+    def is_set(self):
+        return self.own.is_set() or (self.other is not None and self.other.is_set())
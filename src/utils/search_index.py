@@ -0,0 +1,258 @@
+import re
+import time
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from utils.file_records import sort_keys
+from utils.match_index import normalize_name
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+SIZE_UNITS = {
+    "": 1,
+    "б": 1,
+    "b": 1,
+    "к": 1024,
+    "кб": 1024,
+    "k": 1024,
+    "kb": 1024,
+    "м": 1024**2,
+    "мб": 1024**2,
+    "m": 1024**2,
+    "mb": 1024**2,
+    "г": 1024**3,
+    "гб": 1024**3,
+    "g": 1024**3,
+    "gb": 1024**3,
+    "т": 1024**4,
+    "тб": 1024**4,
+    "t": 1024**4,
+    "tb": 1024**4,
+}
+# Формат даты и точность: граница «по» включает весь день (минуту)
+DATE_FORMATS = (
+    ("%Y-%m-%d", timedelta(days=1)),
+    ("%d.%m.%Y", timedelta(days=1)),
+    ("%Y-%m-%d %H:%M", timedelta(minutes=1)),
+    ("%d.%m.%Y %H:%M", timedelta(minutes=1)),
+)
+# Если кандидатов по расширению, размеру или дате меньше этой доли записей,
+# подстрока имени проверяется только у них, иначе — поиском по всему тексту имён
+NAME_CHECK_RATIO = 0.1
+
+_SIZE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*([^\d\s.]*)")
+
+
+def parse_size(text):
+    """Размер из строки фильтра: "1500", "10 МБ", "1.5g"; пустая строка — None"""
+
+    text = text.strip().casefold().replace(",", ".")
+    if not text:
+        return None
+    match = _SIZE_RE.fullmatch(text)
+    if match is None or match.group(2) not in SIZE_UNITS:
+        raise ValueError(f"Неверный размер: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_date(text, end=False):
+    """Метка времени из строки фильтра (ГГГГ-ММ-ДД или ДД.ММ.ГГГГ, можно с ЧЧ:ММ)
+
+    end=True — верхняя граница: конец указанного дня или минуты (не включая).
+    Пустая строка — None.
+    """
+
+    text = text.strip()
+    if not text:
+        return None
+    for fmt, precision in DATE_FORMATS:
+        try:
+            moment = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return (moment + precision if end else moment).timestamp()
+    raise ValueError(f"Неверная дата: {text}")
+
+
+def parse_extensions(text):
+    """Расширения через запятую или пробел: "jpg, .PNG" -> (".jpg", ".png")"""
+
+    extensions = []
+    for item in re.split(r"[,;\s]+", text.casefold()):
+        if item:
+            extensions.append(item if item.startswith(".") else "." + item)
+    return tuple(extensions)
+
+
+def parse_query(text="", extensions="", size_from="", size_to="", date_from="", date_to=""):
+    """Запрос SearchIndex.search из строк полей фильтра; ошибки ввода — ValueError
+
+    Размеры включительны, даты — полуинтервал [mtime_from, mtime_to).
+    """
+
+    return {
+        "text": normalize_name(text.strip()),
+        "extensions": parse_extensions(extensions),
+        "min_size": parse_size(size_from),
+        "max_size": parse_size(size_to),
+        "mtime_from": parse_date(date_from),
+        "mtime_to": parse_date(date_to, end=True),
+    }
+
+
+def is_empty_query(query):
+    return not query["text"] and not query["extensions"] and all(
+        query[field] is None for field in ("min_size", "max_size", "mtime_from", "mtime_to")
+    )
+
+
+def _narrows(query, previous):
+    """Все записи, подходящие под query, подходят и под previous (запрос только сузился)"""
+
+    if previous["text"] not in query["text"]:
+        return False
+    if previous["extensions"] and not set(query["extensions"] or ("",)) <= set(previous["extensions"]):
+        return False
+    for low, high in (("min_size", "max_size"), ("mtime_from", "mtime_to")):
+        if previous[low] is not None and (query[low] is None or query[low] < previous[low]):
+            return False
+        if previous[high] is not None and (query[high] is None or query[high] > previous[high]):
+            return False
+    return True
+
+
+class SearchIndex:
+    """Индекс результатов анализа для мгновенной фильтрации таблицы
+
+    Строится один раз на список записей (FileRecord): имена без учёта регистра
+    упакованы в одну строку с номером записи после каждого имени, поэтому поиск
+    подстроки — один проход регулярного выражения на C; по расширению — списки
+    записей; по размеру и времени изменения — отсортированные массивы для
+    бинарного поиска диапазона. search возвращает номера записей (индексы в
+    списке) по возрастанию. Если запрос лишь сузил предыдущий (дописан символ
+    к строке поиска), проверяется только прежний результат.
+    """
+
+    def __init__(self, records):
+        started = time.monotonic()
+        with metrics.current().phase("search_index"):
+            self.count = len(records)
+            self.names = [normalize_name(r.store.names[r.index]) for r in records]
+            self.sizes = sort_keys(records, "size")
+            self.mtimes = sort_keys(records, "mtime")
+            self.extensions = sort_keys(records, "extension")
+            # "имя\0номер\n": совпадение в номере не даёт \0 до конца строки
+            self.name_text = "".join(
+                f"{name.replace(chr(10), ' ')}\0{i}\n" for i, name in enumerate(self.names)
+            )
+            self.by_extension = {}
+            for i, extension in enumerate(self.extensions):
+                self.by_extension.setdefault(extension, []).append(i)
+            self.size_order = sorted(range(self.count), key=self.sizes.__getitem__)
+            self.sorted_sizes = [self.sizes[i] for i in self.size_order]
+            self.mtime_order = sorted(range(self.count), key=self.mtimes.__getitem__)
+            self.sorted_mtimes = [self.mtimes[i] for i in self.mtime_order]
+        self._last = None  # (запрос, результат) для сужения при наборе
+        logger.info(
+            "Индекс поиска построен：%d записей за %.2f с", self.count, time.monotonic() - started
+        )
+
+    def __len__(self):
+        return self.count
+
+    def search(self, query):
+        """Номера записей под запрос parse_query по возрастанию; None — подходят все"""
+
+        if is_empty_query(query):
+            self._last = None
+            return None
+        if self._last is not None and _narrows(query, self._last[0]):
+            result = self._check(self._last[1], query, text=True)
+        else:
+            result = self._search(query)
+        self._last = (query, result)
+        return result
+
+    def _search(self, query):
+        candidates = None
+        best = self.count + 1
+        if query["extensions"]:
+            lists = [self.by_extension.get(extension, ()) for extension in set(query["extensions"])]
+            if sum(map(len, lists)) < best:
+                candidates = sorted(i for rows in lists for i in rows) if len(lists) > 1 else list(lists[0])
+                best = len(candidates)
+        for low, high, order, values in (
+            ("min_size", "max_size", self.size_order, self.sorted_sizes),
+            ("mtime_from", "mtime_to", self.mtime_order, self.sorted_mtimes),
+        ):
+            if query[low] is None and query[high] is None:
+                continue
+            start = 0 if query[low] is None else bisect_left(values, query[low])
+            if query[high] is None:
+                stop = len(values)
+            elif high == "max_size":
+                stop = bisect_right(values, query[high])  # размер «до» включительно
+            else:
+                stop = bisect_left(values, query[high])
+            if stop - start < best:
+                candidates = sorted(order[start:stop])
+                best = len(candidates)
+
+        text = query["text"]
+        # Один символ встречается почти везде: проверка имён по списку дешевле поиска по тексту
+        if len(text) > 1 and (candidates is None or best > self.count * NAME_CHECK_RATIO):
+            found = self.find_text(text)
+            candidates = found if candidates is None else self._intersect(found, candidates)
+            return self._check(candidates, query, text=False)
+        return self._check(candidates if candidates is not None else range(self.count), query, text=True)
+
+    def find_text(self, text):
+        """Номера записей, в имени которых есть подстрока text (уже normalize_name)"""
+
+        pattern = re.escape(text) + r"[^\0\n]*\0(\d+)"
+        return list(map(int, re.findall(pattern, self.name_text)))
+
+    @staticmethod
+    def _intersect(rows, others):
+        others = set(others)
+        return [i for i in rows if i in others]
+
+    def _check(self, rows, query, text):
+        """Оставить записи, подходящие под все условия запроса (text — проверять ли имя)"""
+
+        return _check_rows(rows, query, text, self.names, self.extensions, self.sizes, self.mtimes)
+
+
+def _check_rows(rows, query, text, names, extensions, sizes, mtimes):
+    if text and query["text"]:
+        needle = query["text"]
+        rows = [i for i in rows if needle in names[i]]
+    if query["extensions"]:
+        wanted = set(query["extensions"])
+        rows = [i for i in rows if extensions[i] in wanted]
+    if query["min_size"] is not None:
+        rows = [i for i in rows if sizes[i] >= query["min_size"]]
+    if query["max_size"] is not None:
+        rows = [i for i in rows if sizes[i] <= query["max_size"]]
+    if query["mtime_from"] is not None:
+        rows = [i for i in rows if mtimes[i] >= query["mtime_from"]]
+    if query["mtime_to"] is not None:
+        rows = [i for i in rows if mtimes[i] < query["mtime_to"]]
+    return rows if isinstance(rows, list) else list(rows)
+
+
+def matching_rows(records, query):
+    """Номера записей под запрос без построения SearchIndex — для небольших списков"""
+
+    names = [normalize_name(r.store.names[r.index]) for r in records]
+    return _check_rows(
+        range(len(records)),
+        query,
+        True,
+        names,
+        sort_keys(records, "extension"),
+        sort_keys(records, "size"),
+        sort_keys(records, "mtime"),
+    )
@@ -0,0 +1,366 @@
+import os
+import sys
+import errno
+import select
+import struct
+import threading
+import logging
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:  # pragma: no cover - урезанные сборки Python
+    ctypes = None
+
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 2.0  # секунды между проходами при слежении опросом
+
+# Константы inotify из <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+WATCH_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _load_libc():
+    if ctypes is None or not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not all(hasattr(libc, name) for name in ("inotify_init1", "inotify_add_watch", "inotify_rm_watch")):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+def inotify_available():
+    return _libc is not None
+
+
+class ChangeSet:
+    """Накопитель изменений между сбросами: повторы схлопываются
+
+    Изменение — (дерево, вид, относительный путь); вид "file" — файл нужно
+    перепроверить, "dir_removed" — папка исчезла со всем поддеревом, "rescan" —
+    события потеряны, дерево нужно просканировать заново. Повторное изменение
+    переносится в конец, поэтому порядок последних изменений сохраняется.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changes = {}
+
+    def add(self, tree, kind, relative_path):
+        key = (tree, kind, relative_path)
+        with self._lock:
+            self._changes.pop(key, None)
+            self._changes[key] = None
+
+    def drain(self):
+        with self._lock:
+            changes, self._changes = self._changes, {}
+        return list(changes)
+
+    def __len__(self):
+        return len(self._changes)
+
+
+class _Watcher:
+    """Общая часть наблюдателей: корень, фильтр папок и фоновый поток
+
+    Наследник задаёт _run (цикл потока) и _watch_tree(prefix) — взять поддерево
+    под наблюдение без сообщений о файлах.
+    """
+
+    def __init__(self, tree, root, sink, ignore=None):
+        self.tree = tree  # метка дерева для sink, например "source" или "sorted"
+        self.root = os.path.normpath(os.fspath(root))
+        self.sink = sink  # sink(дерево, вид, относительный путь)
+        self.ignore = ignore if ignore else None
+        self._lock = threading.Lock()  # состояние наблюдателя меняют его поток и set_ignore/watch_dir
+        self._stop = threading.Event()
+        self._thread = None
+
+    def skip_dir(self, name, relative_path):
+        return self.ignore is not None and self.ignore.match_dir(name, relative_path)
+
+    def set_ignore(self, ignore):
+        self.ignore = ignore if ignore else None
+
+    def watch_dir(self, relative_dir):
+        """Взять под наблюдение папку, которая раньше пропускалась (без сообщений о файлах)"""
+
+        with self._lock:
+            self._watch_tree(relative_dir.rstrip(os.sep) + os.sep)
+
+    def _iter_dir(self, prefix):
+        """Файлы и подпапки папки prefix (относительный префикс с os.sep на конце)"""
+
+        files, subdirs = [], []
+        try:
+            with os.scandir(os.path.join(self.root, prefix)) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if not is_dir:
+                        files.append(entry.name)
+                    elif not self.skip_dir(entry.name, prefix + entry.name):
+                        subdirs.append(entry.name)
+        except OSError as e:
+            logger.debug("Папка недоступна для слежения %s: %s", prefix, e)
+            return None
+        return files, subdirs
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class InotifyWatcher(_Watcher):
+    """Слежение за деревом через inotify (Linux)
+
+    На каждую папку ставится отдельный watch; новые папки берутся под наблюдение
+    сразу, а их файлы сообщаются как изменения (они могли появиться раньше watch).
+    При переполнении очереди ядра (IN_Q_OVERFLOW) сообщается "rescan".
+    """
+
+    def __init__(self, tree, root, sink, ignore=None):
+        super().__init__(tree, root, sink, ignore)
+        if _libc is None:
+            raise OSError(errno.ENOSYS, "inotify недоступен")
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.prefixes = {}  # wd -> относительный префикс папки
+        self.wds = {}  # префикс -> wd
+        self.limit_reported = False
+        if not self._add_tree("", emit=False):
+            os.close(self.fd)
+            raise OSError(errno.ENOENT, "Не удалось следить за папкой", self.root)
+
+    def _add_watch(self, prefix):
+        path = os.fsencode(os.path.join(self.root, prefix))
+        wd = _libc.inotify_add_watch(self.fd, path, WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC and not self.limit_reported:
+                self.limit_reported = True
+                logger.warning(
+                    "Достигнут лимит fs.inotify.max_user_watches，часть папок %s не отслеживается", self.root
+                )
+            return False
+        self.prefixes[wd] = prefix
+        self.wds[prefix] = wd
+        return True
+
+    def _add_tree(self, prefix, emit):
+        """Поставить watch на папку и всё поддерево; emit — сообщить о найденных файлах"""
+
+        added_root = False
+        stack = [prefix]
+        while stack:
+            current = stack.pop()
+            # Сначала watch, потом листинг: файл, созданный между ними, попадёт хотя бы в одно
+            if not self._add_watch(current):
+                continue
+            added_root = added_root or current == prefix
+            listing = self._iter_dir(current)
+            if listing is None:
+                continue
+            files, subdirs = listing
+            if emit:
+                for name in files:
+                    self.sink(self.tree, "file", current + name)
+            stack.extend(current + name + os.sep for name in subdirs)
+        return added_root
+
+    def _watch_tree(self, prefix):
+        self._add_tree(prefix, emit=False)
+
+    def _remove_tree(self, prefix):
+        for current in [p for p in self.wds if p.startswith(prefix)]:
+            wd = self.wds.pop(current)
+            self.prefixes.pop(wd, None)
+            _libc.inotify_rm_watch(self.fd, wd)
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self.fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self.fd, 256 * 1024)
+                except BlockingIOError:
+                    continue
+                with self._lock:
+                    self._handle(data)
+        except Exception:
+            logger.exception("Слежение за папкой %s остановлено из-за ошибки", self.root)
+        finally:
+            os.close(self.fd)
+
+    def _handle(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Очередь событий inotify переполнена，папка %s будет просканирована заново", self.root)
+                self._add_tree("", emit=False)
+                self.sink(self.tree, "rescan", "")
+                continue
+            prefix = self.prefixes.get(wd)
+            if prefix is None:
+                continue
+            if mask & IN_IGNORED:
+                self.prefixes.pop(wd, None)
+                if self.wds.get(prefix) == wd:
+                    del self.wds[prefix]
+                continue
+            if not name:
+                # События самой папки приходят и родителю; особый случай — корень
+                if prefix == "" and mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    self.sink(self.tree, "rescan", "")
+                continue
+
+            relative_path = prefix + name
+            if not mask & IN_ISDIR:
+                self.sink(self.tree, "file", relative_path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                if not self.skip_dir(name, relative_path):
+                    self._add_tree(relative_path + os.sep, emit=True)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._remove_tree(relative_path + os.sep)
+                self.sink(self.tree, "dir_removed", relative_path)
+
+
+class PollingWatcher(_Watcher):
+    """Слежение опросом: раз в interval сравниваются mtime папок
+
+    Перечитываются только папки, у которых изменился mtime, поэтому проход
+    стоит одного stat на папку. Изменения содержимого файла без переименования
+    mtime папки не меняют и опросом не замечаются.
+    """
+
+    def __init__(self, tree, root, sink, ignore=None, interval=POLL_INTERVAL):
+        super().__init__(tree, root, sink, ignore)
+        self.interval = interval
+        self.dirs = {}  # префикс -> (mtime_ns, множество файлов, множество подпапок)
+        if not self._snapshot("", emit=False):
+            raise OSError(errno.ENOENT, "Не удалось следить за папкой", self.root)
+
+    def _read(self, prefix):
+        try:
+            mtime = os.stat(os.path.join(self.root, prefix)).st_mtime_ns
+        except OSError:
+            return None
+        listing = self._iter_dir(prefix)
+        if listing is None:
+            return None
+        files, subdirs = listing
+        return mtime, set(files), set(subdirs)
+
+    def _snapshot(self, prefix, emit):
+        found = False
+        stack = [prefix]
+        while stack:
+            current = stack.pop()
+            state = self._read(current)
+            if state is None:
+                continue
+            found = True
+            self.dirs[current] = state
+            if emit:
+                for name in state[1]:
+                    self.sink(self.tree, "file", current + name)
+            stack.extend(current + name + os.sep for name in state[2])
+        return found
+
+    def _watch_tree(self, prefix):
+        self._snapshot(prefix, emit=False)
+
+    def _forget(self, prefix):
+        for current in [p for p in self.dirs if p.startswith(prefix)]:
+            del self.dirs[current]
+
+    def poll(self):
+        for prefix in list(self.dirs):
+            old = self.dirs.get(prefix)
+            if old is None:
+                continue  # удалена вместе с родительской папкой на этом проходе
+            try:
+                mtime = os.stat(os.path.join(self.root, prefix)).st_mtime_ns
+            except OSError:
+                if prefix == "":
+                    self.sink(self.tree, "rescan", "")
+                continue  # об исчезновении сообщит родительская папка
+            if mtime == old[0]:
+                continue
+            new = self._read(prefix)
+            if new is None:
+                continue
+            self.dirs[prefix] = new
+            for name in new[1] ^ old[1]:
+                self.sink(self.tree, "file", prefix + name)
+            for name in old[2] - new[2]:
+                self._forget(prefix + name + os.sep)
+                self.sink(self.tree, "dir_removed", prefix + name)
+            for name in new[2] - old[2]:
+                self._snapshot(prefix + name + os.sep, emit=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self._lock:
+                    self.poll()
+            except Exception:
+                logger.exception("Ошибка опроса папки %s", self.root)
+
+
+def start_watcher(tree, root, sink, ignore=None, use_inotify=True, poll_interval=POLL_INTERVAL):
+    """Запустить слежение за деревом: inotify, если доступен, иначе опрос"""
+
+    if use_inotify and inotify_available():
+        try:
+            watcher = InotifyWatcher(tree, root, sink, ignore)
+        except OSError as e:
+            logger.warning("inotify недоступен для %s (%s)，используется опрос", root, e)
+        else:
+            watcher.start()
+            return watcher
+    watcher = PollingWatcher(tree, root, sink, ignore, interval=poll_interval)
+    watcher.start()
+    return watcher
@@ -0,0 +1,50 @@
+import os
+
+from utils.copy_journal import CopyJournal, journal_path
+from utils.file_operations import resume_copy_job
+
+
+def make_file(path, data=b"data"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return {"path": str(path), "name": path.name, "relative_path": path.name, "size": len(data)}
+
+
+def test_resume_move_keeps_moved_file_without_done_record(tmp_path):
+    source, dest = tmp_path / "source", tmp_path / "dest"
+    moved = make_file(source / "moved.txt", b"moved")
+    pending = make_file(source / "pending.txt", b"pending")
+    dest.mkdir()
+    with CopyJournal(dest) as journal:
+        journal.write_plan(str(source), [moved, pending], mode="move")
+        journal.start(moved["relative_path"])
+    # Сбой после rename, до записи "done"
+    os.rename(moved["path"], dest / "moved.txt")
+
+    copied, errors = resume_copy_job(dest)
+
+    assert errors == []
+    assert copied == 1
+    assert (dest / "moved.txt").read_bytes() == b"moved"
+    assert (dest / "pending.txt").read_bytes() == b"pending"
+    assert not os.path.exists(moved["path"]) and not os.path.exists(pending["path"])
+    assert not journal_path(dest).exists()
+
+
+def test_resume_incomplete_stream_plan_keeps_journal(tmp_path):
+    source, dest = tmp_path / "source", tmp_path / "dest"
+    planned = make_file(source / "planned.txt", b"planned")
+    make_file(source / "unplanned.txt", b"unplanned")
+    dest.mkdir()
+    with CopyJournal(dest) as journal:
+        # Сбой во время сканирования: второй файл в план не попал
+        journal.write_job(str(source), stream=True)
+        journal.plan(planned)
+
+    copied, errors = resume_copy_job(dest)
+
+    assert copied == 1
+    assert len(errors) == 1
+    assert (dest / "planned.txt").read_bytes() == b"planned"
+    assert not (dest / "unplanned.txt").exists()
+    assert journal_path(dest).exists()